@@ -0,0 +1,45 @@
+"""
+大核高斯模糊的耗时与误差：fast_blur.gaussian_blur (auto) 对比 cv2.GaussianBlur
+用法: python -m benchmarks.bench_fast_blur [宽 高]
+"""
+import sys
+import time
+import cv2
+import numpy as np
+from src.utils.fast_blur import gaussian_blur, EXACT_KSIZE_THRESHOLD
+
+KSIZES = (15, 25, 27, 31, 51, 101, 151)
+
+
+def _photo_like(h, w, seed=0):
+    """平滑的随机色块 + 一块硬边缘的白色矩形 (近似照片内容)"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, h // 64), max(1, w // 64), 3), dtype=np.uint8)
+    img = cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+    cv2.rectangle(img, (w // 4, h // 4), (w // 2, h // 2), (255, 255, 255), -1)
+    return img
+
+
+def _time(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def main():
+    w, h = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (4000, 3000)
+    img = _photo_like(h, w)
+    print(f"{w}x{h}, 近似阈值 ksize > {EXACT_KSIZE_THRESHOLD}")
+    print(f"{'ksize':>6} {'exact ms':>9} {'auto ms':>8} {'MAE':>6} {'max':>4}")
+    for k in KSIZES:
+        t_exact, exact = _time(lambda: cv2.GaussianBlur(img, (k, k), 0))
+        t_auto, auto = _time(lambda: gaussian_blur(img, k))
+        diff = np.abs(auto.astype(np.int16) - exact)
+        print(f"{k:>6} {t_exact * 1000:>9.1f} {t_auto * 1000:>8.1f} {diff.mean():>6.3f} {diff.max():>4}")
+
+
+if __name__ == "__main__":
+    main()
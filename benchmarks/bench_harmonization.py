@@ -0,0 +1,48 @@
+"""
+颜色迁移的耗时：旧版 float32 LAB 全图迁移 对比 统计量抽样 + 查找表 (harmonization.harmonize)
+用法: python -m benchmarks.bench_harmonization
+"""
+import time
+import cv2
+import numpy as np
+from src.utils.harmonization import harmonize
+
+SIZES = ((3000, 4000), (4000, 6000))
+
+
+def reference_transfer(source, target):
+    """旧版实现 (全图 float32 LAB，全图统计量)"""
+    source_lab = cv2.cvtColor(source, cv2.COLOR_RGB2LAB).astype(np.float32)
+    target_lab = cv2.cvtColor(target, cv2.COLOR_RGB2LAB).astype(np.float32)
+    src_mean, src_std = [v.flatten() for v in cv2.meanStdDev(source_lab)]
+    tgt_mean, tgt_std = [v.flatten() for v in cv2.meanStdDev(target_lab)]
+    tgt_std[tgt_std == 0] = 1e-5
+    res_lab = target_lab.copy()
+    res_lab[:,:,0] = (target_lab[:,:,0] - tgt_mean[0]) * (src_std[0] / tgt_std[0]) * 0.5 + src_mean[0] * 0.5 + tgt_mean[0] * 0.5
+    for i in range(1, 3):
+        res_lab[:,:,i] = (target_lab[:,:,i] - tgt_mean[i]) * (src_std[i] / tgt_std[i]) + src_mean[i]
+    return cv2.cvtColor(np.clip(res_lab, 0, 255).astype(np.uint8), cv2.COLOR_LAB2RGB)
+
+
+def _time(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - start) / repeat, out
+
+
+def main(repeat=3):
+    rng = np.random.default_rng(0)
+    for h, w in SIZES:
+        fg = cv2.resize(rng.integers(0, 256, (h // 32, w // 32, 3), dtype=np.uint8), (w, h))
+        bg = cv2.resize(rng.integers(0, 256, (h // 32, w // 32, 3), dtype=np.uint8), (w, h))
+        t_old, ref = _time(lambda: reference_transfer(bg, fg), repeat)
+        t_new, out = _time(lambda: harmonize(bg, fg), repeat)
+        # 新版默认抽样统计，与全图统计有细微差别
+        diff = int(np.abs(out.astype(np.int16) - ref).max())
+        print(f"{h * w / 1e6:5.1f} MP  float LAB {t_old * 1000:7.1f} ms  ->  stats+LUT {t_new * 1000:6.1f} ms  "
+              f"(x{t_old / t_new:.1f}, max diff {diff})")
+
+
+if __name__ == "__main__":
+    main()
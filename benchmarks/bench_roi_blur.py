@@ -0,0 +1,62 @@
+"""
+局部虚化的耗时：ImageProcessor.apply_roi_blur 对比旧版逐矩形模糊
+用法: python -m benchmarks.bench_roi_blur [宽 高]
+"""
+import sys
+import time
+import cv2
+import numpy as np
+from PyQt6.QtCore import QRectF
+from src.utils.image_processor import ImageProcessor
+
+DISPLAY = (800, 600)
+
+
+def _per_rect(composite, roi_rects, display_size):
+    """旧版：每个矩形单独用 51x51 核模糊 (无羽化，重叠处重复模糊)"""
+    h, w = composite.shape[:2]
+    sx, sy = w / display_size[0], h / display_size[1]
+    k = ImageProcessor.ROI_BLUR_KSIZE
+    for rect in roi_rects:
+        x = max(0, int(rect.x() * sx)); y = max(0, int(rect.y() * sy))
+        x2 = min(w, x + int(rect.width() * sx)); y2 = min(h, y + int(rect.height() * sy))
+        if x2 > x and y2 > y:
+            composite[y:y2, x:x2] = cv2.GaussianBlur(composite[y:y2, x:x2], (k, k), ImageProcessor.ROI_BLUR_SIGMA)
+    return composite
+
+
+def _cases():
+    rng = np.random.default_rng(0)
+    return {
+        "2 个对角小矩形": [QRectF(5, 5, 40, 30), QRectF(750, 560, 40, 30)],
+        "50 个分散小矩形": [QRectF(*rng.uniform((0, 0), (780, 580)), 15, 15) for _ in range(50)],
+        "50 个重叠矩形": [QRectF(300 + i * 2, 200 + i, 120, 90) for i in range(50)],
+        "1 个大矩形": [QRectF(100, 100, 600, 400)],
+    }
+
+
+def _time(fn, img, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        work = img.copy()
+        t = time.perf_counter()
+        fn(work)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    w, h = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (4000, 3000)
+    rng = np.random.default_rng(1)
+    small = rng.integers(0, 256, (max(1, h // 64), max(1, w // 64), 3), dtype=np.uint8)
+    img = cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+    print(f"{w}x{h}, 显示尺寸 {DISPLAY[0]}x{DISPLAY[1]}")
+    print(f"{'场景':<14} {'逐矩形 ms':>9} {'分组 ms':>8}")
+    for name, rects in _cases().items():
+        t_old = _time(lambda a: _per_rect(a, rects, DISPLAY), img)
+        t_new = _time(lambda a: ImageProcessor.apply_roi_blur(a, rects, DISPLAY), img)
+        print(f"{name:<14} {t_old * 1000:9.1f} {t_new * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,111 @@
-from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QFrame 
-from PyQt6.QtCore import Qt, QRectF
-from PyQt6.QtGui import QPixmap, QImage, QPainter
+from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsItem, QFrame 
+from PyQt6.QtCore import Qt, QRectF, pyqtSignal
+from PyQt6.QtGui import QPixmap, QPainter
 import numpy as np
+from ..image_bridge import to_qimage, to_pixmap
+
+
+class TiledPixmapItem(QGraphicsItem):
+    """
+    分块更新的图片图元
+    显示内容保存在一张常驻的 QPixmap 中，按 TILE_SIZE 划分为方块，每块有一个脏标记：
+    设置同尺寸的新图像时逐块与上一帧比较，只把变化的块重新上传到 QPixmap 并重绘，
+    例如提交一笔涂鸦只更新笔画经过的几块，而不是整图重新转换上传
+    """
+    TILE_SIZE = 256
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pixmap = QPixmap()
+        self._frame = None  # 上一帧 (numpy RGB)，用于判断哪些块发生了变化
+        self._dirty = None  # (行块数, 列块数) bool
+
+    def pixmap(self):
+        return self._pixmap
+
+    def set_image(self, img):
+        """
+        显示 img (H, W, 3) uint8 RGB，之后调用方不能再原地修改该数组 (下一帧以它为比较基准)
+        :return: 本次上传的块数
+        """
+        h, w = img.shape[:2]
+        if self._frame is None or self._frame.shape != img.shape:
+            # 尺寸变化 (新图片、旋转、裁剪、草图等)：整图重新上传 (零拷贝包装，只做一次格式转换)
+            self.prepareGeometryChange()
+            self._pixmap = to_pixmap(img)
+            t = self.TILE_SIZE
+            self._dirty = np.zeros(((h + t - 1) // t, (w + t - 1) // t), bool)
+            self._frame = img
+            self.update()
+            return self._dirty.size
+
+        self._mark_changed(img)
+        count = self._flush(img)
+        self._frame = img
+        return count
+
+    def _tiles(self):
+        t = self.TILE_SIZE
+        h, w = self._frame.shape[:2]
+        for i in range(self._dirty.shape[0]):
+            for j in range(self._dirty.shape[1]):
+                yield i, j, slice(i * t, min(h, (i + 1) * t)), slice(j * t, min(w, (j + 1) * t))
+
+    def _mark_changed(self, img):
+        """与上一帧逐块比较，内容不同的块标记为脏"""
+        old = self._frame
+        if old is img: return
+        for i, j, ys, xs in self._tiles():
+            if not self._dirty[i, j] and not np.array_equal(old[ys, xs], img[ys, xs]):
+                self._dirty[i, j] = True
+
+    def _flush(self, img):
+        """把脏块写入常驻 QPixmap (只有本图元持有它，原地绘制不会触发整图复制)，并只重绘这些块"""
+        count = int(self._dirty.sum())
+        if count == 0: return 0
+        if count * 2 > self._dirty.size:
+            # 大部分块都变了 (拖动滑块等)：整图转换一次比逐块绘制快
+            self._pixmap = to_pixmap(img)
+            self._dirty[:] = False
+            self.update()
+            return count
+        painter = QPainter(self._pixmap)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        for i, j, ys, xs in self._tiles():
+            if not self._dirty[i, j]: continue
+            # 块是大图上的切片，零拷贝包装 (行间距为整图宽度)
+            tile = img[ys, xs]
+            painter.drawImage(xs.start, ys.start, to_qimage(tile))
+            self.update(QRectF(xs.start, ys.start, tile.shape[1], tile.shape[0]))
+            self._dirty[i, j] = False
+        painter.end()
+        return count
+
+    def boundingRect(self):
+        return QRectF(0, 0, self._pixmap.width(), self._pixmap.height())
+
+    def paint(self, painter, option, widget=None):
+        if self._pixmap.isNull(): return
+        # 与 QGraphicsPixmapItem 的默认 (FastTransformation) 一致
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+        painter.drawPixmap(0, 0, self._pixmap)
+
 
 class EditorCanvas(QGraphicsView):
     """
     支持缩放、拖拽的高性能画板
+    显示的可能是缩小的代理图：图元按 image_scale 放大，场景坐标始终以原图像素为单位，
+    更换不同分辨率的代理图时视图位置和缩放保持不变
     """
+    # 视图缩放变化 (滚轮 / 自适应窗口)，用于按需切换代理图分辨率
+    zoom_changed = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.image_scale = 1.0
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
-        self.pixmap_item = QGraphicsPixmapItem()
+        self.pixmap_item = TiledPixmapItem()
         self.scene.addItem(self.pixmap_item)
         
         # 优化渲染属性
@@ -23,24 +117,29 @@ class EditorCanvas(QGraphicsView):
         self.setFrameShape(QFrame.Shape.NoFrame)
         self.setStyleSheet("background: transparent;")
 
-    def set_image(self, img_array):
-        """设置显示的 numpy 图片"""
+    def set_image(self, img_array, scale=None):
+        """
+        设置显示的 numpy 图片
+        :param scale: 图片一个像素对应的场景单位 (代理图相对原图的倍数)，缺省沿用上次的值
+        """
         if img_array is None: return
-        
-        # 1. 确保内存连续 (OpenCV 有时返回非连续内存，会导致显示错乱)
-        img_array = np.ascontiguousarray(img_array)
-        
-        h, w, c = img_array.shape
-        bytes_per_line = c * w
-        
-        # 2. 转换数据类型 [关键修复]
-        # PyQt6 QImage 不接受 memoryview，必须转为 bytes
-        # .tobytes() 会创建数据副本，虽然有微小开销但能保证类型安全且防止崩溃
-        qimg = QImage(img_array.data.tobytes(), w, h, bytes_per_line, QImage.Format.Format_RGB888)
-        
-        pixmap = QPixmap.fromImage(qimg)
-        self.pixmap_item.setPixmap(pixmap)
-        self.scene.setSceneRect(0, 0, w, h)
+        if scale is not None: self.image_scale = scale
+        self._show(img_array, self.image_scale)
+
+    def show_draft(self, img_array, scale):
+        """临时显示低分辨率草图，不改变 image_scale (随后的精确图按原比例显示)"""
+        self._show(img_array, scale)
+
+    def _show(self, img_array, scale):
+        # 同尺寸的新图只上传变化的块 (见 TiledPixmapItem)
+        self.pixmap_item.set_image(img_array)
+        h, w = img_array.shape[:2]
+        self.pixmap_item.setScale(scale)
+        self.scene.setSceneRect(0, 0, w * scale, h * scale)
+
+    def device_scale(self):
+        """场景单位 (原图像素) 对应的屏幕设备像素数"""
+        return self.transform().m11() * self.devicePixelRatioF()
 
     def get_image_rect(self):
         """
@@ -62,6 +161,7 @@ class EditorCanvas(QGraphicsView):
         """自适应窗口大小"""
         if self.pixmap_item.pixmap().isNull(): return
         self.fitInView(self.pixmap_item, Qt.AspectRatioMode.KeepAspectRatio)
+        self.zoom_changed.emit()
 
     def wheelEvent(self, event):
         """鼠标滚轮缩放"""
@@ -73,4 +173,5 @@ class EditorCanvas(QGraphicsView):
         else:
             zoom_factor = zoom_out_factor
 
-        self.scale(zoom_factor, zoom_factor)
\ No newline at end of file
+        self.scale(zoom_factor, zoom_factor)
+        self.zoom_changed.emit()
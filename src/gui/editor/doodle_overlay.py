@@ -2,6 +2,79 @@ from PyQt6.QtWidgets import QWidget
 from PyQt6.QtCore import Qt, QPointF, QRectF, pyqtSignal
 from PyQt6.QtGui import QPainter, QPen, QColor, QPixmap, QPainterPath, QBrush
 import math
+import numpy as np
+
+
+class DoodleStroke:
+    """一笔涂鸦：曲线/橡皮擦为整条轨迹，直线、矩形、圆、箭头为起点和终点 (覆盖层坐标)"""
+    def __init__(self, tool, points, width, color):
+        self.tool = tool
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        self.width = width
+        self.color = QColor(color)
+
+
+def paint_stroke(painter, stroke, is_preview=False):
+    """
+    绘制一笔涂鸦 (覆盖层实时显示、固化到图层、按原图分辨率重放共用)
+    橡皮擦在预览时显示白色轨迹，实际绘制时使用 Clear 模式
+    """
+    pen = QPen(stroke.color, stroke.width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+    points = [QPointF(float(x), float(y)) for x, y in stroke.points]
+    if not points: return
+
+    if stroke.tool in ["curve", "eraser"]:
+        path = QPainterPath()
+        path.moveTo(points[0])
+        for p in points[1:]:
+            path.lineTo(p)
+        if stroke.tool == "eraser":
+            if is_preview:
+                pen.setColor(QColor(255, 255, 255))
+            else:
+                painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+        painter.setPen(pen)
+        painter.drawPath(path)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver) # 还原
+        return
+
+    # 几何图形 (Line, Arrow, Rect, Circle)
+    painter.setPen(pen)
+    start, end = points[0], points[-1]
+    if stroke.tool == "line":
+        painter.drawLine(start, end)
+    elif stroke.tool == "rect":
+        painter.drawRect(QRectF(start, end).normalized())
+    elif stroke.tool == "circle":
+        painter.drawEllipse(QRectF(start, end).normalized())
+    elif stroke.tool == "arrow":
+        _paint_arrow(painter, start, end, stroke.width, stroke.color)
+
+
+def _paint_arrow(painter, start, end, width, color):
+    """绘制箭头"""
+    painter.drawLine(start, end)
+    
+    # 计算箭头头部
+    dx = end.x() - start.x()
+    dy = end.y() - start.y()
+    angle = math.atan2(dy, dx)
+    arrow_len = width * 3 + 10
+    arrow_angle = math.pi / 6 # 30度
+    
+    p1 = QPointF(end.x() - arrow_len * math.cos(angle - arrow_angle),
+                 end.y() - arrow_len * math.sin(angle - arrow_angle))
+    p2 = QPointF(end.x() - arrow_len * math.cos(angle + arrow_angle),
+                 end.y() - arrow_len * math.sin(angle + arrow_angle))
+    
+    path = QPainterPath()
+    path.moveTo(end)
+    path.lineTo(p1)
+    path.lineTo(p2)
+    path.closeSubpath()
+    
+    painter.fillPath(path, QBrush(color))
+
 
 class DoodleOverlay(QWidget):
     """
@@ -26,8 +99,10 @@ class DoodleOverlay(QWidget):
         self.pen_width = 5
         self.pen_color = QColor(255, 165, 0) # 橙色
         
-        # 曲线路径缓存
-        self.current_path = QPainterPath()
+        # 当前曲线的坐标点
+        self.current_points = []
+        # 已完成的笔画 (按顺序)
+        self.strokes = []
 
     def set_image_rect(self, rect):
         """设置绘图区域，并调整画布大小"""
@@ -41,6 +116,7 @@ class DoodleOverlay(QWidget):
             new_layer.fill(Qt.GlobalColor.transparent)
             # 如果需要保留之前的涂鸦，这里需要做缩放迁移，暂略
             self.drawing_layer = new_layer
+            self.strokes = []
             
         self.setGeometry(rect.toRect()) # 覆盖层直接对齐图片区域
         self.show()
@@ -49,12 +125,17 @@ class DoodleOverlay(QWidget):
     def clear_canvas(self):
         """清空画布"""
         self.drawing_layer.fill(Qt.GlobalColor.transparent)
+        self.strokes = []
         self.update()
 
     def get_result(self):
         """获取最终的涂鸦图层 (QPixmap)"""
         return self.drawing_layer
 
+    def get_strokes(self):
+        """已完成的笔画 (DoodleStroke 列表，坐标相对覆盖层)"""
+        return list(self.strokes)
+
     def set_tool(self, tool_name):
         self.tool_type = tool_name
 
@@ -73,70 +154,15 @@ class DoodleOverlay(QWidget):
             self._draw_shape(painter, is_preview=True)
 
     def _draw_shape(self, painter, is_preview=False):
-        """绘制形状的核心逻辑"""
-        pen = QPen(self.pen_color, self.pen_width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
-        
-        if self.tool_type == "eraser":
-            # 橡皮擦在预览时显示白色轮廓，实际绘制时使用 Clear 模式
-            if is_preview:
-                pen.setColor(QColor(255, 255, 255))
-                pen.setWidth(self.pen_width)
-                painter.setPen(pen)
-                painter.drawPath(self.current_path)
-            else:
-                painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
-                pen.setWidth(self.pen_width)
-                painter.setPen(pen)
-                painter.drawPath(self.current_path)
-                painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver) # 还原
-                
-        elif self.tool_type == "curve":
-            painter.setPen(pen)
-            painter.drawPath(self.current_path)
-            
+        """绘制正在进行的笔画"""
+        paint_stroke(painter, self._current_stroke(), is_preview)
+
+    def _current_stroke(self):
+        if self.tool_type in ["curve", "eraser"]:
+            points = self.current_points
         else:
-            # 几何图形 (Line, Arrow, Rect, Circle)
-            painter.setPen(pen)
-            start = self.start_pos
-            end = self.current_pos
-            
-            if self.tool_type == "line":
-                painter.drawLine(start, end)
-                
-            elif self.tool_type == "rect":
-                rect = QRectF(start, end).normalized()
-                painter.drawRect(rect)
-                
-            elif self.tool_type == "circle":
-                rect = QRectF(start, end).normalized()
-                painter.drawEllipse(rect)
-                
-            elif self.tool_type == "arrow":
-                self._draw_arrow(painter, start, end)
-
-    def _draw_arrow(self, painter, start, end):
-        """绘制箭头"""
-        painter.drawLine(start, end)
-        
-        # 计算箭头头部
-        dx = end.x() - start.x()
-        dy = end.y() - start.y()
-        angle = math.atan2(dy, dx)
-        arrow_len = self.pen_width * 3 + 10
-        arrow_angle = math.pi / 6 # 30度
-        
-        p1 = QPointF(end.x() - arrow_len * math.cos(angle - arrow_angle),
-                     end.y() - arrow_len * math.sin(angle - arrow_angle))
-        p2 = QPointF(end.x() - arrow_len * math.cos(angle + arrow_angle),
-                     end.y() - arrow_len * math.sin(angle + arrow_angle))
-        
-        path = QPainterPath()
-        path.moveTo(end)
-        path.lineTo(p1)
-        path.lineTo(p2)
-        path.closeSubpath()
-        
-        painter.fillPath(path, QBrush(self.pen_color))
+            points = [(self.start_pos.x(), self.start_pos.y()), (self.current_pos.x(), self.current_pos.y())]
+        return DoodleStroke(self.tool_type, points, self.pen_width, self.pen_color)
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
@@ -145,8 +171,7 @@ class DoodleOverlay(QWidget):
             self.current_pos = event.position()
             
             if self.tool_type in ["curve", "eraser"]:
-                self.current_path = QPainterPath()
-                self.current_path.moveTo(self.start_pos)
+                self.current_points = [(self.start_pos.x(), self.start_pos.y())]
             
             self.update()
 
@@ -155,7 +180,7 @@ class DoodleOverlay(QWidget):
             self.current_pos = event.position()
             
             if self.tool_type in ["curve", "eraser"]:
-                self.current_path.lineTo(self.current_pos)
+                self.current_points.append((self.current_pos.x(), self.current_pos.y()))
             
             self.update()
 
@@ -164,10 +189,12 @@ class DoodleOverlay(QWidget):
             self.is_drawing = False
             self.current_pos = event.position()
             
-            # 将当前笔画固化到 drawing_layer
+            # 将当前笔画固化到 drawing_layer，并记录笔画 (保存时按原图分辨率重放)
+            stroke = self._current_stroke()
+            self.strokes.append(stroke)
             painter = QPainter(self.drawing_layer)
             painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-            self._draw_shape(painter, is_preview=False)
+            paint_stroke(painter, stroke)
             painter.end()
             
             self.update()
\ No newline at end of file
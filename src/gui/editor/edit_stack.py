@@ -0,0 +1,417 @@
+from collections import OrderedDict
+from functools import lru_cache
+import threading
+import cv2
+import numpy as np
+from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtGui import QColor, QFont, QFontMetricsF, QImage, QPainter, QTransform
+from .doodle_overlay import paint_stroke
+from .label_overlay import paint_label
+from .sticker_overlay import paint_sticker
+
+
+class EditStack:
+    """
+    涂鸦、马赛克、标签、贴纸、相框等图层操作的记录 (支持撤销 / 重做)
+    每个操作只保存紧凑的描述 (笔画坐标、遮罩游程编码、贴纸变换)，渲染时在调节/滤镜/裁剪之后
+    按输出尺寸逐个重放，因此原图始终保持不变，任意分辨率下都能重新生成
+    操作的坐标通过源坐标 (几何变换前的图像，归一化到 0~1) 记录，之后再旋转、翻转或裁剪，
+    重放时按当前的几何变换映射到输出图上，图层跟着图像内容走
+    重放时只复制一次起点图像，之后每个操作只在自己的覆盖范围内原地写入；
+    代理图上每隔 SNAPSHOT_INTERVAL 个操作保留一张中间结果，撤销时从最近的快照开始重放，
+    快照最多 MAX_SNAPSHOTS 张，内存占用有上限；另外保留最近一次的完整结果，
+    提交新操作时只需在它上面重放新的这一个
+    """
+    SNAPSHOT_INTERVAL = 4
+    MAX_SNAPSHOTS = 4
+
+    def __init__(self):
+        self._ops = []     # 已提交的操作，_count 之后的部分可以重做
+        self._count = 0
+        self._snapshots = _SnapshotCache(self.MAX_SNAPSHOTS)
+
+    def copy(self):
+        """当前操作列表的副本 (供后台渲染)，快照缓存与本对象共享 (缓存内部加锁)"""
+        other = EditStack.__new__(EditStack)
+        other._ops = list(self._ops)
+        other._count = self._count
+        other._snapshots = self._snapshots
+        return other
+
+    @property
+    def ops(self):
+        """当前生效的操作 (元组，可直接作为渲染缓存的键)"""
+        return tuple(self._ops[:self._count])
+
+    @property
+    def can_undo(self):
+        return self._count > 0
+
+    @property
+    def can_redo(self):
+        return self._count < len(self._ops)
+
+    def push(self, op):
+        """提交一个新操作 (丢弃可重做的部分)"""
+        del self._ops[self._count:]
+        self._ops.append(op)
+        self._count += 1
+
+    def undo(self):
+        if not self.can_undo: return False
+        self._count -= 1
+        return True
+
+    def redo(self):
+        if not self.can_redo: return False
+        self._count += 1
+        return True
+
+    def clear(self):
+        self._ops = []
+        self._count = 0
+        self._snapshots.clear()
+
+    def apply(self, img, engine, view, keep_snapshots=False):
+        """
+        在 img (调节、滤镜、裁剪后的图像) 上依次重放当前的操作
+        :param view: 3x3 矩阵，源坐标 -> img 的像素坐标 (见 ImageEditorEngine.source_view)
+        :param keep_snapshots: 是否使用/保存中间结果快照 (只用于代理图，草图和全尺寸导出不保存)
+        """
+        ops = self.ops
+        base, start = img, 0
+        if keep_snapshots:
+            start, snap = self._snapshots.lookup(base, ops)
+            if snap is not None: img = snap
+        # 起点 (底图或快照) 可能是缓存，复制一份后各操作原地修改
+        if start < len(ops): img = img.copy()
+        size = (base.shape[1], base.shape[0])
+        for i, op in enumerate(ops):
+            if i >= start:
+                img = op.apply(img, engine, view)
+                if keep_snapshots and (i + 1) % self.SNAPSHOT_INTERVAL == 0:
+                    # 之后的操作还会继续修改 img，中间快照要单独保存 (最后一个操作的结果不再修改)
+                    self._snapshots.put(base, ops[:i + 1], img if i + 1 == len(ops) else img.copy())
+            # 快照之前的相框也要计入，之后的操作以加框后的图为坐标
+            if isinstance(op, FrameOp):
+                view, size = op.extend(view, size, engine)
+        if keep_snapshots:
+            self._snapshots.set_tip(base, ops, img)
+        return img
+
+    def view(self, view, size, engine):
+        """
+        在当前所有操作之后再加一个操作时使用的坐标变换 (计入已有的相框)
+        :param view: 源坐标 -> 裁剪后图像像素坐标的 3x3 矩阵
+        :param size: 裁剪后的图像尺寸 (w, h)
+        :return: (源坐标 -> 加框后图像像素坐标的矩阵, 加框后的尺寸)
+        """
+        for op in self.ops:
+            if isinstance(op, FrameOp):
+                view, size = op.extend(view, size, engine)
+        return view, size
+
+
+class _SnapshotCache:
+    """
+    操作重放的中间结果 {操作前缀: 图像}，只对一张底图有效 (底图变化后全部作废)
+    按最近使用淘汰，最多保留 capacity 张；tip 为最近一次完整重放的 (操作, 结果)，不占名额
+    界面线程和后台渲染线程共用一个缓存，读写都在锁内进行；写入时带上重放所用的底图，
+    与当前底图不是同一个对象时 (底图已经换过，结果已过时) 直接丢弃
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, base):
+        self._base = base
+        self._entries = OrderedDict()
+        self._tip = None
+
+    def clear(self):
+        with self._lock:
+            self._reset(None)
+
+    def lookup(self, base, ops):
+        """:return: (快照对应的操作数, 快照图像)，没有可用快照时为 (0, None)"""
+        with self._lock:
+            if base is not self._base:
+                # 调节参数或裁剪变化：旧底图上的快照全部失效
+                self._reset(base)
+                return 0, None
+            best = (0, None)
+            tip = self._tip
+            if tip is not None and ops[:len(tip[0])] == tip[0]:
+                best = (len(tip[0]), tip[1])
+            entries = self._entries
+            for prefix in sorted(entries, key=len, reverse=True):
+                if len(prefix) <= best[0]: break
+                if ops[:len(prefix)] == prefix:
+                    entries.move_to_end(prefix)
+                    return len(prefix), entries[prefix]
+            return best
+
+    def put(self, base, prefix, img):
+        with self._lock:
+            if base is not self._base: return
+            entries = self._entries
+            entries[prefix] = img
+            entries.move_to_end(prefix)
+            while len(entries) > self.capacity:
+                entries.popitem(last=False)
+
+    def set_tip(self, base, ops, img):
+        with self._lock:
+            if base is not self._base: return
+            self._tip = (ops, img)
+
+
+# --- 操作 ---
+# 每个操作的坐标都是编辑时覆盖层 (即当时图片的显示区域) 上的坐标，另外记录覆盖层坐标 -> 源坐标的
+# 3x3 矩阵 transform (编辑时的几何变换、裁剪和相框的逆变换)；重放时与当前的 源坐标 -> 输出像素
+# 变换相乘，直接在目标分辨率上重新绘制，并且只处理操作覆盖的矩形区域 (在 img 上原地写入并返回 img，
+# 只有相框返回新图)，提交一个操作的开销与图层大小成正比，与整图大小无关
+
+class _LayerOp:
+    """矢量图层操作的公共部分：在覆盖范围内按目标分辨率栅格化，再按 Alpha 叠加"""
+    def __init__(self, transform):
+        self.transform = transform
+
+    def bounds(self):
+        """覆盖层坐标下的外接矩形 (x0, y0, x1, y1)，没有内容时为 None"""
+        raise NotImplementedError
+
+    def paint(self, painter):
+        raise NotImplementedError
+
+    def apply(self, img, engine, view):
+        m = view @ self.transform
+        roi = _target_roi(self.bounds(), m, img)
+        if roi is None: return img
+        x0, y0, x1, y1 = roi
+        layer = QImage(x1 - x0, y1 - y0, QImage.Format.Format_ARGB32_Premultiplied)
+        layer.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(layer)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        # 覆盖层坐标 -> 目标图像素 -> 图层内坐标
+        m = _translation(-x0, -y0) @ m
+        painter.setTransform(QTransform(m[0, 0], m[1, 0], m[0, 1], m[1, 1], m[0, 2], m[1, 2]))
+        self.paint(painter)
+        painter.end()
+        return _blend_layer(img, layer, roi)
+
+
+class DoodleOp(_LayerOp):
+    """涂鸦：笔画列表 (工具、坐标点、线宽、颜色)，橡皮擦只擦除同一层中之前的笔画"""
+    def __init__(self, strokes, transform):
+        super().__init__(transform)
+        self.strokes = tuple(strokes)
+
+    def bounds(self):
+        boxes = []
+        for stroke in self.strokes:
+            if stroke.tool == "eraser" or len(stroke.points) == 0: continue
+            # 线宽的一半 + 箭头头部 (长度为 线宽 * 3 + 10)
+            pad = stroke.width * 3 + 12
+            (x0, y0), (x1, y1) = stroke.points.min(axis=0), stroke.points.max(axis=0)
+            boxes.append((x0 - pad, y0 - pad, x1 + pad, y1 + pad))
+        return _union(boxes)
+
+    def paint(self, painter):
+        for stroke in self.strokes:
+            paint_stroke(painter, stroke)
+
+
+class MosaicOp:
+    """马赛克：涂抹遮罩 (游程编码，覆盖层像素) + 马赛克样式；马赛克效果在重放时由下层图像生成"""
+    def __init__(self, mask, style, transform):
+        self.mask = MaskRLE.encode(mask)
+        self.style = style
+        self.transform = transform
+        ys, xs = np.nonzero(mask)
+        self._bounds = (xs.min(), ys.min(), xs.max() + 1, ys.max() + 1) if len(xs) else None
+
+    def apply(self, img, engine, view):
+        m = view @ self.transform
+        roi = _target_roi(self._bounds, m, img)
+        if roi is None: return img
+        x0, y0, x1, y1 = roi
+        # 只把覆盖范围内的遮罩映射到目标分辨率：目标像素中心 -> 遮罩像素中心 (两边各差半个像素)
+        # 只解码 roi 反算回遮罩上的行 (多留一行给双线性插值)
+        mh, mw = self.mask.shape
+        m_inv = np.linalg.inv(m)
+        xs, ys, _ = m_inv @ np.array([[x0, x1, x0, x1], [y0, y0, y1, y1], [1, 1, 1, 1]], np.float64)
+        r0, r1 = max(0, int(np.floor(ys.min())) - 1), min(mh, int(np.ceil(ys.max())) + 1)
+        c0, c1 = max(0, int(np.floor(xs.min())) - 1), min(mw, int(np.ceil(xs.max())) + 1)
+        if r1 <= r0 or c1 <= c0: return img
+        # 遮罩外扩一圈复制的边，保证贴着显示区域边缘涂抹时边缘像素完整，再往外为 0 (不会向外蔓延)
+        mask = cv2.copyMakeBorder(self.mask.decode(r0, r1)[:, c0:c1], 1, 1, 1, 1, cv2.BORDER_REPLICATE)
+        inv = _translation(0.5 - c0, 0.5 - r0) @ m_inv @ _translation(x0 + 0.5, y0 + 0.5)
+        alpha = cv2.warpAffine(mask, inv[:2].astype(np.float32), (x1 - x0, y1 - y0),
+                               flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT)
+        mosaic = engine.generate_mosaic_image(img, style=self.style, roi=roi)
+
+        region = img[y0:y1, x0:x1]
+        alpha = cv2.merge((alpha, alpha, alpha))
+        region[:] = cv2.add(cv2.multiply(mosaic, alpha, scale=1 / 255.0),
+                            cv2.multiply(region, cv2.bitwise_not(alpha), scale=1 / 255.0))
+        return img
+
+
+class StickerOp(_LayerOp):
+    """贴纸：每张贴纸的图片路径和变换 (中心点、宽高、旋转角度)"""
+    def __init__(self, items, transform):
+        super().__init__(transform)
+        self.items = tuple((it.image_path, it.x, it.y, it.width, it.height, it.angle) for it in items)
+
+    def bounds(self):
+        boxes = []
+        for path, x, y, w, h, angle in self.items:
+            t = QTransform()
+            t.translate(x, y)
+            t.rotate(angle)
+            boxes.append(_rect_box(t.mapRect(QRectF(-w/2, -h/2, w, h)), 2))
+        return _union(boxes)
+
+    def paint(self, painter):
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        for path, x, y, w, h, angle in self.items:
+            paint_sticker(painter, _load_image(path), x, y, w, h, angle)
+
+
+class LabelOp(_LayerOp):
+    """标签：每个标签的底图路径、位置、角度和文字样式"""
+    def __init__(self, items, transform):
+        super().__init__(transform)
+        self.items = tuple((it.image_path, it.x, it.y, it.width, it.height, it.angle, it.text,
+                            it.font.toString(), it.text_color.rgba(), it.has_shadow) for it in items)
+
+    def bounds(self):
+        boxes = []
+        for path, x, y, w, h, angle, text, font_desc, rgba, shadow in self.items:
+            # 文字可能超出标签底图 (单词过长不换行)，按实际文字范围一起计算
+            rect = QRectF(x, y, w, h)
+            text_rect = QFontMetricsF(_font(font_desc)).boundingRect(
+                rect, (Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap).value, text)
+            rect = rect.united(text_rect.adjusted(0, 0, 2, 2))
+            t = QTransform()
+            t.translate(x + w/2, y + h/2)
+            t.rotate(angle)
+            t.translate(-(x + w/2), -(y + h/2))
+            boxes.append(_rect_box(t.mapRect(rect), 4))
+        return _union(boxes)
+
+    def paint(self, painter):
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+        for path, x, y, w, h, angle, text, font_desc, rgba, shadow in self.items:
+            paint_label(painter, _load_image(path), x, y, w, h, angle, text, _font(font_desc),
+                        QColor.fromRgba(rgba), shadow)
+
+
+class FrameOp:
+    """相框：加在当前结果外围 (之后的图层操作以加框后的图为坐标)"""
+    def __init__(self, frame_type):
+        self.frame_type = frame_type
+
+    def apply(self, img, engine, view):
+        return engine.generate_framed_image(img, self.frame_type)
+
+    def extend(self, view, size, engine):
+        """加框后的坐标变换和尺寸 (原图内容平移到边框内侧)"""
+        top, bottom, left, right = engine.frame_borders(self.frame_type, *size)
+        return _translation(left, top) @ view, (size[0] + left + right, size[1] + top + bottom)
+
+
+class MaskRLE:
+    """uint8 遮罩的游程编码 (涂抹区域通常是少量连续的块，压缩后远小于原遮罩)"""
+    def __init__(self, shape, values, lengths):
+        self.shape = shape
+        self.values = values
+        self.lengths = lengths
+
+    @classmethod
+    def encode(cls, mask):
+        flat = np.ascontiguousarray(mask, dtype=np.uint8).ravel()
+        if flat.size == 0:
+            return cls(mask.shape, flat.copy(), np.zeros(0, np.uint32))
+        starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+        lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+        return cls(mask.shape, flat[starts].copy(), lengths)
+
+    def decode(self, row0=0, row1=None):
+        """解码第 row0 ~ row1 行 (默认整张遮罩)，只展开与这些行相交的游程"""
+        h, w = self.shape[:2]
+        row1 = h if row1 is None else row1
+        if row0 == 0 and row1 == h:
+            return np.repeat(self.values, self.lengths).reshape(self.shape)
+        start, stop = row0 * w, row1 * w
+        ends = np.cumsum(self.lengths, dtype=np.int64)
+        i0 = np.searchsorted(ends, start, side="right")
+        i1 = np.searchsorted(ends, stop, side="left") + 1
+        lengths = self.lengths[i0:i1].astype(np.int64)
+        # 首尾两段游程截到所需范围内
+        lengths[0] = min(ends[i0], stop) - start
+        if i1 - i0 > 1: lengths[-1] = stop - ends[i1 - 2]
+        return np.repeat(self.values[i0:i1], lengths).reshape((row1 - row0,) + tuple(self.shape[1:]))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.lengths.nbytes
+
+
+@lru_cache(maxsize=64)
+def _load_image(path):
+    """贴纸/标签素材 (QImage 可以在后台线程绘制，QPixmap 不行)"""
+    return QImage(path)
+
+
+def _font(desc):
+    font = QFont()
+    font.fromString(desc)
+    return font
+
+
+def _rect_box(rect, pad):
+    return (rect.left() - pad, rect.top() - pad, rect.right() + pad, rect.bottom() + pad)
+
+
+def _union(boxes):
+    if not boxes: return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _translation(dx, dy):
+    return np.array([[1.0, 0, dx], [0, 1.0, dy], [0, 0, 1.0]])
+
+
+def _target_roi(bounds, m, img):
+    """覆盖层坐标下的外接矩形经 m 映射后 -> 目标图像上的整数像素区域，与图像不相交时为 None"""
+    if bounds is None: return None
+    h, w = img.shape[:2]
+    bx0, by0, bx1, by1 = bounds
+    xs, ys, _ = m @ np.array([[bx0, bx1, bx0, bx1], [by0, by0, by1, by1], [1, 1, 1, 1]], np.float64)
+    x0 = max(0, int(np.floor(xs.min())) - 1)
+    y0 = max(0, int(np.floor(ys.min())) - 1)
+    x1 = min(w, int(np.ceil(xs.max())) + 1)
+    y1 = min(h, int(np.ceil(ys.max())) + 1)
+    if x1 <= x0 or y1 <= y0: return None
+    return x0, y0, x1, y1
+
+
+def _blend_layer(img, layer, roi):
+    """把 RGBA 图层 (预乘 Alpha) 原地叠加到 RGB 图像的 roi 区域"""
+    x0, y0, x1, y1 = roi
+    rw, rh = x1 - x0, y1 - y0
+    layer = layer.convertToFormat(QImage.Format.Format_RGBA8888_Premultiplied)
+    ptr = layer.constBits()
+    ptr.setsize(layer.sizeInBytes())
+    rgba = np.frombuffer(ptr, np.uint8).reshape(rh, layer.bytesPerLine() // 4, 4)[:, :rw]
+
+    region = img[y0:y1, x0:x1]
+    # 预乘 Alpha：结果 = 图层颜色 + 底图 * (1 - alpha)
+    inv = cv2.bitwise_not(np.ascontiguousarray(rgba[..., 3]))
+    region[:] = cv2.add(np.ascontiguousarray(rgba[..., :3]),
+                        cv2.multiply(region, cv2.merge((inv, inv, inv)), scale=1 / 255.0))
+    return img
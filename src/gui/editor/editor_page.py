@@ -3,9 +3,13 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QScroller, QMessageBox, QScrollerProperties, QSlider, QColorDialog, QTabWidget)
 from PyQt6.QtCore import Qt, pyqtSignal, QRectF, QEvent, QPointF, QSize
 # 修复：添加 QImage, QPixmap 导入
-from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QImage, QPixmap, QIcon
+from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QImage, QPixmap, QIcon, QShortcut, QKeySequence
 from .canvas import EditorCanvas
 from .processor import ImageEditorEngine
+from .filters import load_cube_filter
+from .render_scheduler import RenderScheduler
+from .filter_previews import FilterPreviewer
+from .edit_stack import DoodleOp, MosaicOp, StickerOp, LabelOp, FrameOp
 from .ui_components import IconButton, ModernSlider 
 from .crop_overlay import CropOverlay
 from .doodle_overlay import DoodleOverlay
@@ -13,6 +17,7 @@ from .mosaic_overlay import MosaicOverlay
 from .label_overlay import LabelOverlay 
 from .sticker_overlay import StickerOverlay
 from ..workbench_page import WorkbenchPage
+from ..image_bridge import to_pixmap
 import cv2
 import numpy as np
 import os
@@ -59,6 +64,12 @@ class EditorPage(QWidget):
     def __init__(self):
         super().__init__()
         self.engine = ImageEditorEngine()
+        # 滑块等连续调节的预览在后台渲染 (合并连续变化、丢弃过期结果)
+        self.render_scheduler = RenderScheduler(self.engine, self)
+        self.render_scheduler.rendered.connect(self.on_render_ready)
+        # 滤镜栏按钮上的实时效果缩略图
+        self.filter_previewer = FilterPreviewer(self)
+        self.filter_previewer.thumbnail_ready.connect(self.on_filter_thumbnail)
         self.current_adjust_key = "brightness" 
         self.init_ui()
 
@@ -89,12 +100,28 @@ class EditorPage(QWidget):
         btn_open.setStyleSheet("QPushButton { background-color: #2d3436; color: white; border: 1px solid #636e72; border-radius: 15px; padding: 5px 15px; font-weight: bold; } QPushButton:hover { background-color: #636e72; }")
         btn_open.clicked.connect(self.open_image)
 
+        # 撤销 / 重做 (涂鸦、马赛克、标签、贴纸、相框)
+        history_style = "QPushButton { background-color: #2d3436; color: white; border: 1px solid #636e72; border-radius: 15px; padding: 5px 15px; font-weight: bold; } QPushButton:hover { background-color: #636e72; } QPushButton:disabled { color: #636e72; }"
+        self.btn_undo = QPushButton("撤销")
+        self.btn_undo.setStyleSheet(history_style)
+        self.btn_undo.clicked.connect(self.undo_edit)
+        self.btn_redo = QPushButton("重做")
+        self.btn_redo.setStyleSheet(history_style)
+        self.btn_redo.clicked.connect(self.redo_edit)
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.undo_edit)
+        QShortcut(QKeySequence.StandardKey.Redo, self, self.redo_edit)
+        self.update_history_buttons()
+
         btn_save = QPushButton("保存结果")
         btn_save.setStyleSheet("QPushButton { background-color: #0984e3; color: white; border-radius: 15px; padding: 5px 15px; font-weight: bold; } QPushButton:hover { background-color: #74b9ff; }")
         btn_save.clicked.connect(self.save_image)
 
         top_layout.addWidget(self.btn_back)
         top_layout.addStretch()
+        top_layout.addWidget(self.btn_undo)
+        top_layout.addSpacing(10)
+        top_layout.addWidget(self.btn_redo)
+        top_layout.addSpacing(10)
         top_layout.addWidget(btn_open)
         top_layout.addSpacing(10)
         top_layout.addWidget(btn_save)
@@ -150,6 +177,7 @@ class EditorPage(QWidget):
         self.sub_tool_stack.addWidget(self.create_label_tools())  # 5 (新增)
         self.sub_tool_stack.addWidget(self.create_sticker_tools()) # 6 (新增)
         self.sub_tool_stack.addWidget(self.create_frame_tools()) # 7 (新增)
+        self.canvas.zoom_changed.connect(self.update_preview_resolution)
 
 
         category_scroll = self.create_scroll_area()
@@ -484,11 +512,21 @@ class EditorPage(QWidget):
                    ("f_halo", "光晕", "f_halo"), ("f_sweet", "甜美", "f_sweet"), ("f_handsome", "帅气", "f_handsome"),
                    ("f_sentimental", "感性", "f_sentimental"), ("f_individuality", "个性", "f_individuality"), ("f_demist", "去雾", "f_demist")]
         self.filter_btns = []
+        self.filter_btn_map = {}
         for key, name, icon_key in filters:
             btn = IconButton(icon_key, name, is_small=True)
+            btn.setFixedSize(72, 92) # 放得下效果缩略图
             btn.clicked.connect(lambda c, k=key, b=btn: self.switch_filter(k, b))
             layout.addWidget(btn)
             self.filter_btns.append(btn)
+            self.filter_btn_map[key] = btn
+
+        # 导入第三方 .cube 滤镜，导入的滤镜按钮插在此按钮之前
+        self.filter_layout = layout
+        self.btn_import_lut = IconButton("filter", "导入", is_small=True)
+        self.btn_import_lut.setCheckable(False)
+        self.btn_import_lut.clicked.connect(self.import_cube_filter)
+        layout.addWidget(self.btn_import_lut)
         layout.addStretch()
         scroll.setWidget(widget)
         return scroll
@@ -601,6 +639,8 @@ class EditorPage(QWidget):
         return container
         
     def switch_category(self, index, btn_sender):
+        # 以下改为同步渲染并显示，后台尚未完成的预览作废
+        self.render_scheduler.cancel()
         self.sub_tool_stack.setCurrentIndex(index)
         for btn in self.cat_btns: btn.setChecked(False)
         btn_sender.setChecked(True)
@@ -675,6 +715,7 @@ class EditorPage(QWidget):
             self.hide_action_bar()
             
             if index == 1: self.slider_panel.show()
+            if index == 2: self.refresh_filter_previews()
 
     def update_sticker_geometry(self):
         if hasattr(self.canvas, 'get_image_rect'):
@@ -684,55 +725,14 @@ class EditorPage(QWidget):
             self.sticker_overlay.set_image_rect(self.canvas.rect())
 
     def save_sticker(self):
-        if self.engine.original_image is None:
+        if self.engine.original_image is None or not self.sticker_overlay.items:
             self.cancel_sticker()
             return
             
-        # 1. 获取贴纸层图片 (QImage ARGB32)
-        sticker_img_qt = self.sticker_overlay.get_result_image(self.sticker_overlay.size())
-        
-        # 2. 转换为 Numpy 格式
-        # QImage.bits() 返回的数据在 Windows 上通常是 BGRA 顺序
-        ptr = sticker_img_qt.bits()
-        ptr.setsize(sticker_img_qt.height() * sticker_img_qt.width() * 4)
-        arr = np.frombuffer(ptr, np.uint8).reshape((sticker_img_qt.height(), sticker_img_qt.width(), 4))
+        # 记录贴纸的变换 (不修改原图)，渲染时按输出分辨率和当前的几何变换重新绘制
+        size = (self.sticker_overlay.width(), self.sticker_overlay.height())
+        self.push_edit(StickerOp(self.sticker_overlay.items, self.engine.overlay_transform(size)))
         
-        # 3. 获取当前底图 (RGB)
-        current_img = self.engine.render(use_preview=True, include_crop=True)
-        if current_img is None: return
-        
-        # 4. 颜色空间修正与混合
-        # arr 是 BGRA，current_img 是 RGB
-        # 我们需要将 arr 转换为 RGBA 以匹配 current_img 的通道顺序
-        sticker_rgba = cv2.cvtColor(arr, cv2.COLOR_BGRA2RGBA)
-        
-        # 调整尺寸
-        if sticker_rgba.shape[:2] != current_img.shape[:2]:
-            sticker_rgba = cv2.resize(sticker_rgba, (current_img.shape[1], current_img.shape[0]))
-            
-        # 分离通道
-        r, g, b, a = cv2.split(sticker_rgba)
-        overlay_rgb = cv2.merge((r, g, b))
-        
-        # 归一化 Alpha
-        mask = a / 255.0
-        
-        # 混合
-        src = current_img.astype(float)
-        ovr = overlay_rgb.astype(float)
-        
-        # 逐通道混合
-        for c in range(3):
-            src[:, :, c] = src[:, :, c] * (1.0 - mask) + ovr[:, :, c] * mask
-            
-        merged_img = src.astype(np.uint8)
-        
-        # 5. 更新 Engine
-        self.engine.preview_image = merged_img
-        self.engine.original_image = cv2.resize(merged_img, 
-                                                (self.engine.original_image.shape[1], self.engine.original_image.shape[0]))
-        
-        self.canvas.set_image(merged_img)
         self.sticker_overlay.clear()
         self.sticker_overlay.hide()
         self.hide_action_bar()
@@ -784,138 +784,26 @@ class EditorPage(QWidget):
         btn_sender.setChecked(True)
         
         self.current_frame_type = frame_type
+        self.render_scheduler.cancel()
         
         # 获取当前渲染图像
         current_img = self.engine.render(use_preview=True, include_crop=True)
         if current_img is None: return
         
         # 生成带相框的图像
-        framed_img = self.generate_framed_image(current_img, frame_type)
+        framed_img = self.engine.generate_framed_image(current_img, frame_type)
         
         # 显示预览
         self.canvas.set_image(framed_img)
         self.show_action_bar("Frame", self.save_frame, self.cancel_frame)
 
-    def generate_framed_image(self, img, frame_type):
-        """
-        生成带相框的图像逻辑
-        :param img: 原始图像 (RGB numpy array)
-        :param frame_type: 相框类型字符串
-        :return: 处理后的图像
-        """
-        if frame_type == "none":
-            return img.copy()
-            
-        h, w = img.shape[:2]
-        min_dim = min(w, h)
-        
-        if frame_type == "white":
-            # 添加 5% 白色边框
-            border = int(min_dim * 0.05)
-            return cv2.copyMakeBorder(img, border, border, border, border, cv2.BORDER_CONSTANT, value=[255, 255, 255])
-            
-        elif frame_type == "black":
-            # 添加 5% 黑色边框
-            border = int(min_dim * 0.05)
-            return cv2.copyMakeBorder(img, border, border, border, border, cv2.BORDER_CONSTANT, value=[0, 0, 0])
-            
-        elif frame_type == "polaroid":
-            # 拍立得风格：四周白边，底部留宽白边用于写字
-            border_side = int(min_dim * 0.05)
-            border_bottom = int(min_dim * 0.25)
-            return cv2.copyMakeBorder(img, border_side, border_bottom, border_side, border_side, cv2.BORDER_CONSTANT, value=[255, 255, 255])
-            
-        elif frame_type == "wood":
-            # 木质边框：使用深棕色填充
-            border = int(min_dim * 0.08)
-            # RGB 颜色 [139, 69, 19] (SaddleBrown)
-            return cv2.copyMakeBorder(img, border, border, border, border, cv2.BORDER_CONSTANT, value=[139, 69, 19])
-            
-        elif frame_type == "film":
-            # 胶卷风格：上下黑色电影边框，模拟胶片孔
-            border_y = int(h * 0.12) # 上下边框较宽
-            border_x = int(w * 0.02) # 左右微边
-            
-            # 1. 扩展黑色边框
-            res = cv2.copyMakeBorder(img, border_y, border_y, border_x, border_x, cv2.BORDER_CONSTANT, value=[20, 20, 20])
-            
-            # 2. 绘制胶卷孔 (白色小矩形)
-            hole_h = int(border_y * 0.5)
-            hole_w = int(hole_h * 0.7)
-            hole_margin_top = int((border_y - hole_h) / 2)
-            hole_gap = int(hole_w * 0.8) # 孔间距
-            
-            # 绘制上方孔洞
-            for x in range(0, res.shape[1], hole_w + hole_gap):
-                cv2.rectangle(res, (x, hole_margin_top), (x + hole_w, hole_margin_top + hole_h), (220, 220, 220), -1)
-                
-            # 绘制下方孔洞
-            hole_margin_bottom = res.shape[0] - border_y + hole_margin_top
-            for x in range(0, res.shape[1], hole_w + hole_gap):
-                cv2.rectangle(res, (x, hole_margin_bottom), (x + hole_w, hole_margin_bottom + hole_h), (220, 220, 220), -1)
-                
-            return res
-
-        elif frame_type == "line":
-            # 简约线条：外层宽白边 + 内层细黑线
-            border_outer = int(min_dim * 0.1)
-            # 1. 加宽白边
-            res = cv2.copyMakeBorder(img, border_outer, border_outer, border_outer, border_outer, cv2.BORDER_CONSTANT, value=[255, 255, 255])
-            
-            # 2. 绘制内框线
-            line_thickness = max(1, int(min_dim * 0.003))
-            margin = int(border_outer * 0.4)
-            
-            # 计算内框坐标
-            pt1 = (margin, margin)
-            pt2 = (res.shape[1] - margin, res.shape[0] - margin)
-            cv2.rectangle(res, pt1, pt2, (80, 80, 80), line_thickness)
-            
-            return res
-        
-        return img
     def save_frame(self):
         if self.engine.original_image is None: return
         
-        # 1. 备份当前的非几何参数 (滤镜、调节数值)
-        # 这样我们可以在应用相框后恢复它们，而不是重置为0
-        saved_filter = self.engine.current_filter
-        saved_params = self.engine.params.copy()
-        
-        # 2. 临时重置滤镜和调节参数
-        # 目的是获取一张“干净”的、只应用了裁剪/旋转的底图
-        self.engine.update_filter("f_original")
-        for k in self.engine.params:
-            self.engine.params[k] = 0
-            
-        # 3. 获取基础图像 (包含裁剪/旋转，但不含滤镜/调节)
-        # 这样生成的图片是纯净的，不会带有之前的滤镜效果
-        base_img = self.engine.render(use_preview=True, include_crop=True)
-        
-        # 4. 应用相框
-        if hasattr(self, 'current_frame_type'):
-            final_img = self.generate_framed_image(base_img, self.current_frame_type)
-            
-            # 5. 更新 Engine 底图
-            # 将“几何变换+相框”后的图作为新的底图
-            self.engine.original_image = final_img
-            self.engine.preview_image = final_img.copy()
-            
-            # 6. 重置几何参数 (因为裁剪/旋转已经烘焙到新底图里了)
-            self.engine.geo_params["crop_rect"] = None
-            self.engine.geo_params["rotate_angle"] = 0
-            self.engine.geo_params["rotate_90"] = 0
-            self.engine.geo_params["flip_h"] = False
-            
-            # 7. 恢复滤镜和调节参数 (关键步骤)
-            # 恢复之前的设置，这样用户看到的界面数值不变，且效果是应用在带相框的图上
-            self.engine.current_filter = saved_filter
-            self.engine.params = saved_params
-            
-            # 8. 刷新显示
-            # 重新渲染，将滤镜/调节应用到新的带相框底图上
-            new_render = self.engine.render(use_preview=True, include_crop=True)
-            self.canvas.set_image(new_render)
+        # 相框作为一个图层操作加在当前结果外围，可以撤销；滤镜和调节参数不受影响
+        frame_type = getattr(self, 'current_frame_type', "none")
+        if frame_type != "none":
+            self.push_edit(FrameOp(frame_type))
             
         self.hide_action_bar()
         self.switch_category(1, self.cat_btns[1])
@@ -936,26 +824,14 @@ class EditorPage(QWidget):
             self.label_overlay.set_image_rect(self.canvas.rect())
 
     def save_label(self):
-        if self.engine.original_image is None:
+        if self.engine.original_image is None or not self.label_overlay.items:
             self.cancel_label()
             return
             
-        # 1. 获取标签层图片
-        label_img = self.label_overlay.get_result_image(self.label_overlay.size())
-        
-        # 2. 获取当前底图
-        current_img = self.engine.render(use_preview=True, include_crop=True)
-        if current_img is None: return
-        
-        # 3. 合并
-        merged_img = self.engine.apply_label_layer(label_img, current_img)
-        
-        # 4. 更新 Engine
-        self.engine.preview_image = merged_img
-        self.engine.original_image = cv2.resize(merged_img, 
-                                                (self.engine.original_image.shape[1], self.engine.original_image.shape[0]))
+        # 记录标签的位置和文字样式，渲染时按输出分辨率和当前的几何变换重新绘制
+        size = (self.label_overlay.width(), self.label_overlay.height())
+        self.push_edit(LabelOp(self.label_overlay.items, self.engine.overlay_transform(size)))
         
-        self.canvas.set_image(merged_img)
         self.label_overlay.items.clear() # 清空标签
         self.label_overlay.hide()
         self.hide_action_bar()
@@ -997,11 +873,8 @@ class EditorPage(QWidget):
             current_img = self.engine.render(use_preview=True, include_crop=True)
             if current_img is not None:
                 mosaic_img = self.engine.generate_mosaic_image(current_img, style=tool_type)
-                h, w, ch = mosaic_img.shape
-                bytes_per_line = ch * w
-                qimg = QImage(mosaic_img.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-                self.mosaic_overlay.set_mosaic_pixmap(QPixmap.fromImage(qimg))
-                self.current_mosaic_img_numpy = mosaic_img
+                self.mosaic_overlay.set_mosaic_pixmap(to_pixmap(mosaic_img))
+                self.current_mosaic_style = tool_type
 
     # --- 底部操作栏逻辑 ---
     def show_action_bar(self, title, on_save, on_cancel):
@@ -1055,17 +928,13 @@ class EditorPage(QWidget):
             self.cancel_doodle()
             return
 
-        doodle_pix = self.doodle_overlay.get_result()
-        current_img = self.engine.render(use_preview=True, include_crop=True)
-        if current_img is None: return
-        
-        merged_img = self.engine.apply_doodle_layer(doodle_pix, current_img)
+        # 记录笔画 (矢量)，渲染时按输出分辨率和当前的几何变换重放
+        strokes = self.doodle_overlay.get_strokes()
+        if strokes:
+            size = (self.doodle_overlay.width(), self.doodle_overlay.height())
+            self.push_edit(DoodleOp(strokes, self.engine.overlay_transform(size)))
         
-        self.engine.preview_image = merged_img
-        self.engine.original_image = cv2.resize(merged_img, 
-                                                (self.engine.original_image.shape[1], self.engine.original_image.shape[0]))
-        
-        self.canvas.set_image(merged_img)
+        self.doodle_overlay.clear_canvas()
         self.doodle_overlay.hide()
         self.hide_action_bar()
         self.switch_category(1, self.cat_btns[1])
@@ -1081,20 +950,14 @@ class EditorPage(QWidget):
             self.cancel_mosaic()
             return
 
-        mask_qimg = self.mosaic_overlay.get_mask()
-        current_img = self.engine.render(use_preview=True, include_crop=True)
-        if current_img is None: return
-        
-        if not hasattr(self, 'current_mosaic_img_numpy'):
-             self.current_mosaic_img_numpy = self.engine.generate_mosaic_image(current_img, "pixel")
-
-        merged_img = self.engine.apply_mosaic_mask(current_img, self.current_mosaic_img_numpy, mask_qimg)
+        # 记录涂抹遮罩 (游程编码) 和样式，马赛克效果在渲染时由下层图像生成
+        mask = self.mosaic_overlay.get_mask_array()
+        if mask is not None and mask.any():
+            size = (mask.shape[1], mask.shape[0])
+            self.push_edit(MosaicOp(mask, getattr(self, 'current_mosaic_style', "pixel"),
+                                    self.engine.overlay_transform(size)))
         
-        self.engine.preview_image = merged_img
-        self.engine.original_image = cv2.resize(merged_img, 
-                                                (self.engine.original_image.shape[1], self.engine.original_image.shape[0]))
-        
-        self.canvas.set_image(merged_img)
+        self.mosaic_overlay.clear_mask()
         self.mosaic_overlay.hide()
         self.hide_action_bar()
         self.switch_category(1, self.cat_btns[1])
@@ -1105,6 +968,32 @@ class EditorPage(QWidget):
         self.hide_action_bar()
         self.switch_category(1, self.cat_btns[1])
         
+    # --- 图层操作的撤销 / 重做 ---
+    def push_edit(self, op):
+        self.engine.edits.push(op)
+        self.update_history_buttons()
+
+    def undo_edit(self):
+        if self.engine.edits.undo():
+            self.on_edit_history_changed()
+
+    def redo_edit(self):
+        if self.engine.edits.redo():
+            self.on_edit_history_changed()
+
+    def on_edit_history_changed(self):
+        self.update_history_buttons()
+        index = self.sub_tool_stack.currentIndex()
+        if index >= 3:
+            # 图层工具编辑中：底图变了，在新底图上重新开始当前工具 (未保存的内容放弃)
+            self.switch_category(index, self.cat_btns[index])
+        else:
+            self.render_scheduler.request(include_crop=(index != 0))
+
+    def update_history_buttons(self):
+        self.btn_undo.setEnabled(self.engine.edits.can_undo)
+        self.btn_redo.setEnabled(self.engine.edits.can_redo)
+
     def update_overlay_geometry(self):
         self.crop_overlay.setGeometry(self.canvas.rect())
         if hasattr(self.canvas, 'get_image_rect'):
@@ -1113,31 +1002,44 @@ class EditorPage(QWidget):
         else:
             self.crop_overlay.set_image_rect(self.canvas.rect())
 
+    def update_preview_resolution(self):
+        """
+        按画布当前缩放选择代理图分辨率：放大查看时换成更清晰的代理图，缩小时换回小图
+        只在裁剪/调节/滤镜页切换；涂鸦、马赛克等图层编辑期间保持当前底图不变
+        """
+        if self.engine.original_image is None: return
+        index = self.sub_tool_stack.currentIndex()
+        if index not in (0, 1, 2): return
+        h, w = self.engine.original_image.shape[:2]
+        if not self.engine.set_preview_size(max(h, w) * self.canvas.device_scale()): return
+        self.render_scheduler.request(include_crop=(index != 0))
+
+    def on_render_ready(self, img, scale, is_draft):
+        """后台渲染 (或草图) 完成"""
+        if is_draft:
+            self.canvas.show_draft(img, scale)
+        else:
+            self.canvas.set_image(img, scale)
+        if not self.crop_overlay.isHidden():
+            self.update_overlay_geometry()
+
     def on_crop_rect_change(self, norm_rect):
         x, y, w, h = norm_rect.getRect()
         self.engine.update_geo_param("crop_rect", (x, y, w, h))
 
     def on_rotate_angle_change(self, angle):
         self.engine.update_geo_param("rotate_angle", angle)
-        res = self.engine.render(use_preview=True, include_crop=False)
-        if res is not None:
-            self.canvas.set_image(res)
-            self.update_overlay_geometry()
+        self.render_scheduler.request(include_crop=False)
 
     def rotate_90_ccw(self):
         current = self.engine.geo_params["rotate_90"]
         self.engine.update_geo_param("rotate_90", current + 1)
-        res = self.engine.render(use_preview=True, include_crop=False)
-        if res is not None:
-            self.canvas.set_image(res)
-            self.update_overlay_geometry()
+        self.render_scheduler.request(include_crop=False)
 
     def flip_horizontal(self):
         current = self.engine.geo_params["flip_h"]
         self.engine.update_geo_param("flip_h", not current)
-        res = self.engine.render(use_preview=True, include_crop=False)
-        if res is not None:
-            self.canvas.set_image(res)
+        self.render_scheduler.request(include_crop=False)
 
     def set_aspect_ratio(self, ratio, btn_sender):
         for btn in self.ratio_btns: btn.setChecked(False)
@@ -1163,24 +1065,48 @@ class EditorPage(QWidget):
         for btn in self.filter_btns: btn.setChecked(False)
         btn_sender.setChecked(True)
         self.engine.update_filter(key)
-        res = self.engine.render(use_preview=True, include_crop=True)
-        if res is not None:
-            self.canvas.set_image(res)
+        self.render_scheduler.request(include_crop=True)
+
+    def import_cube_filter(self):
+        path, _ = QFileDialog.getOpenFileName(self, "导入滤镜", "", "3D LUT (*.cube)")
+        if not path: return
+        try:
+            key, title = load_cube_filter(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "错误", f"无法导入滤镜: {e}")
+            return
+        btn = IconButton("filter", title[:4], is_small=True)
+        btn.setFixedSize(72, 92)
+        btn.setToolTip(title)
+        btn.clicked.connect(lambda c, k=key, b=btn: self.switch_filter(k, b))
+        self.filter_layout.insertWidget(self.filter_layout.indexOf(self.btn_import_lut), btn)
+        self.filter_btns.append(btn)
+        self.filter_btn_map[key] = btn
+        self.switch_filter(key, btn)
+        self.refresh_filter_previews()
+
+    def refresh_filter_previews(self):
+        """按当前调节参数重新生成滤镜缩略图 (已缓存的立即显示，其余在后台逐个完成)"""
+        self.filter_previewer.refresh(self.engine, list(self.filter_btn_map))
+
+    def on_filter_thumbnail(self, key, thumb):
+        btn = self.filter_btn_map.get(key)
+        if btn is None: return
+        btn.set_thumbnail(to_pixmap(thumb))
 
     def on_slider_change(self, value):
         self.engine.update_param(self.current_adjust_key, value)
-        res = self.engine.render(use_preview=True, include_crop=True)
-        if res is not None:
-            self.canvas.set_image(res)
+        self.render_scheduler.request(include_crop=True)
 
     def open_image(self):
         path, _ = QFileDialog.getOpenFileName(self, "打开图片", "", "Images (*.jpg *.png *.jpeg *.bmp)")
         if path:
             img = self.engine.load_image(path)
             if img is not None:
-                self.canvas.set_image(img)
+                self.canvas.set_image(img, self.engine.preview_scale)
                 self.canvas.fit_in_view()
                 self.update_overlay_geometry()
+                self.update_history_buttons()
                 if hasattr(self, 'adjust_btns') and len(self.adjust_btns) > 0:
                     self.switch_category(1, self.cat_btns[1])
                     self.switch_adjust_tool("brightness", self.adjust_btns[0])
@@ -1192,9 +1118,10 @@ class EditorPage(QWidget):
         img = self.engine.load_image(file_path)
         
         if img is not None:
-            self.canvas.set_image(img)
+            self.canvas.set_image(img, self.engine.preview_scale)
             self.canvas.fit_in_view()
             self.update_overlay_geometry()
+            self.update_history_buttons()
             
             # 重置工具栏状态到默认
             if hasattr(self, 'adjust_btns') and len(self.adjust_btns) > 0:
@@ -0,0 +1,71 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+from .filters import apply_filter
+
+
+class FilterPreviewer(QObject):
+    """
+    滤镜栏的实时缩略图：按实际渲染管线的顺序，先在约 THUMB_SIZE 的小图上算出滤镜之前的结果 (调节)，
+    每个滤镜在线程池中各算一张，再补上几何变换、裁剪和图层操作，算完一张发一次信号，按钮逐个更新
+    结果按 (底图, 调节参数, 几何参数, 图层操作) 缓存，参数不变时再次打开滤镜栏不重新计算
+    """
+    # (滤镜名, (H, W, 3) uint8 RGB 缩略图)
+    thumbnail_ready = pyqtSignal(str, object)
+    # 工作线程 -> 界面线程：(批次编号, 滤镜名, 缩略图)
+    _finished = pyqtSignal(int, str, object)
+
+    THUMB_SIZE = 128
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # OpenCV 运算会释放 GIL，多个滤镜可以真正并行
+        self._executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                            thread_name_prefix="filter-preview")
+        self._generation = 0
+        self._cache_key = None
+        self._cache_src = None
+        self._cache = {}
+        self._finished.connect(self._on_finished)
+
+    def refresh(self, engine, filter_names):
+        """按引擎当前状态为 filter_names 生成缩略图 (已缓存的立即发出)"""
+        self._generation += 1
+        if engine.preview_image is None: return
+
+        key = (tuple(sorted(engine.params.items())), tuple(sorted(engine.geo_params.items())), engine.edits.ops)
+        if key != self._cache_key or engine.preview_image is not self._cache_src:
+            self._cache_key = key
+            self._cache_src = engine.preview_image
+            self._cache = {}
+
+        pending = []
+        for name in filter_names:
+            if name in self._cache:
+                self.thumbnail_ready.emit(name, self._cache[name])
+            else:
+                pending.append(name)
+        if not pending: return
+
+        # 滤镜之前的底图只算一次，各滤镜在它上面并行计算
+        snap = engine.snapshot()
+        snap.current_filter = "original"
+        base, _ = snap.render_small(self.THUMB_SIZE, include_crop=True, stop="filter")
+        gen = self._generation
+        for name in pending:
+            # 每个任务一份快照 (渲染时会写入引擎的状态)
+            self._executor.submit(self._work, gen, snap.snapshot(), base, name)
+
+    def _work(self, gen, snap, base, name):
+        if gen != self._generation: return
+        try:
+            thumb = snap.render_from(apply_filter(base, name), "filter")
+        except Exception as e:
+            print(f"滤镜缩略图失败 {name}: {e}")
+            return
+        self._finished.emit(gen, name, thumb)
+
+    def _on_finished(self, gen, name, thumb):
+        if gen != self._generation: return
+        self._cache[name] = thumb
+        self.thumbnail_ready.emit(name, thumb)
@@ -1,5 +1,27 @@
 import cv2
 import numpy as np
+import os
+import hashlib
+from functools import lru_cache
+from src.utils.fast_blur import gaussian_blur
+from .point_ops import compile_lut
+from .lut3d import bake_cached, read_cube
+
+# 纯逐像素、逐通道的调色滤镜 (曲线 / 通道增益 / 常量叠加)：整条运算可以折叠成一张查找表
+POINT_FILTERS = frozenset([
+    "f_dawn", "f_blue", "f_cool", "f_pink", "f_blossom", "f_sweet",
+    "f_caramel", "f_valencia", "f_memory",
+])
+
+# 跨通道的逐像素调色滤镜 (HSV 饱和度、叠加混合等)：烘焙成三维 LUT，任何滤镜都只需一次查表
+# f_mono / f_classic 本身就是一次矩阵运算，直接计算更快；去雾 / 柔光需要邻域信息，不能烘焙
+LUT3D_FILTERS = frozenset([
+    "f_individuality", "f_pure", "f_metallic", "f_impact", "f_halo", "f_moody",
+    "f_childhood", "f_handsome", "f_sentimental", "f_vintage",
+])
+
+# 导入的 .cube 滤镜 {滤镜名: Lut3D}
+_cube_filters = {}
 
 def _adjust_saturation(img, saturation_scale):
     """辅助函数：调整饱和度"""
@@ -23,12 +45,56 @@ def _apply_vignette(img, strength=0.5):
     
     return np.clip(img * mask, 0, 255).astype(np.uint8)
 
+def _vintage_color(img):
+    """辅助函数：复古滤镜的调色部分 (不含暗角)"""
+    res = _adjust_saturation(img, 0.8)
+    # 提升红色和绿色 (变黄)
+    lut_r = np.interp(np.arange(256), [0, 255], [20, 235]).astype(np.uint8)
+    lut_b = np.interp(np.arange(256), [0, 255], [0, 215]).astype(np.uint8) # 蓝色压暗
+    res[:,:,0] = cv2.LUT(res[:,:,0], lut_r)
+    res[:,:,2] = cv2.LUT(res[:,:,2], lut_b)
+    return res
+
 def _apply_curve(img, x_points, y_points):
     """辅助函数：模拟曲线调整 (使用LUT)"""
     # 创建查找表
     lut = np.interp(np.arange(256), x_points, y_points).astype(np.uint8)
     return cv2.LUT(img, lut)
 
+@lru_cache(maxsize=None)
+def filter_lut(filter_name):
+    """POINT_FILTERS 中滤镜的 (256, 1, 3) 查找表，与逐步运算结果逐像素一致"""
+    lut = compile_lut(lambda x: _apply_filter_ops(x, filter_name))
+    lut.setflags(write=False)
+    return lut
+
+@lru_cache(maxsize=None)
+def _source_version():
+    """本文件内容的摘要：滤镜实现改动后磁盘上的 LUT 缓存自动失效"""
+    with open(__file__, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+@lru_cache(maxsize=None)
+def filter_lut3d(filter_name):
+    """LUT3D_FILTERS 中滤镜的三维 LUT (首次使用时烘焙并缓存到磁盘)"""
+    if filter_name == "f_vintage":
+        # 复古的暗角与位置有关，只烘焙调色部分
+        fn = _vintage_color
+    else:
+        fn = lambda x: _apply_filter_ops(x, filter_name)
+    return bake_cached(filter_name, fn, version=_source_version())
+
+def load_cube_filter(path):
+    """
+    导入 .cube 文件作为滤镜
+    :return: (滤镜名, 显示标题)；文件无效时抛出 ValueError / OSError
+    """
+    lut = read_cube(path)
+    # 每次导入生成新名字，重新导入同名文件不会命中旧的渲染缓存
+    name = f"cube_{len(_cube_filters)}_{os.path.splitext(os.path.basename(path))[0]}"
+    _cube_filters[name] = lut
+    return name, lut.title
+
 def apply_filter(img, filter_name):
     """
     应用滤镜效果
@@ -38,6 +104,19 @@ def apply_filter(img, filter_name):
     """
     if filter_name == "original" or filter_name == "f_original":
         return img
+    # 纯调色滤镜：一次查表代替多次整图运算
+    if filter_name in POINT_FILTERS:
+        return cv2.LUT(img, filter_lut(filter_name))
+    if filter_name in _cube_filters:
+        return _cube_filters[filter_name].apply(img)
+    if filter_name == "f_vintage":
+        return _apply_vignette(filter_lut3d(filter_name).apply(img), 0.6)
+    if filter_name in LUT3D_FILTERS:
+        return filter_lut3d(filter_name).apply(img)
+    return _apply_filter_ops(img, filter_name)
+
+def _apply_filter_ops(img, filter_name):
+    """各滤镜的逐步实现"""
 
     # ---------------------------------------------------------
     # 1. 特殊算法类滤镜 (不基于简单的 RGB 调整)
@@ -96,13 +175,7 @@ def apply_filter(img, filter_name):
 
     elif filter_name == "f_vintage":
         # 【复古】：暖色 + 暗角 + 降低对比度
-        res = _adjust_saturation(img, 0.8)
-        # 提升红色和绿色 (变黄)
-        lut_r = np.interp(np.arange(256), [0, 255], [20, 235]).astype(np.uint8)
-        lut_b = np.interp(np.arange(256), [0, 255], [0, 215]).astype(np.uint8) # 蓝色压暗
-        res[:,:,0] = cv2.LUT(res[:,:,0], lut_r)
-        res[:,:,2] = cv2.LUT(res[:,:,2], lut_b)
-        return _apply_vignette(res, 0.6)
+        return _apply_vignette(_vintage_color(img), 0.6)
 
     # ---------------------------------------------------------
     # 2. 调色类滤镜 (基于 LUT 曲线和通道混合)
@@ -147,8 +220,8 @@ def apply_filter(img, filter_name):
 
     elif filter_name in ["f_soft", "f_fair", "f_netural"]:
         # 【柔和/白皙】：模拟柔光镜 (Glow)
-        # 高斯模糊后与原图混合
-        blur = cv2.GaussianBlur(res, (0, 0), 5)
+        # 高斯模糊后与原图混合 (sigma 5 对应 31 的核，刚过近似阈值，滤镜效果要求与原来逐像素一致，用精确模糊)
+        blur = gaussian_blur(res, 0, 5, method="exact")
         res = cv2.addWeighted(res, 0.7, blur, 0.3, 10)
         # 稍微提亮
         res = _adjust_saturation(res, 0.9)
@@ -4,6 +4,30 @@ from PyQt6.QtCore import Qt, QPoint, QRect, QRectF, QPointF, QSize
 import math
 import os
 
+def paint_label(painter, image, x, y, width, height, angle, text, font, color, has_shadow):
+    """绘制标签的底图和文字 (image 为 QPixmap 或 QImage)，绕标签中心旋转 angle 度"""
+    painter.save()
+    cx = x + width / 2
+    cy = y + height / 2
+    painter.translate(cx, cy)
+    painter.rotate(angle)
+    painter.translate(-cx, -cy)
+
+    target_rect = QRectF(x, y, width, height)
+    if isinstance(image, QImage):
+        painter.drawImage(target_rect.toRect(), image)
+    else:
+        painter.drawPixmap(target_rect.toRect(), image)
+
+    painter.setFont(font)
+    if has_shadow:
+        # 简单的阴影效果
+        painter.setPen(QPen(QColor(0, 0, 0, 100)))
+        painter.drawText(target_rect.translated(2, 2), Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap, text)
+    painter.setPen(QPen(color))
+    painter.drawText(target_rect, Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap, text)
+    painter.restore()
+
 class LabelItem:
     """单个标签的数据结构"""
     def __init__(self, image_path, center_pos):
@@ -119,44 +143,30 @@ class LabelOverlay(QWidget):
         return img
 
     def draw_item(self, painter, item, draw_handles=True):
-        painter.save()
-        
-        # 变换坐标系到 item 中心
-        cx = item.x + item.width / 2
-        cy = item.y + item.height / 2
-        painter.translate(cx, cy)
-        painter.rotate(item.angle)
-        painter.translate(-cx, -cy)
+        # 1. 绘制背景图和文字
+        paint_label(painter, item.pixmap, item.x, item.y, item.width, item.height, item.angle,
+                    item.text, item.font, item.text_color, item.has_shadow)
         
-        # 1. 绘制背景图
-        target_rect = QRectF(item.x, item.y, item.width, item.height)
-        painter.drawPixmap(target_rect.toRect(), item.pixmap)
-        
-        # 2. 绘制文字
-        painter.setFont(item.font)
-        pen = QPen(item.text_color)
-        if item.has_shadow:
-            # 简单的阴影效果
-            shadow_pen = QPen(QColor(0,0,0, 100))
-            painter.setPen(shadow_pen)
-            painter.drawText(target_rect.translated(2, 2), Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap, item.text)
-        
-        painter.setPen(pen)
-        painter.drawText(target_rect, Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap, item.text)
-        
-        # 3. 绘制选中框和手柄
+        # 2. 绘制选中框和手柄
         if item.is_selected and draw_handles:
+            painter.save()
+            cx = item.x + item.width / 2
+            cy = item.y + item.height / 2
+            painter.translate(cx, cy)
+            painter.rotate(item.angle)
+            painter.translate(-cx, -cy)
+
             pen = QPen(QColor("#0984e3"), 2, Qt.PenStyle.DashLine)
             painter.setPen(pen)
             painter.setBrush(Qt.BrushStyle.NoBrush)
-            painter.drawRect(target_rect)
+            painter.drawRect(QRectF(item.x, item.y, item.width, item.height))
             
             # 左上角删除
             painter.drawPixmap(int(item.x - 10), int(item.y - 10), self.icon_delete)
             # 右下角缩放
             painter.drawPixmap(int(item.x + item.width - 10), int(item.y + item.height - 10), self.icon_resize)
             
-        painter.restore()
+            painter.restore()
 
     def paintEvent(self, event):
         painter = QPainter(self)
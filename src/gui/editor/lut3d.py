@@ -0,0 +1,137 @@
+import os
+import hashlib
+import cv2
+import numpy as np
+
+# 内置滤镜烘焙成 33x33x33 的颜色格点 (与常见 .cube 文件的精度相同)
+LUT_SIZE = 33
+# 烘焙结果的磁盘缓存目录 (相对项目根目录，与 resources/icons 等一致)
+LUT_CACHE_DIR = os.path.join("resources", "luts")
+
+
+def lattice_nodes(size=LUT_SIZE):
+    """每个通道的格点取值 (0~255 均分后取整，保证格点颜色能用 uint8 精确表示)"""
+    return np.round(np.linspace(0, 255, size)).astype(np.float32)
+
+
+class Lut3D:
+    """
+    三维颜色查找表：table[r, g, b] 为格点颜色的输出 (0~255 float32)
+    三线性插值 = 先沿 R 线性插值，再在 G/B 平面双线性插值。
+    R 只有 256 种取值，第一步对每个 R 预先算好，得到 256 张 G/B 切片，
+    查表时只剩一次 cv2.remap (双线性)，结果与直接三线性插值相同 (只差 uint8 舍入)
+    """
+    def __init__(self, table, nodes=None, title=""):
+        size = table.shape[0]
+        self.size = size
+        self.title = title
+        self.table = np.ascontiguousarray(table, dtype=np.float32)
+        nodes = lattice_nodes(size) if nodes is None else np.asarray(nodes, np.float32)
+
+        # 每个 uint8 取值在格点间的位置 (格点可以不均匀，例如取整后的格点或 .cube 的 DOMAIN)
+        v = np.arange(256, dtype=np.float32)
+        i0 = np.clip(np.searchsorted(nodes, v, side="right") - 1, 0, size - 2)
+        step = np.maximum(nodes[i0 + 1] - nodes[i0], 1e-6)
+        t = np.clip((v - nodes[i0]) / step, 0.0, 1.0).astype(np.float32)
+        self._pos = (i0 + t).astype(np.float32)              # G/B: 格点内的连续坐标
+        self._r_col = (np.arange(256) * size).astype(np.float32)  # R: 所在切片的列偏移
+
+        # 沿 R 预插值：(256, size, size, 3)，再排成 remap 用的二维图 (行 = G，列 = R * size + B)
+        t = t[:, None, None, None]
+        slices = self.table[i0] * (1.0 - t) + self.table[i0 + 1] * t
+        self._plane = np.ascontiguousarray(
+            np.clip(slices + 0.5, 0, 255).astype(np.uint8).transpose(1, 0, 2, 3).reshape(size, 256 * size, 3))
+
+    def apply(self, img):
+        """
+        :param img: (H, W, 3) uint8 RGB
+        :return: (H, W, 3) uint8 RGB
+        """
+        r, g, b = cv2.split(np.ascontiguousarray(img))
+        map_y = cv2.LUT(g, self._pos)
+        map_x = cv2.LUT(b, self._pos)
+        map_x += cv2.LUT(r, self._r_col)
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        return cv2.remap(self._plane, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def bake(fn, size=LUT_SIZE, title=""):
+    """
+    把逐像素的颜色运算 fn(uint8 RGB 图像) -> uint8 RGB 图像 烘焙成 Lut3D
+    fn 不能依赖像素位置或邻域 (模糊、暗角等空间运算不能烘焙)
+    """
+    nodes = lattice_nodes(size).astype(np.uint8)
+    r, g, b = np.meshgrid(nodes, nodes, nodes, indexing="ij")
+    grid = np.stack([r, g, b], axis=-1).reshape(size * size, size, 3)
+    out = fn(np.ascontiguousarray(grid))
+    return Lut3D(out.reshape(size, size, size, 3).astype(np.float32), title=title)
+
+
+def bake_cached(name, fn, version="", size=LUT_SIZE, cache_dir=LUT_CACHE_DIR):
+    """
+    带磁盘缓存的 bake：缓存文件名包含 version (滤镜实现的摘要)，实现变化后自动重新烘焙
+    缓存目录不可写时只在内存中使用
+    """
+    digest = hashlib.md5(f"{name}|{size}|{version}".encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"{name}_{size}_{digest}.npy")
+    if os.path.exists(path):
+        try:
+            table = np.load(path)
+            if table.shape == (size, size, size, 3):
+                return Lut3D(table, title=name)
+        except (OSError, ValueError):
+            pass
+
+    lut = bake(fn, size, title=name)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, lut.table)
+    except OSError as e:
+        print(f"无法写入 LUT 缓存: {e}")
+    return lut
+
+
+def read_cube(path):
+    """
+    读取 .cube 格式的三维 LUT (Adobe / Resolve 通用格式，支持中文路径)
+    数据按 R 变化最快的顺序排列，取值范围由 DOMAIN_MIN / DOMAIN_MAX 给出 (缺省 0~1)
+    """
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.read().splitlines()
+
+    size, title = None, os.path.splitext(os.path.basename(path))[0]
+    domain_min, domain_max = np.zeros(3, np.float32), np.ones(3, np.float32)
+    rows = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        key = line.split(None, 1)[0].upper()
+        if key == "TITLE":
+            title = line.split(None, 1)[1].strip().strip('"') if " " in line else title
+        elif key == "LUT_3D_SIZE":
+            size = int(line.split()[1])
+        elif key == "DOMAIN_MIN":
+            domain_min = np.array(line.split()[1:4], np.float32)
+        elif key == "DOMAIN_MAX":
+            domain_max = np.array(line.split()[1:4], np.float32)
+        elif key == "LUT_1D_SIZE":
+            raise ValueError("不支持一维 LUT (LUT_1D_SIZE)")
+        elif key[0].isdigit() or key[0] in "-.":
+            rows.append(line.split()[:3])
+
+    if size is None or size < 2:
+        raise ValueError(f"缺少 LUT_3D_SIZE: {path}")
+    if len(rows) != size ** 3:
+        raise ValueError(f"LUT 数据行数 {len(rows)} 与尺寸 {size} 不符: {path}")
+
+    data = np.array(rows, np.float32)
+    # 文件中 R 变化最快，reshape 后索引为 [b, g, r]，转成 [r, g, b]
+    table = data.reshape(size, size, size, 3).transpose(2, 1, 0, 3)
+    table = np.clip(table * 255.0, 0, 255)
+
+    # 输入范围：各通道格点映射到 0~255 (三个通道不同时取 R 通道的范围)
+    if not np.allclose(domain_min, domain_min[0]) or not np.allclose(domain_max, domain_max[0]):
+        print(f"LUT 各通道 DOMAIN 不同，按 R 通道处理: {path}")
+    nodes = np.linspace(domain_min[0], domain_max[0], size) * 255.0
+    return Lut3D(table, nodes=nodes, title=title)
@@ -1,6 +1,7 @@
 from PyQt6.QtWidgets import QWidget
 from PyQt6.QtGui import QPainter, QPen, QColor, QImage, QPixmap
 from PyQt6.QtCore import Qt, QPoint, QRect, QRectF
+import numpy as np
 
 class MosaicOverlay(QWidget):
     def __init__(self, parent=None):
@@ -63,6 +64,15 @@ class MosaicOverlay(QWidget):
         """获取最终的遮罩图 (QImage)"""
         return self.mask_image
 
+    def get_mask_array(self):
+        """遮罩的 Alpha 通道 (H, W) uint8，255 = 显示马赛克"""
+        if self.mask_image.isNull(): return None
+        alpha = self.mask_image.convertToFormat(QImage.Format.Format_Alpha8)
+        h, w = alpha.height(), alpha.width()
+        ptr = alpha.constBits()
+        ptr.setsize(alpha.sizeInBytes())
+        return np.frombuffer(ptr, np.uint8).reshape(h, alpha.bytesPerLine())[:, :w].copy()
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.is_drawing = True
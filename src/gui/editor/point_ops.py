@@ -0,0 +1,47 @@
+from functools import lru_cache
+import cv2
+import numpy as np
+
+# 三个通道都是 0~255 的斜坡图：对它执行一串逐像素、逐通道的运算，结果就是这串运算的查找表
+_RAMP = np.repeat(np.arange(256, dtype=np.uint8)[:, None, None], 3, axis=2)
+_RAMP.setflags(write=False)
+
+
+def compile_lut(*ops):
+    """
+    把连续的点运算 (逐像素、逐通道、uint8 -> uint8) 折叠成一张 (256, 1, 3) 查找表
+    每个运算按原实现作用在斜坡图上，舍入/截断方式完全相同，因此查表结果与逐个运算逐像素一致
+    """
+    lut = _RAMP
+    for op in ops:
+        lut = op(lut)
+    return np.ascontiguousarray(lut, dtype=np.uint8)
+
+
+def tone(img, brightness, contrast):
+    """亮度 / 对比度 (与 ImageEditorEngine 原实现相同的 float32 运算)"""
+    img = img.astype(np.float32)
+    if brightness != 0:
+        img += brightness
+    if contrast != 0:
+        # 使用 (x - 127.5) * f + 127.5 公式，保持中间灰度不变
+        f = 1.0 + contrast / 100.0
+        img = (img - 127.5) * f + 127.5
+    # 转 uint8 之前必须 clip，否则负数或 >255 的数会回绕
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=64)
+def tone_lut(brightness, contrast):
+    """亮度/对比度的查找表，按参数缓存"""
+    lut = compile_lut(lambda x: tone(x, brightness, contrast))
+    lut.setflags(write=False)
+    return lut
+
+
+def chain_luts(*luts):
+    """查找表串联：先查第一张，再查下一张 (等价于依次执行对应的点运算)"""
+    out = luts[0]
+    for lut in luts[1:]:
+        out = cv2.LUT(out, lut)
+    return out
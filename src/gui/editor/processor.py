@@ -1,12 +1,24 @@
+import copy
 import cv2
 import numpy as np
 from PyQt6.QtGui import QImage
-from .filters import apply_filter
+from .filters import apply_filter, filter_lut, POINT_FILTERS
+from .point_ops import tone_lut, chain_luts
+from .edit_stack import EditStack
+from src.utils.fast_blur import gaussian_blur
 
 class ImageEditorEngine:
+    # 尚不知道画布大小时，预览图最长边的默认值
+    PREVIEW_MAX_DIM = 1600
+    # 拖动滑块时先显示的草图最长边 (精确预览在后台渲染)
+    DRAFT_MAX_DIM = 480
+
     def __init__(self):
-        self.original_image = None # 原始全尺寸图 (numpy array)
-        self.preview_image = None  # 用于显示的图 (可能被缩放)
+        self.original_image = None # 原始全尺寸图 (numpy array)，只在保存时完整渲染
+        self.preview_image = None  # 用于显示的代理图 (原图按 1/2^k 缩小到接近屏幕显示尺寸)
+        self.preview_factor = 1.0  # 代理图相对原图的缩放比例 (1/2^k)
+        self._small = {}           # 草图/缩略图 {最长边: (代理图, 小图, 小图相对原图的比例)}，按需生成
+        self._preview_target = self.PREVIEW_MAX_DIM
         
         # 调节参数
         self.params = {
@@ -24,39 +36,83 @@ class ImageEditorEngine:
         
         self.current_filter = "original"
 
+        # 涂鸦/马赛克/标签/贴纸/相框的操作记录，渲染时叠加在裁剪之后 (原图不被修改，可撤销)
+        self.edits = EditStack()
+
+        # render 各阶段的缓存 {use_preview: {阶段名: (输入, 参数, 输出)}}
+        self._stage_cache = {}
+        # 当前渲染的图相对原图的比例，与像素尺寸有关的参数 (锐化半径) 按它缩放
+        self._render_factor = 1.0
+        # 当前渲染是否保存图层操作的中间快照 (只有代理图保存)
+        self._keep_snapshots = False
+        # 当前渲染的图在几何变换之前的尺寸 (w, h)，图层操作按它换算坐标
+        self._source_size = (1, 1)
+
     def load_image(self, path):
         # 读取图片，处理中文路径
         img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
         if img is None: return None
         
+        # 保留全尺寸原图 (不再限制 2000px)，交互时只处理代理图，保存时才按原图渲染
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # 限制最大尺寸以保证性能 (例如 2000px)
-        h, w = img.shape[:2]
-        max_dim = 2000
-        if max(h, w) > max_dim:
-            scale = max_dim / max(h, w)
-            new_w = int(w * scale)
-            new_h = int(h * scale)
-            
-            # 【关键修复1】确保宽度是 4 的倍数
-            # QImage 默认要求每行字节数 4 字节对齐，如果宽度不对齐，显示时会花屏/倾斜
-            new_w = (new_w // 4) * 4
-            if new_w <= 0: new_w = 4
-            
-            img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-            
-        self.original_image = img
-        self.preview_image = img.copy()
+        self.set_image(img)
         
         # 重置参数
         for k in self.params: self.params[k] = 0
         self.geo_params = {"rotate_angle": 0, "rotate_90": 0, "flip_h": False, "crop_rect": None}
         self.current_filter = "original"
+        self.edits.clear()
         
         return self.preview_image
 
+    def set_image(self, img):
+        """替换原图 (例如烘焙相框后)，并按当前显示尺寸重新生成代理图"""
+        self.original_image = img
+        self.preview_image = None
+        self.set_preview_size(self._preview_target)
+
+    def set_preview_size(self, max_dim):
+        """
+        按显示需要的最长边 (设备像素) 选择代理图分辨率
+        代理图取原图的 1/2^k，k 取满足最长边不小于 max_dim 的最大值；
+        缩放在同一级别内变化时不重新生成，避免频繁缩放原图
+        :return: 代理图是否发生变化
+        """
+        self._preview_target = max_dim
+        if self.original_image is None: return False
+        h, w = self.original_image.shape[:2]
+        level = 0
+        while max(h, w) / 2 ** (level + 1) >= max_dim and min(h, w) / 2 ** (level + 1) >= 1:
+            level += 1
+        factor = 1.0 / 2 ** level
+        if self.preview_image is not None and factor == self.preview_factor:
+            return False
+
+        self.preview_factor = factor
+        if level == 0:
+            # 原图本身就不大：直接使用原图 (渲染不会修改输入)
+            self.preview_image = self.original_image
+        else:
+            size = (max(1, round(w * factor)), max(1, round(h * factor)))
+            self.preview_image = cv2.resize(self.original_image, size, interpolation=cv2.INTER_AREA)
+        return True
+
+    def snapshot(self):
+        """
+        当前参数的快照，供后台线程渲染 (界面线程随后修改参数不影响正在进行的渲染)
+        图像和阶段缓存与本对象共享，后台渲染的结果界面线程也能直接复用
+        """
+        snap = copy.copy(self)
+        snap.params = dict(self.params)
+        snap.geo_params = dict(self.geo_params)
+        snap.edits = self.edits.copy()
+        return snap
+
+    @property
+    def preview_scale(self):
+        """代理图一个像素对应原图的像素数 (显示时按此比例放大，使画布坐标与原图一致)"""
+        return 1.0 / self.preview_factor
+
     def update_param(self, key, value):
         if key in self.params:
             self.params[key] = value
@@ -68,95 +124,188 @@ class ImageEditorEngine:
     def update_filter(self, filter_name):
         self.current_filter = filter_name
 
-    def render(self, use_preview=True, include_crop=True):
+    # 渲染管线的各个阶段：(名称, 该阶段依赖的参数, 处理函数)
+    # 每个阶段缓存 (输入, 参数, 输出)，输入对象和参数都没变时直接复用上次的输出，
+    # 例如拖动锐化滑块只会从锐化阶段开始重算，调整裁剪框只重新切片
+    def _stages(self):
+        p, g = self.params, self.geo_params
+        stages = [
+            ("tone", (p["brightness"], p["contrast"]), self._stage_tone),
+            ("color", (p["saturation"], p["hue"]), self._stage_color),
+            ("light", (p["highlights"], p["shadows"]), self._stage_light),
+            ("sharpen", (p["sharpness"],), self._stage_sharpen),
+            ("filter", (self.current_filter,), self._stage_filter),
+            ("geometry", (g["rotate_90"] % 4, g["flip_h"], g["rotate_angle"]), self._stage_geometry),
+            ("crop", (g["crop_rect"],), self._stage_crop),
+            ("edits", self.edits.ops, self._stage_edits),
+        ]
+        # 中间的色彩/光影/锐化都不生效且滤镜是纯调色滤镜时，亮度对比度和滤镜都是点运算，
+        # 两张查找表串成一张，整图只查一次表
+        if (p["saturation"] == 0 and p["hue"] == 0 and p["highlights"] == 0 and p["shadows"] == 0
+                and p["sharpness"] <= 0 and self.current_filter in POINT_FILTERS):
+            stages[0] = ("tone", (p["brightness"], p["contrast"], self.current_filter), self._stage_tone_filter)
+            del stages[4]
+        return stages
+
+    def render(self, use_preview=True, include_crop=True, cancel=None):
         """
-        渲染图像处理管线
+        渲染图像处理管线 (逐阶段缓存)
         1. 基础调整 (亮度/对比度等)
         2. 滤镜
         3. 几何变换 (旋转/翻转)
         4. 裁剪 (可选)
+        5. 图层操作 (涂鸦/马赛克/标签/贴纸/相框，随裁剪一起可选)
+        :param cancel: 可选的无参函数，阶段之间返回 True 时放弃本次渲染并返回 None
         """
-        src = self.preview_image if use_preview and self.preview_image is not None else self.original_image
+        use_preview = use_preview and self.preview_image is not None
+        src = self.preview_image if use_preview else self.original_image
         if src is None: return None
+
+        # 只缓存代理图的各阶段结果；全尺寸渲染只在保存时进行，不长期占用多份原图大小的内存
+        cache = self._stage_cache.setdefault(use_preview, {}) if use_preview else {}
+        return self._run_stages(src, self.preview_factor if use_preview else 1.0, cache, include_crop, cancel,
+                                snapshots=use_preview)
+
+    def render_draft(self, include_crop=True):
+        """
+        在更小的草图上渲染 (拖动滑块时先显示，精确预览算完后替换)
+        :return: (图像, 图像一个像素对应的原图像素数)；代理图本身已足够小时返回 None
+        """
+        preview = self.preview_image
+        if preview is None or max(preview.shape[:2]) <= self.DRAFT_MAX_DIM: return None
+        return self.render_small(self.DRAFT_MAX_DIM, include_crop)
+
+    def render_small(self, max_dim, include_crop=True, stop=None):
+        """
+        在最长边为 max_dim 的缩小图上渲染 (草图、滤镜缩略图)，各尺寸的缩小图和阶段结果分别缓存
+        :param stop: 可选的阶段名，只渲染到该阶段之前 (之后的阶段用 render_from 补上)
+        :return: (图像, 图像一个像素对应的原图像素数)
+        """
+        preview = self.preview_image
+        if preview is None: return None
+        entry = self._small.get(max_dim)
+        if entry is None or entry[0] is not preview:
+            h, w = preview.shape[:2]
+            d = min(1.0, max_dim / max(h, w))
+            small = cv2.resize(preview, (max(1, round(w * d)), max(1, round(h * d))), interpolation=cv2.INTER_AREA)
+            entry = self._small[max_dim] = (preview, small, self.preview_factor * small.shape[1] / w)
+        _, small, factor = entry
+        img = self._run_stages(small, factor, self._stage_cache.setdefault(("small", max_dim), {}), include_crop, None,
+                               stop=stop)
+        return img, 1.0 / factor
+
+    def render_from(self, img, stage, include_crop=True):
+        """
+        把 img 当作 stage 阶段的输出，继续执行之后的各阶段 (不缓存)
+        例如滤镜缩略图：滤镜之前的底图只算一次，每个滤镜的结果再各自补上几何变换、裁剪和图层操作
+        """
+        return self._run_stages(img, self._render_factor, {}, include_crop, None, after=stage)
+
+    def _run_stages(self, src, factor, cache, include_crop, cancel, snapshots=False, after=None, stop=None):
+        self._render_factor = factor
+        self._keep_snapshots = snapshots
+        # 几何变换之前的阶段都不改变尺寸 (after 只用于几何变换之前的阶段)
+        self._source_size = (src.shape[1], src.shape[0])
+        stages = self._stages()
+        names = [name for name, _, _ in stages]
+        if stop is not None: stages = stages[:names.index(stop)]
+        if after is not None: stages = stages[names.index(after) + 1:]
+        img = src
+        for name, key, stage in stages:
+            # 裁剪模式显示未裁剪的全图，图层操作的坐标基于裁剪后的图，一起跳过
+            if name in ("crop", "edits") and not include_crop: continue
+            entry = cache.get(name)
+            if entry is not None and entry[0] is img and entry[1] == key:
+                img = entry[2]
+                continue
+            if cancel is not None and cancel(): return None
+            out = stage(img)
+            cache[name] = (img, key, out)
+            img = out
+
+        # 【关键修复3】确保返回连续内存数组，防止 QImage 显示异常
+        # 缓存的阶段结果不能交给调用方修改，始终返回副本
+        return np.array(img, order="C", copy=True)
+
+    def _stage_tone(self, img):
+        """亮度 / 对比度 (查找表，与 float32 逐像素计算结果一致，见 point_ops.tone)"""
+        if self.params["brightness"] == 0 and self.params["contrast"] == 0:
+            return img
+        return cv2.LUT(img, tone_lut(self.params["brightness"], self.params["contrast"]))
+
+    def _stage_tone_filter(self, img):
+        """亮度 / 对比度 + 纯调色滤镜，合并为一次查表"""
+        lut = filter_lut(self.current_filter)
+        if self.params["brightness"] != 0 or self.params["contrast"] != 0:
+            lut = chain_luts(tone_lut(self.params["brightness"], self.params["contrast"]), lut)
+        return cv2.LUT(img, lut)
+
+    def _stage_color(self, img):
+        """饱和度 & 色相 (合并在 HSV 空间处理)"""
+        if self.params["saturation"] == 0 and self.params["hue"] == 0:
+            return img
+        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV).astype(np.float32)
         
-        img = src.astype(np.float32)
+        # 色相
+        if self.params["hue"] != 0:
+            # OpenCV H 范围 0-180
+            hsv[:, :, 0] = (hsv[:, :, 0] + (self.params["hue"] / 2.0)) % 180
         
-        # 1. 基础调整
-        # 亮度
-        if self.params["brightness"] != 0:
-            img += self.params["brightness"]
-            
-        # 对比度
-        if self.params["contrast"] != 0:
-            # 使用 (x - 127.5) * f + 127.5 公式，保持中间灰度不变
-            f = 1.0 + self.params["contrast"] / 100.0
-            img = (img - 127.5) * f + 127.5
-
-        # 【关键修复】在转 uint8 之前必须 clip，否则负数或 >255 的数会回绕 (例如 -5 变成 251)
-        # 这会导致调节对比度时出现杂色噪点
-        img = np.clip(img, 0, 255).astype(np.uint8)
-
-        # 饱和度 & 色相 (合并在 HSV 空间处理)
-        if self.params["saturation"] != 0 or self.params["hue"] != 0:
-            hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV).astype(np.float32)
-            
-            # 色相
-            if self.params["hue"] != 0:
-                # OpenCV H 范围 0-180
-                hsv[:, :, 0] = (hsv[:, :, 0] + (self.params["hue"] / 2.0)) % 180
-            
-            # 饱和度
-            if self.params["saturation"] != 0:
-                scale = 1.0 + self.params["saturation"] / 100.0
-                hsv[:, :, 1] *= scale
-            
-            hsv = np.clip(hsv, 0, 255).astype(np.uint8)
-            img = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
-
-        # --- [新增] 高光 & 阴影处理 (LAB 空间) ---
-        if self.params["highlights"] != 0 or self.params["shadows"] != 0:
-            # 转换到 LAB 空间，L 通道代表亮度 (0-255)
-            lab = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
-            l, a, b = cv2.split(lab)
-            l = l.astype(np.float32)
-
-            # 阴影调节 (Shadows) - 针对暗部 (L < 128)
-            if self.params["shadows"] != 0:
-                # 创建掩膜：越暗的地方权重越大
-                mask = np.clip((128.0 - l) / 128.0, 0, 1.0)
-                # 调节亮度：shadows > 0 提亮阴影
-                l += self.params["shadows"] * mask * 0.6 # 0.6 为强度系数
-
-            # 高光调节 (Highlights) - 针对亮部 (L > 128)
-            if self.params["highlights"] != 0:
-                # 创建掩膜：越亮的地方权重越大
-                mask = np.clip((l - 128.0) / 128.0, 0, 1.0)
-                # 调节亮度：highlights < 0 压暗高光(恢复细节)
-                l += self.params["highlights"] * mask * 0.6
-
-            l = np.clip(l, 0, 255).astype(np.uint8)
-            lab = cv2.merge((l, a, b))
-            img = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
-        # ---------------------------------------
-
-        # 转回 float32 继续处理锐化
-        img = img.astype(np.float32)
+        # 饱和度
+        if self.params["saturation"] != 0:
+            scale = 1.0 + self.params["saturation"] / 100.0
+            hsv[:, :, 1] *= scale
+        
+        hsv = np.clip(hsv, 0, 255).astype(np.uint8)
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
+
+    def _stage_light(self, img):
+        """高光 & 阴影处理 (LAB 空间)"""
+        if self.params["highlights"] == 0 and self.params["shadows"] == 0:
+            return img
+        # 转换到 LAB 空间，L 通道代表亮度 (0-255)
+        lab = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
+        l, a, b = cv2.split(lab)
+        l = l.astype(np.float32)
+
+        # 阴影调节 (Shadows) - 针对暗部 (L < 128)
+        if self.params["shadows"] != 0:
+            # 创建掩膜：越暗的地方权重越大
+            mask = np.clip((128.0 - l) / 128.0, 0, 1.0)
+            # 调节亮度：shadows > 0 提亮阴影
+            l += self.params["shadows"] * mask * 0.6 # 0.6 为强度系数
 
+        # 高光调节 (Highlights) - 针对亮部 (L > 128)
+        if self.params["highlights"] != 0:
+            # 创建掩膜：越亮的地方权重越大
+            mask = np.clip((l - 128.0) / 128.0, 0, 1.0)
+            # 调节亮度：highlights < 0 压暗高光(恢复细节)
+            l += self.params["highlights"] * mask * 0.6
 
-        # 锐化 (USM)
-        if self.params["sharpness"] > 0:
-            blur = cv2.GaussianBlur(img, (0, 0), 3)
-            img = cv2.addWeighted(img, 1.5 + self.params["sharpness"]/100.0, blur, -0.5 - self.params["sharpness"]/100.0, 0)
+        l = np.clip(l, 0, 255).astype(np.uint8)
+        lab = cv2.merge((l, a, b))
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+
+    def _stage_sharpen(self, img):
+        """锐化 (USM)"""
+        if self.params["sharpness"] <= 0:
+            return img
+        img = img.astype(np.float32)
+        # 半径按原图像素定义，代理图上等比缩小，预览与导出效果一致
+        blur = gaussian_blur(img, 0, max(0.5, 3 * self._render_factor))
+        img = cv2.addWeighted(img, 1.5 + self.params["sharpness"]/100.0, blur, -0.5 - self.params["sharpness"]/100.0, 0)
 
         # 【关键修复2】处理完所有数值计算后，必须转回 uint8
         # 如果这里返回 float32，QImage 显示时就会全是噪点/花屏
-        img = np.clip(img, 0, 255).astype(np.uint8)
+        return np.clip(img, 0, 255).astype(np.uint8)
 
-        # 2. 滤镜
-        if self.current_filter != "original":
-            img = apply_filter(img, self.current_filter)
+    def _stage_filter(self, img):
+        if self.current_filter == "original":
+            return img
+        return apply_filter(img, self.current_filter)
 
-        # 3. 几何变换
+    def _stage_geometry(self, img):
+        """几何变换"""
         # 90度旋转
         rot90 = self.geo_params["rotate_90"] % 4
         if rot90 == 1: img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
@@ -174,165 +323,263 @@ class ImageEditorEngine:
             center = (w // 2, h // 2)
             M = cv2.getRotationMatrix2D(center, angle, 1.0)
             img = cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        return img
 
-        # 4. 裁剪
-        if include_crop and self.geo_params["crop_rect"]:
-            nx, ny, nw, nh = self.geo_params["crop_rect"]
-            h, w = img.shape[:2]
-            x, y = int(nx * w), int(ny * h)
-            cw, ch = int(nw * w), int(nh * h)
-            
-            # 边界检查
-            x = max(0, x)
-            y = max(0, y)
-            cw = min(w - x, cw)
-            ch = min(h - y, ch)
-            
-            if cw > 0 and ch > 0:
-                img = img[y:y+ch, x:x+cw]
+    def _stage_crop(self, img):
+        """裁剪 (只切片，不复制)"""
+        box = self._crop_box(img.shape[1], img.shape[0])
+        if box is None:
+            return img
+        x, y, cw, ch = box
+        return img[y:y+ch, x:x+cw]
 
-        # 【关键修复3】确保返回连续内存数组，防止 QImage 显示异常
-        return np.ascontiguousarray(img)
+    def _crop_box(self, w, h):
+        """裁剪框在 (w, h) 图像上的像素区域 (x, y, w, h)，不裁剪时为 None"""
+        if not self.geo_params["crop_rect"]:
+            return None
+        nx, ny, nw, nh = self.geo_params["crop_rect"]
+        x, y = int(nx * w), int(ny * h)
+        cw, ch = int(nw * w), int(nh * h)
+        
+        # 边界检查
+        x = max(0, x)
+        y = max(0, y)
+        cw = min(w - x, cw)
+        ch = min(h - y, ch)
+        
+        if cw > 0 and ch > 0:
+            return x, y, cw, ch
+        return None
 
-    def apply_doodle_layer(self, doodle_pixmap, current_display_img):
+    def source_view(self, size):
         """
-        将涂鸦层 (QPixmap) 合并到当前图像 (numpy array)
-        :param doodle_pixmap: 涂鸦层
-        :param current_display_img: 当前显示的图像 (numpy RGB)
-        :return: 合并后的图像 (numpy RGB)
+        图层操作的源坐标 (几何变换前的图像，归一化到 0~1) -> 几何变换、裁剪后图像像素坐标的 3x3 矩阵
+        与 _stage_geometry / _stage_crop 逐步对应；像素坐标以像素边缘为原点 (像素 i 覆盖 [i, i+1))，与 QPainter 一致
+        :param size: 几何变换前的图像尺寸 (w, h)
+        :return: (矩阵, 裁剪后的尺寸 (w, h))
         """
-        if doodle_pixmap.isNull(): return current_display_img
-        
-        # 1. QPixmap -> QImage -> numpy
-        # 修复：使用 PyQt6 枚举 QImage.Format.Format_RGBA8888
-        qimg = doodle_pixmap.toImage().convertToFormat(QImage.Format.Format_RGBA8888)
-        
-        w, h = qimg.width(), qimg.height()
-        ptr = qimg.bits()
-        ptr.setsize(h * w * 4)
-        doodle_arr = np.frombuffer(ptr, np.uint8).reshape((h, w, 4))
-        
-        # 2. 调整大小以匹配目标图像 (如果需要)
-        th, tw = current_display_img.shape[:2]
-        if (h, w) != (th, tw):
-            doodle_arr = cv2.resize(doodle_arr, (tw, th), interpolation=cv2.INTER_LINEAR)
-            
-        # 3. Alpha 混合
-        # 分离通道
-        r, g, b, a = cv2.split(doodle_arr)
-        foreground = cv2.merge((r, g, b)) 
-        alpha = a.astype(float) / 255.0
-        alpha = np.expand_dims(alpha, axis=2)
-        
-        background = current_display_img.astype(float)
-        foreground = foreground.astype(float)
-        
-        # 混合: out = fg * alpha + bg * (1 - alpha)
-        out = foreground * alpha + background * (1.0 - alpha)
-        
-        return np.clip(out, 0, 255).astype(np.uint8)
-    def generate_mosaic_image(self, img, style="pixel"):
+        w, h = size
+        m = np.diag([float(w), float(h), 1.0])
+        rot90 = self.geo_params["rotate_90"] % 4
+        if rot90 == 1:   # 逆时针
+            m, (w, h) = np.array([[0, 1, 0], [-1, 0, w], [0, 0, 1]]) @ m, (h, w)
+        elif rot90 == 2:
+            m = np.array([[-1, 0, w], [0, -1, h], [0, 0, 1]]) @ m
+        elif rot90 == 3: # 顺时针
+            m, (w, h) = np.array([[0, -1, h], [1, 0, 0], [0, 0, 1]]) @ m, (h, w)
+
+        if self.geo_params["flip_h"]:
+            m = np.array([[-1, 0, w], [0, 1, 0], [0, 0, 1]]) @ m
+
+        angle = self.geo_params["rotate_angle"]
+        if angle != 0:
+            # getRotationMatrix2D 以像素中心为原点，换算到像素边缘
+            r = np.vstack((cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0), (0, 0, 1)))
+            half = np.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]])
+            m = half @ r @ np.linalg.inv(half) @ m
+
+        box = self._crop_box(w, h)
+        if box is not None:
+            x, y, w, h = box
+            m = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]]) @ m
+        return m, (w, h)
+
+    def overlay_transform(self, size):
+        """
+        图层工具覆盖层 (尺寸 size，显示当前代理图的渲染结果) 的坐标 -> 源坐标的 3x3 矩阵，
+        新的图层操作按它记录，之后再旋转、翻转或裁剪时跟着图像内容变换
         """
-        生成全图的马赛克效果
+        h, w = self.preview_image.shape[:2]
+        view, (vw, vh) = self.edits.view(*self.source_view((w, h)), self)
+        return np.linalg.inv(np.diag([size[0] / vw, size[1] / vh, 1.0]) @ view)
+
+    def _stage_edits(self, img):
+        """按当前分辨率和几何变换重放图层操作"""
+        view, _ = self.source_view(self._source_size)
+        return self.edits.apply(img, self, view, keep_snapshots=self._keep_snapshots)
+
+    def generate_mosaic_image(self, img, style="pixel", roi=None):
+        """
+        生成马赛克效果
         :param img: 原图 (numpy RGB)
         :param style: 'pixel', 'blur', 'triangle', 'hexagon'
+        :param roi: 可选 (x0, y0, x1, y1)，只生成该区域。块大小、模糊半径仍按整图尺寸计算，
+                    并带足够的边距处理，结果与整图生成后再截取该区域一致
+        :return: 整图或 roi 区域的马赛克图
         """
         h, w = img.shape[:2]
+        if roi is None: roi = (0, 0, w, h)
         
         if style == "pixel":
-            # 像素风：缩小再放大
-            scale = 0.02 # 像素块大小
-            # 确保缩放后尺寸至少为 1
-            sh = max(1, int(h * scale))
-            sw = max(1, int(w * scale))
-            # 先缩小 (使用 Linear 混合颜色，使格子颜色更代表区域平均值)
-            small = cv2.resize(img, (sw, sh), interpolation=cv2.INTER_LINEAR)
-            # 再放大回原图 (使用 Nearest 保持锯齿感)
-            return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
-   
+            # 像素风：缩小再放大 (像素块大小为整图的 2%)
+            return _pixelate(img, 0.02, roi)
             
         elif style == "blur":
             # 毛玻璃：高斯模糊
             ksize = max(1, int(min(w, h) * 0.1)) | 1 # 奇数
-            return cv2.GaussianBlur(img, (ksize, ksize), 0)
+            # 边距取核半径，并对齐到 32 像素 (大核模糊内部按 2 的幂降采样，对齐后与整图结果一致)
+            region, (ox, oy) = _crop_margin(img, roi, ksize // 2 + 1, align=32)
+            out = gaussian_blur(region, ksize)
             
         elif style == "triangle":
-            # 增强三角形/多边形马赛克的模糊度
-            blur = cv2.bilateralFilter(img, 15, 100, 100)
-            scale = 0.03 # 降低分辨率
-            sh = max(1, int(h * scale))
-            sw = max(1, int(w * scale))
-            small = cv2.resize(blur, (sw, sh), interpolation=cv2.INTER_LINEAR)
-            return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+            # 增强三角形/多边形马赛克的模糊度：先双边滤波，再降低分辨率
+            # 只对 roi 内各块的采样点附近滤波 (边距为滤波半径)
+            region, origin = _crop_margin(img, _cells_roi(img, 0.03, roi), 8)
+            blur = cv2.bilateralFilter(region, 15, 100, 100)
+            return _pixelate(blur, 0.03, roi, size=(h, w), origin=origin)
              
         elif style == "hexagon":
             # 模拟纹理 (这里简单用中值模糊模拟油画感/去噪点)
             ksize = max(1, int(min(w, h) * 0.05)) | 1
-            return cv2.medianBlur(img, ksize)
+            region, (ox, oy) = _crop_margin(img, roi, ksize // 2 + 1)
+            out = cv2.medianBlur(region, ksize)
             
-        return img
+        else:
+            out, (ox, oy) = img, (0, 0)
+            
+        x0, y0, x1, y1 = roi
+        return np.ascontiguousarray(out[y0-oy:y1-oy, x0-ox:x1-ox])
 
-    def apply_mosaic_mask(self, original_img, mosaic_img, mask_qimage):
+    def generate_framed_image(self, img, frame_type):
         """
-        将马赛克图通过遮罩应用到原图
+        生成带相框的图像逻辑
+        :param img: 原始图像 (RGB numpy array)
+        :param frame_type: 相框类型字符串
+        :return: 处理后的图像
         """
-        if mask_qimage.isNull(): return original_img
-        
-        # 1. Mask QImage -> numpy
-        # 【修复】必须转换为 RGBA8888 格式，否则 bits() 读取的字节顺序可能错误 (如 ARGB vs RGBA)
-        mask_qimage = mask_qimage.convertToFormat(QImage.Format.Format_RGBA8888)
-        
-        ptr = mask_qimage.bits()
-        ptr.setsize(mask_qimage.height() * mask_qimage.width() * 4)
-        mask_arr = np.frombuffer(ptr, np.uint8).reshape((mask_qimage.height(), mask_qimage.width(), 4))
-        
-        # 提取 Alpha 通道作为权重 (0-1)
-        alpha = mask_arr[:, :, 3].astype(float) / 255.0
-        
-        # 确保尺寸匹配
-        th, tw = original_img.shape[:2]
-        if alpha.shape[:2] != (th, tw):
-            alpha = cv2.resize(alpha, (tw, th), interpolation=cv2.INTER_LINEAR)
+        if frame_type == "none":
+            return img.copy()
             
-        alpha = np.expand_dims(alpha, axis=2)
+        h, w = img.shape[:2]
+        min_dim = min(w, h)
+        top, bottom, left, right = self.frame_borders(frame_type, w, h)
         
-        # 混合: out = mosaic * alpha + original * (1 - alpha)
-        # 确保 mosaic_img 尺寸匹配
-        if mosaic_img.shape[:2] != (th, tw):
-            mosaic_img = cv2.resize(mosaic_img, (tw, th))
+        if frame_type == "white":
+            # 添加 5% 白色边框
+            return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[255, 255, 255])
             
-        out = mosaic_img.astype(float) * alpha + original_img.astype(float) * (1.0 - alpha)
-        
-        return np.clip(out, 0, 255).astype(np.uint8)
-    
-    def apply_label_layer(self, label_qimage, current_bg_img):
-        """
-        将标签层 (QImage) 叠加到背景图 (numpy array)
-        """
-        if label_qimage.isNull(): return current_bg_img
-        
-        # 1. QImage -> numpy (RGBA)
-        # 【修复】必须转换为 RGBA8888 格式，否则 bits() 读取的字节顺序可能错误
-        label_qimage = label_qimage.convertToFormat(QImage.Format.Format_RGBA8888)
-        
-        ptr = label_qimage.bits()
-        ptr.setsize(label_qimage.height() * label_qimage.width() * 4)
-        label_arr = np.frombuffer(ptr, np.uint8).reshape((label_qimage.height(), label_qimage.width(), 4))
-        
-        # 2. 提取 Alpha 通道
-        alpha = label_arr[:, :, 3].astype(float) / 255.0
-        overlay_rgb = label_arr[:, :, :3]
-        
-        # 3. 调整尺寸以匹配 (防止尺寸不一致报错)
-        h, w = current_bg_img.shape[:2]
-        if alpha.shape[:2] != (h, w):
-            alpha = cv2.resize(alpha, (w, h))
-            overlay_rgb = cv2.resize(overlay_rgb, (w, h))
+        elif frame_type == "black":
+            # 添加 5% 黑色边框
+            return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[0, 0, 0])
             
-        alpha = np.expand_dims(alpha, axis=2)
-        
-        # 4. 混合
-        # out = overlay * alpha + bg * (1 - alpha)
-        out = overlay_rgb.astype(float) * alpha + current_bg_img.astype(float) * (1.0 - alpha)
+        elif frame_type == "polaroid":
+            # 拍立得风格：四周白边，底部留宽白边用于写字
+            return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+            
+        elif frame_type == "wood":
+            # 木质边框：使用深棕色填充
+            # RGB 颜色 [139, 69, 19] (SaddleBrown)
+            return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[139, 69, 19])
+            
+        elif frame_type == "film":
+            # 胶卷风格：上下黑色电影边框，模拟胶片孔
+            border_y = top
+            
+            # 1. 扩展黑色边框
+            res = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[20, 20, 20])
+            
+            # 2. 绘制胶卷孔 (白色小矩形)
+            hole_h = int(border_y * 0.5)
+            hole_w = int(hole_h * 0.7)
+            hole_margin_top = int((border_y - hole_h) / 2)
+            hole_gap = int(hole_w * 0.8) # 孔间距
+            
+            # 绘制上方孔洞
+            for x in range(0, res.shape[1], hole_w + hole_gap):
+                cv2.rectangle(res, (x, hole_margin_top), (x + hole_w, hole_margin_top + hole_h), (220, 220, 220), -1)
+                
+            # 绘制下方孔洞
+            hole_margin_bottom = res.shape[0] - border_y + hole_margin_top
+            for x in range(0, res.shape[1], hole_w + hole_gap):
+                cv2.rectangle(res, (x, hole_margin_bottom), (x + hole_w, hole_margin_bottom + hole_h), (220, 220, 220), -1)
+                
+            return res
+
+        elif frame_type == "line":
+            # 简约线条：外层宽白边 + 内层细黑线
+            border_outer = top
+            # 1. 加宽白边
+            res = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+            
+            # 2. 绘制内框线
+            line_thickness = max(1, int(min_dim * 0.003))
+            margin = int(border_outer * 0.4)
+            
+            # 计算内框坐标
+            pt1 = (margin, margin)
+            pt2 = (res.shape[1] - margin, res.shape[0] - margin)
+            cv2.rectangle(res, pt1, pt2, (80, 80, 80), line_thickness)
+            
+            return res
         
-        return np.clip(out, 0, 255).astype(np.uint8)
\ No newline at end of file
+        return img
+
+    @staticmethod
+    def frame_borders(frame_type, w, h):
+        """相框在 (w, h) 图像四周加的边宽 (上, 下, 左, 右)，未知类型为 0"""
+        min_dim = min(w, h)
+        if frame_type in ("white", "black"):
+            border = int(min_dim * 0.05)   # 5% 边框
+        elif frame_type == "polaroid":
+            side = int(min_dim * 0.05)
+            return side, int(min_dim * 0.25), side, side
+        elif frame_type == "wood":
+            border = int(min_dim * 0.08)
+        elif frame_type == "film":
+            by, bx = int(h * 0.12), int(w * 0.02)   # 上下边框较宽，左右微边
+            return by, by, bx, bx
+        elif frame_type == "line":
+            border = int(min_dim * 0.1)
+        else:
+            border = 0
+        return border, border, border, border
+
+
+def _crop_margin(img, roi, margin, align=1):
+    """
+    取 roi 外扩 margin 的区域 (左上角对齐到 align 的倍数，不超出图像)
+    :return: (区域, 区域左上角在原图中的坐标)
+    """
+    h, w = img.shape[:2]
+    x0, y0, x1, y1 = roi
+    ox = max(0, x0 - margin) // align * align
+    oy = max(0, y0 - margin) // align * align
+    return img[oy:min(h, y1 + margin), ox:min(w, x1 + margin)], (ox, oy)
+
+
+def _cell_grid(h, w, scale):
+    """像素块网格：整图缩小到 (sh, sw)，每个输出像素属于哪个块 (与 cv2.resize 最近邻放大一致)"""
+    return max(1, int(h * scale)), max(1, int(w * scale))
+
+
+def _cells_roi(img, scale, roi):
+    """roi 覆盖的像素块在原图中的采样范围"""
+    h, w = img.shape[:2]
+    sh, sw = _cell_grid(h, w, scale)
+    x0, y0, x1, y1 = roi
+    i0, i1 = y0 * sh // h, (y1 - 1) * sh // h
+    j0, j1 = x0 * sw // w, (x1 - 1) * sw // w
+    return (int(j0 * w / sw), int(i0 * h / sh),
+            min(w, int(np.ceil((j1 + 1) * w / sw)) + 1), min(h, int(np.ceil((i1 + 1) * h / sh)) + 1))
+
+
+def _pixelate(img, scale, roi, size=None, origin=(0, 0)):
+    """
+    像素块效果的 roi 区域：等价于 cv2.resize 线性缩小到整图的 scale 倍再最近邻放大，
+    但只计算 roi 覆盖到的块
+    :param img: 整图，或整图中左上角位于 origin、包含 roi 各块采样点的一部分 (此时 size 为整图的 (h, w))
+    """
+    h, w = img.shape[:2] if size is None else size
+    sh, sw = _cell_grid(h, w, scale)
+    x0, y0, x1, y1 = roi
+    # 每个输出像素所属的块
+    rows = np.minimum(np.arange(y0, y1) * sh // h, sh - 1)
+    cols = np.minimum(np.arange(x0, x1) * sw // w, sw - 1)
+    i0, j0 = rows[0], cols[0]
+
+    # 块颜色：块中心在原图上的双线性采样 (与 INTER_LINEAR 缩小的采样位置相同)
+    fy = (np.arange(i0, rows[-1] + 1) + 0.5) * (h / sh) - 0.5
+    fx = (np.arange(j0, cols[-1] + 1) + 0.5) * (w / sw) - 0.5
+    map_x, map_y = np.meshgrid((fx - origin[0]).astype(np.float32), (fy - origin[1]).astype(np.float32))
+    cells = cv2.remap(img, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return np.ascontiguousarray(cells[rows - i0][:, cols - j0])
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+
+class RenderScheduler(QObject):
+    """
+    编辑器预览的后台渲染调度
+    - 合并：短时间内的多次参数变化只触发一次渲染 (防抖)
+    - 后台：渲染在工作线程进行，界面线程不被阻塞
+    - 丢弃：新的请求到来后，排队中或渲染中的旧任务在阶段之间放弃
+    - 草图：上一次精确渲染较慢时，先在界面线程显示一张低分辨率草图
+    """
+    # (图像, 图像一个像素对应的原图像素数, 是否为草图)
+    rendered = pyqtSignal(object, float, bool)
+    # 工作线程 -> 界面线程：(任务编号, 图像, 像素比例, 渲染耗时)
+    _finished = pyqtSignal(int, object, float, float)
+
+    # 防抖间隔 (毫秒)，约一帧
+    DEBOUNCE_MS = 16
+    # 精确渲染超过该耗时 (秒) 时，先显示草图
+    DRAFT_THRESHOLD = 0.05
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="editor-render")
+        self._generation = 0
+        self._include_crop = True
+        self._last_duration = 0.0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_MS)
+        self._timer.timeout.connect(self._dispatch)
+        # 工作线程发出的结果经队列连接回到界面线程
+        self._finished.connect(self._on_finished)
+
+    def request(self, include_crop=True):
+        """参数已变化，需要重新渲染预览"""
+        self._generation += 1
+        self._include_crop = include_crop
+        self._timer.start()
+
+    def cancel(self):
+        """放弃所有未完成的渲染 (例如界面改为同步渲染并直接显示时)"""
+        self._generation += 1
+        self._timer.stop()
+
+    def _dispatch(self):
+        gen = self._generation
+        snap = self.engine.snapshot()
+        if self._last_duration > self.DRAFT_THRESHOLD:
+            draft = snap.render_draft(self._include_crop)
+            if draft is not None:
+                self.rendered.emit(draft[0], draft[1], True)
+        self._executor.submit(self._work, gen, snap, self._include_crop)
+
+    def _work(self, gen, snap, include_crop):
+        # 排队期间已有更新的请求：直接丢弃
+        if gen != self._generation: return
+        start = time.perf_counter()
+        try:
+            img = snap.render(use_preview=True, include_crop=include_crop,
+                              cancel=lambda: gen != self._generation)
+        except Exception as e:
+            print(f"预览渲染失败: {e}")
+            return
+        if img is not None:
+            self._finished.emit(gen, img, snap.preview_scale, time.perf_counter() - start)
+
+    def _on_finished(self, gen, img, scale, duration):
+        # 命中缓存的渲染很快，不代表下一次也快：耗时估计按一半衰减，而不是直接取最近一次
+        self._last_duration = max(duration, self._last_duration * 0.5)
+        if gen == self._generation:
+            self.rendered.emit(img, scale, False)
@@ -4,8 +4,21 @@ from PyQt6.QtCore import Qt, QPoint, QRect, QRectF, QPointF
 import math
 import os
 
+def paint_sticker(painter, image, x, y, width, height, angle):
+    """以 (x, y) 为中心、旋转 angle 度绘制贴纸 (image 为 QPixmap 或 QImage)"""
+    painter.save()
+    painter.translate(x, y)
+    painter.rotate(angle)
+    rect = QRectF(-width/2, -height/2, width, height).toRect()
+    if isinstance(image, QImage):
+        painter.drawImage(rect, image)
+    else:
+        painter.drawPixmap(rect, image)
+    painter.restore()
+
 class StickerItem:
     def __init__(self, image_path, center_pos, size=150):
+        self.image_path = image_path
         self.pixmap = QPixmap(image_path)
         # 计算宽高比
         if self.pixmap.height() > 0:
@@ -82,11 +95,7 @@ class StickerOverlay(QWidget):
         painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
         
         for item in self.items:
-            painter.save()
-            painter.translate(item.x, item.y)
-            painter.rotate(item.angle)
-            painter.drawPixmap(item.rect.toRect(), item.pixmap)
-            painter.restore()
+            paint_sticker(painter, item.pixmap, item.x, item.y, item.width, item.height, item.angle)
             
         painter.end()
         return img
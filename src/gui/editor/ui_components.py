@@ -1,6 +1,6 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QSlider, QPushButton
 from PyQt6.QtCore import Qt, pyqtSignal, QRectF
-from PyQt6.QtGui import QPainter, QColor, QPen, QPixmap, QIcon
+from PyQt6.QtGui import QPainter, QColor, QPen, QPixmap, QIcon, QPainterPath
 
 class IconButton(QPushButton):
     """
@@ -12,6 +12,7 @@ class IconButton(QPushButton):
         self.is_small = is_small
         # 路径指向 resources/icons/
         self.icon_path = f"resources/icons/{icon_name}.png"
+        self.thumbnail = None # 设置后代替图标显示 (例如滤镜效果预览)
         
         self.setCheckable(True)
         self.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -21,6 +22,30 @@ class IconButton(QPushButton):
         else:
             self.setFixedSize(70, 70)
 
+    def set_thumbnail(self, pixmap):
+        """用预览图代替图标 (传入 None 恢复图标)"""
+        self.thumbnail = pixmap
+        self.update()
+
+    def _draw_thumbnail(self, painter, content_color):
+        """在文字上方的正方形区域内居中裁切绘制缩略图"""
+        side = min(self.width() - 8, self.height() - 28)
+        target = QRectF((self.width() - side) / 2, 4, side, side)
+        pw, ph = self.thumbnail.width(), self.thumbnail.height()
+        crop = min(pw, ph)
+        source = QRectF((pw - crop) / 2, (ph - crop) / 2, crop, crop)
+
+        path = QPainterPath()
+        path.addRoundedRect(target, 6, 6)
+        painter.save()
+        painter.setClipPath(path)
+        painter.drawPixmap(target, self.thumbnail, source)
+        painter.restore()
+        if self.isChecked():
+            painter.setPen(QPen(content_color, 2))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRoundedRect(target, 6, 6)
+
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
@@ -40,9 +65,11 @@ class IconButton(QPushButton):
             painter.setPen(Qt.PenStyle.NoPen)
             painter.drawRoundedRect(self.rect(), 10, 10)
 
-        # 3. 绘制并着色图标
+        # 3. 绘制并着色图标 (有缩略图时绘制缩略图)
         target_size = 28 if not self.is_small else 24
-        pixmap = QPixmap(self.icon_path)
+        pixmap = QPixmap() if self.thumbnail is not None else QPixmap(self.icon_path)
+        if self.thumbnail is not None:
+            self._draw_thumbnail(painter, content_color)
         
         if not pixmap.isNull():
             # 创建一个与图标同大小的透明画布用于着色
@@ -0,0 +1,45 @@
+import numpy as np
+from PyQt6 import sip
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage, QPixmap
+
+# 通道数 -> 默认 QImage 格式 (numpy 图像约定为 RGB / RGBA)
+_FORMATS = {
+    1: QImage.Format.Format_Grayscale8,
+    3: QImage.Format.Format_RGB888,
+    4: QImage.Format.Format_RGBA8888,
+}
+
+
+def to_qimage(arr, fmt=None):
+    """
+    把 uint8 图像数组零拷贝包装为 QImage
+    行内像素必须连续，行间距任意 (大图上切出的一块可以直接包装)，否则先整理为连续数组
+    返回的 QImage 直接引用 arr 的内存并持有 arr 的引用 (保证内存存活)：
+    之后修改 arr 会直接反映到 QImage 上；需要脱离 arr 长期保存时调用 .copy()
+    :param arr: (H, W) / (H, W, 3) / (H, W, 4) uint8
+    :param fmt: QImage 格式，缺省按通道数取 Grayscale8 / RGB888 / RGBA8888
+    """
+    if arr.dtype != np.uint8:
+        raise ValueError(f"只支持 uint8 图像: {arr.dtype}")
+    ch = 1 if arr.ndim == 2 else arr.shape[2]
+    if fmt is None:
+        fmt = _FORMATS[ch]
+    pixel_contiguous = arr.strides[-1] == 1 and (ch == 1 or arr.strides[1] == ch)
+    if not pixel_contiguous or arr.strides[0] <= 0:
+        arr = np.ascontiguousarray(arr)
+    h, w = arr.shape[:2]
+    qimg = QImage(sip.voidptr(arr.ctypes.data), w, h, arr.strides[0], fmt)
+    qimg._bridge_buffer = arr
+    return qimg
+
+
+def to_pixmap(arr, fmt=None, fit=None):
+    """
+    numpy 图像 -> QPixmap，零拷贝包装后只做一次格式转换 (不再先 tobytes 复制一份)
+    :param fit: 可选 QSize，转换后按比例平滑缩放到该尺寸以内 (用于 QLabel 预览)
+    """
+    pixmap = QPixmap.fromImage(to_qimage(arr, fmt))
+    if fit is not None:
+        pixmap = pixmap.scaled(fit, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    return pixmap
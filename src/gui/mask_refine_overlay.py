@@ -3,7 +3,8 @@ import numpy as np
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QLabel, QSlider, QFrame, QGraphicsDropShadowEffect, QButtonGroup)
 from PyQt6.QtCore import Qt, pyqtSignal, QPointF, QRectF, QSize, QPoint
-from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor, QPen, QCursor, QWheelEvent, QMouseEvent, QBrush
+from PyQt6.QtGui import QPixmap, QPainter, QColor, QPen, QCursor, QWheelEvent, QMouseEvent, QBrush
+from .image_bridge import to_qimage
 
 class RefineCanvas(QWidget):
     """
@@ -19,7 +20,8 @@ class RefineCanvas(QWidget):
         self.img_rgb = None
         self.dark_bg = None # 预计算的暗色背景
         self.mask = None
-        self.display_image = None # 使用 QImage 作为缓存，方便局部更新
+        self.display_arr = None # 显示图像的 numpy 缓冲区，局部更新直接写入
+        self.display_image = None # 零拷贝引用 display_arr 的 QImage
         
         # 交互状态
         self.space_pressed = False
@@ -82,16 +84,14 @@ class RefineCanvas(QWidget):
         """全量更新显示图像 (仅在初始化时调用)"""
         if self.img_rgb is None: return
 
-        h, w, c = self.img_rgb.shape
-        
         # 融合: 前景(原图) + 背景(暗色)
         mask_3c = cv2.cvtColor(self.mask, cv2.COLOR_GRAY2RGB)
         mask_float = mask_3c.astype(float) / 255.0
         
-        display_arr = (self.img_rgb * mask_float + self.dark_bg * (1 - mask_float)).astype(np.uint8)
+        self.display_arr = (self.img_rgb * mask_float + self.dark_bg * (1 - mask_float)).astype(np.uint8)
         
-        # 创建 QImage (注意保持引用，防止被垃圾回收)
-        self.display_image = QImage(display_arr.data, w, h, w * 3, QImage.Format.Format_RGB888).copy()
+        # QImage 直接引用 display_arr (不复制，且由 QImage 持有数组引用)
+        self.display_image = to_qimage(self.display_arr)
 
     def paintEvent(self, event):
         painter = QPainter(self)
@@ -227,7 +227,7 @@ class RefineCanvas(QWidget):
         else:
             cv2.circle(self.mask, point, radius, color, -1)
             
-        # 3. 局部更新显示图像 (QImage)
+        # 3. 局部更新显示图像 (写入 display_arr，display_image 共享同一块内存)
         # 提取 ROI
         mask_roi = self.mask[y_min:y_max, x_min:x_max]
         img_roi = self.img_rgb[y_min:y_max, x_min:x_max]
@@ -236,17 +236,7 @@ class RefineCanvas(QWidget):
         # 局部融合
         mask_3c = cv2.cvtColor(mask_roi, cv2.COLOR_GRAY2RGB)
         mask_float = mask_3c.astype(float) / 255.0
-        blended_roi = (img_roi * mask_float + bg_roi * (1 - mask_float)).astype(np.uint8)
-        
-        # 转换 ROI 为 QImage
-        h_roi, w_roi, _ = blended_roi.shape
-        # 注意：必须 copy() 或者保持引用，否则 QImage 指向的内存会被释放
-        qimg_roi = QImage(blended_roi.data, w_roi, h_roi, w_roi * 3, QImage.Format.Format_RGB888)
-        
-        # 绘制到主图上
-        painter = QPainter(self.display_image)
-        painter.drawImage(x_min, y_min, qimg_roi)
-        painter.end()
+        self.display_arr[y_min:y_max, x_min:x_max] = img_roi * mask_float + bg_roi * (1 - mask_float)
         
         self.update()
 
@@ -1,15 +1,20 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QLabel, QComboBox, QFileDialog, QFrame, QSizePolicy, 
-                             QApplication, QMessageBox, QGraphicsDropShadowEffect) 
+                             QApplication, QMessageBox, QGraphicsDropShadowEffect, QCheckBox) 
 import torch
 from PyQt6.QtCore import Qt, pyqtSignal, QEvent
-from PyQt6.QtGui import QPixmap, QImage, QColor, QCursor
+from PyQt6.QtGui import QColor, QCursor
 import cv2
 import numpy as np
 from src.models.factory import ModelFactory
-from src.utils.image_processor import ImageProcessor
+from src.utils.composite_session import CompositeSession
+from src.utils.torch_compositor import DeviceCompositeSession
+from src.utils.strip_composite import load_background, StripCompositor
+from src.utils.guided_filter import refine_mask
+from src.utils.rgba_export import compose_rgba, save_image_async, submit_export
 # [新增] 导入修正层
 from .mask_refine_overlay import MaskRefineOverlay
+from .image_bridge import to_pixmap
 
 # [新增] 可点击的 Label
 class ClickableLabel(QLabel):
@@ -21,6 +26,10 @@ class ClickableLabel(QLabel):
 
 class SegPage(QWidget):
     go_back = pyqtSignal() # 返回菜单信号
+    # 后台编码完成 (路径, 错误信息)，由工作线程发出、界面线程处理
+    export_finished = pyqtSignal(str, str)
+    # 原图超过该像素数时，保存合成图改为按条带流式合成 (不在内存中保留全分辨率背景和合成结果)
+    STRIP_EXPORT_PIXELS = 40_000_000
 
     def __init__(self):
         super().__init__()
@@ -34,6 +43,10 @@ class SegPage(QWidget):
         self.bg_rgb = None
         self.result_rgba = None
         self.composite_rgb = None
+        # 合成会话：缓存背景/蒙版相关的中间结果
+        self.composite_session = CompositeSession()
+        # 模型在 CUDA 上时的显存合成会话 (蒙版和合成结果留在显存里)，否则为 None
+        self.device_session = None
 
         self.init_ui()
         
@@ -41,6 +54,7 @@ class SegPage(QWidget):
         self.refine_overlay = MaskRefineOverlay(self)
         self.refine_overlay.hide()
         self.refine_overlay.finished.connect(self.on_mask_refined)
+        self.export_finished.connect(self.on_export_finished)
 
     def resizeEvent(self, event):
         # 确保覆盖层始终跟随窗口大小
@@ -350,6 +364,12 @@ class SegPage(QWidget):
         self.combo_size.setCurrentIndex(2) 
         self.combo_size.setStyleSheet(self.combo_model.styleSheet())
 
+        # 边缘优化 (导向滤波)：默认关闭，勾选后才改变模型输出的蒙版
+        self.chk_refine_edge = QCheckBox("发丝边缘优化 (导向滤波)")
+        self.chk_refine_edge.setChecked(False)
+        self.chk_refine_edge.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.chk_refine_edge.setStyleSheet("QCheckBox { color: #a0a5b5; font-size: 12px; }")
+
         # 运行按钮
         self.btn_run = QPushButton("开始分割")
         self.btn_run.setFixedWidth(200)
@@ -383,6 +403,7 @@ class SegPage(QWidget):
         layout.addSpacing(5)
         layout.addWidget(lbl_size)
         layout.addWidget(self.combo_size) 
+        layout.addWidget(self.chk_refine_edge)
         layout.addSpacing(20)
         layout.addWidget(self.btn_run)
         layout.addStretch()
@@ -416,6 +437,33 @@ class SegPage(QWidget):
             }
         """)
 
+        # 融合模式
+        self.combo_blend = QComboBox()
+        self.combo_blend.addItems([
+            "线性混合",
+            "金字塔融合 (去光晕)"
+        ])
+        self.combo_blend.setFixedHeight(35)
+        self.combo_blend.setStyleSheet(self.combo_model.styleSheet())
+        self.combo_blend.currentIndexChanged.connect(lambda _: self.update_composite())
+
+        # 色彩融合统计范围
+        self.combo_harmonize = QComboBox()
+        self.combo_harmonize.addItems([
+            "色彩融合: 全局统计",
+            "色彩融合: 人像 + 周边背景"
+        ])
+        self.combo_harmonize.setFixedHeight(35)
+        self.combo_harmonize.setStyleSheet(self.combo_model.styleSheet())
+        self.combo_harmonize.currentIndexChanged.connect(lambda _: self.update_composite())
+
+        # 人像模式：不换背景，虚化原图背景
+        self.chk_portrait = QCheckBox("人像模式 (虚化原背景)")
+        self.chk_portrait.setEnabled(False)
+        self.chk_portrait.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.chk_portrait.setStyleSheet("QCheckBox { color: #a0a5b5; font-size: 12px; }")
+        self.chk_portrait.toggled.connect(self.on_portrait_toggled)
+
         # 按钮组
         btn_layout = QHBoxLayout()
         btn_layout.setSpacing(10)
@@ -467,6 +515,9 @@ class SegPage(QWidget):
 
         layout.addWidget(title)
         layout.addWidget(self.lbl_composite)
+        layout.addWidget(self.combo_blend)
+        layout.addWidget(self.combo_harmonize)
+        layout.addWidget(self.chk_portrait)
         layout.addLayout(btn_layout)
 
         # 添加阴影
@@ -486,11 +537,9 @@ class SegPage(QWidget):
             stream = np.fromfile(file_name, dtype=np.uint8)
             bgr = cv2.imdecode(stream, cv2.IMREAD_COLOR)
             self.original_rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            self.composite_session.set_foreground(self.original_rgb)
             
-            h, w, c = self.original_rgb.shape
-            qimg = QImage(self.original_rgb.data, w, h, w * 3, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimg)
-            self.lbl_original.setPixmap(pixmap.scaled(self.lbl_original.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+            self.lbl_original.setPixmap(to_pixmap(self.original_rgb, fit=self.lbl_original.size()))
             # 更新样式：青色边框
             self.lbl_original.setStyleSheet("border: 2px solid #00f2ea; border-radius: 12px;")
             
@@ -507,6 +556,11 @@ class SegPage(QWidget):
             self.bg_rgb = None
             self.result_rgba = None
             self.composite_rgb = None
+            self.composite_session.set_mask(None)
+            self.composite_session.set_background(None)
+            self.device_session = None
+            self.chk_portrait.setChecked(False)
+            self.chk_portrait.setEnabled(False)
 
     def run_segmentation(self):
         if not self.current_image_path: return
@@ -534,8 +588,17 @@ class SegPage(QWidget):
             elif "512" in size_text: max_size = 512
             elif "256" in size_text: max_size = 256
 
-            mask = self.model.predict(image_rgb, max_size=max_size)
+            # 蒙版留在模型设备上，显示和 CPU 合成用的副本才下载
+            mask_device = self.model.predict_tensor(image_rgb, max_size=max_size)
+            mask = mask_device.cpu().numpy()
+
+            # 以原图为引导，把粗蒙版细化为贴合发丝的软 alpha (在 CPU 上完成，结果再上传)
+            if self.chk_refine_edge.isChecked():
+                mask = refine_mask(image_rgb, mask)
+                mask_device = mask
             self.mask_raw = mask 
+            self.composite_session.set_mask(mask)
+            self._update_device_session(mask_device)
 
             self.update_result_display() # 封装显示逻辑
 
@@ -553,24 +616,20 @@ class SegPage(QWidget):
         """更新结果显示 (在分割完成或修正完成后调用)"""
         if self.original_rgb is None or self.mask_raw is None: return
 
-        h, w, c = self.original_rgb.shape
-        rgba_image = np.zeros((h, w, 4), dtype=np.uint8)
-        rgba_image[:, :, :3] = self.original_rgb
-        rgba_image[:, :, 3] = self.mask_raw
-
+        # 直接交织 RGB + 蒙版；同尺寸时复用上一次的缓冲区
+        # (保存在后台线程读取原图和蒙版本身，不读这块缓冲区)
+        rgba_image = compose_rgba(self.original_rgb, self.mask_raw, out=self.result_rgba)
         self.result_rgba = rgba_image
 
-        qimg = QImage(rgba_image.data, w, h, w * 4, QImage.Format.Format_RGBA8888)
-        result_pix = QPixmap.fromImage(qimg)
-        
-        self.lbl_result.setPixmap(result_pix.scaled(self.lbl_result.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+        self.lbl_result.setPixmap(to_pixmap(rgba_image, fit=self.lbl_result.size()))
         self.lbl_result.setStyleSheet("border: 2px solid #00f2ea; border-radius: 12px;")
         
         self.btn_save_res.setEnabled(True)
         self.btn_bg.setEnabled(True)
+        self.chk_portrait.setEnabled(True)
         
-        # 如果有背景，也更新合成图
-        if self.bg_rgb is not None:
+        # 如果有背景 (或处于人像模式)，也更新合成图
+        if self.bg_rgb is not None or self.chk_portrait.isChecked():
             self.update_composite()
 
     # [新增] 打开修正覆盖层
@@ -588,49 +647,100 @@ class SegPage(QWidget):
     def on_mask_refined(self, new_mask):
         if new_mask is not None:
             self.mask_raw = new_mask
+            self.composite_session.set_mask(new_mask)
+            if self.device_session is not None:
+                self.device_session.set_mask(new_mask)
             self.update_result_display()
             QMessageBox.information(self, "成功", "蒙版修正已应用！")
 
     def select_background(self):
         path, _ = QFileDialog.getOpenFileName(self, "选择背景", "", "Images (*.png *.jpg *.jpeg)")
         if path:
-            stream = np.fromfile(path, dtype=np.uint8)
-            bgr = cv2.imdecode(stream, cv2.IMREAD_COLOR)
-            self.bg_rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            # 背景最终会缩放到原图尺寸：超大背景 (全景图) 只解码到够用的分辨率
+            h, w = self.original_rgb.shape[:2]
+            self.bg_rgb = load_background(path, (w, h))
+            self.composite_session.set_background(self.bg_rgb)
+            if self.device_session is not None:
+                self.device_session.set_background(self.bg_rgb)
             
             self.btn_save_comp.setEnabled(True)
             self.update_composite()
 
+    def on_portrait_toggled(self, checked):
+        self.btn_save_comp.setEnabled(checked or self.bg_rgb is not None)
+        self.update_composite()
+
+    def _update_device_session(self, mask):
+        """模型在 CUDA 上时合成也放在显存里 (原图/背景上传一次后常驻)；没有 CUDA 时只用 CPU 的 CompositeSession"""
+        if self.model is None or self.model.device.type != 'cuda':
+            self.device_session = None
+            return
+        if self.device_session is None or self.device_session.device != self.model.device:
+            self.device_session = DeviceCompositeSession(self.model.device)
+            self.device_session.set_foreground(self.original_rgb)
+            self.device_session.set_background(self.bg_rgb)
+        self.device_session.set_mask(mask)
+
+    def _active_session(self):
+        """人像模式只有 CPU 实现，其余情况优先使用显存合成会话"""
+        if self.chk_portrait.isChecked() or self.device_session is None:
+            return self.composite_session
+        return self.device_session
+
     def update_composite(self):
-        if self.original_rgb is None or self.mask_raw is None or self.bg_rgb is None: return
+        portrait_mode = self.chk_portrait.isChecked()
+        if self.original_rgb is None or self.mask_raw is None: return
+        if self.bg_rgb is None and not portrait_mode: return
         
-        self.composite_rgb = ImageProcessor.composite_images(
-            self.original_rgb, 
-            self.mask_raw, 
-            self.bg_rgb,
-            use_harmonize=True, 
-            use_light_wrap=True, 
-            brightness=0,
-            roi_rects=None,
-            display_size=(self.lbl_composite.width(), self.lbl_composite.height())
-        )
+        display_size = (self.lbl_composite.width(), self.lbl_composite.height())
+        params = dict(self._blend_params(), roi_rects=None, use_roi=True, portrait_mode=portrait_mode)
+        # 显存会话：在设备上整图合成后缩小再下载；CPU 会话：只在显示分辨率下合成，全分辨率结果在保存时再计算
+        try:
+            preview_rgb = self._active_session().composite_preview(display_size, **params)
+        except torch.cuda.OutOfMemoryError:
+            # 显存不足：放弃显存会话，回退到 CPU 合成
+            print("显存不足，合成回退到 CPU")
+            torch.cuda.empty_cache()
+            self.device_session = None
+            preview_rgb = self.composite_session.composite_preview(display_size, **params)
+        if preview_rgb is None: return
+        self.composite_rgb = None
         
-        h, w, c = self.composite_rgb.shape
-        qimg = QImage(self.composite_rgb.data, w, h, w * 3, QImage.Format.Format_RGB888)
-        pix = QPixmap.fromImage(qimg)
-        self.lbl_composite.setPixmap(pix.scaled(self.lbl_composite.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.FastTransformation))
+        self.lbl_composite.setPixmap(to_pixmap(preview_rgb, fit=self.lbl_composite.size()))
         # 更新样式：黄色边框
         self.lbl_composite.setStyleSheet("border: 2px solid #eab308; border-radius: 12px;")
 
+    def _blend_params(self):
+        """当前界面上的合成参数 (预览、全分辨率和条带合成共用)"""
+        return dict(
+            use_harmonize=True,
+            use_light_wrap=True,
+            brightness=0,
+            blend_mode="pyramid" if self.combo_blend.currentIndex() == 1 else "linear",
+            harmonize_mode="mask" if self.combo_harmonize.currentIndex() == 1 else "global",
+        )
+
     def save_result(self):
         if self.result_rgba is None: return
-        self._save_image_data(self.result_rgba, "segmentation_result.png", is_rgba=True)
+        self._save_image_data(self.original_rgb, "segmentation_result.png", alpha=self.mask_raw)
 
     def save_composite(self):
-        if not hasattr(self, 'composite_rgb'): return
-        self._save_image_data(self.composite_rgb, "composite_result.jpg", is_rgba=False)
+        h, w = self.original_rgb.shape[:2]
+        if (not self.chk_portrait.isChecked() and self.bg_rgb is not None
+                and w * h >= self.STRIP_EXPORT_PIXELS):
+            # 超大图：按条带合成并写盘 (PNG 逐条压缩，JPEG / WebP 经临时文件编码)，与预览相比有 1~2 个色阶的差异
+            file_path = self._ask_save_path("composite_result.jpg")
+            if file_path:
+                compositor = StripCompositor(self.original_rgb, self.mask_raw)
+                submit_export(file_path, compositor.render, self.bg_rgb, file_path,
+                              callback=self._emit_export_finished, **self._blend_params())
+            return
+        # 以预览时的参数延迟计算全分辨率合成图
+        self.composite_rgb = self._active_session().render_full()
+        if self.composite_rgb is None: return
+        self._save_image_data(self.composite_rgb, "composite_result.jpg")
 
-    def _save_image_data(self, img_data, default_name, is_rgba=False):
+    def _ask_save_path(self, default_name):
         import os
         root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         output_dir = os.path.join(root_dir, "output")
@@ -638,17 +748,22 @@ class SegPage(QWidget):
         default_path = os.path.join(output_dir, default_name)
 
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "保存图片", default_path, "PNG Images (*.png);;JPEG Images (*.jpg)"
+            self, "保存图片", default_path,
+            "PNG Images (*.png);;JPEG Images (*.jpg);;WebP Images (无损) (*.webp)"
         )
+        return file_path
 
+    def _save_image_data(self, img_data, default_name, alpha=None):
+        file_path = self._ask_save_path(default_name)
         if file_path:
-            if is_rgba:
-                save_img = cv2.cvtColor(img_data, cv2.COLOR_RGBA2BGRA)
-            else:
-                save_img = cv2.cvtColor(img_data, cv2.COLOR_RGB2BGR)
-            
-            ext = os.path.splitext(file_path)[1]
-            is_success, im_buf = cv2.imencode(ext, save_img)
-            if is_success:
-                im_buf.tofile(file_path)
-                print(f"图片已保存到: {file_path}")
\ No newline at end of file
+            # 大图编码较慢，放到后台线程，界面不卡顿
+            save_image_async(file_path, img_data, alpha, callback=self._emit_export_finished)
+
+    def _emit_export_finished(self, path, err):
+        self.export_finished.emit(path, str(err) if err else "")
+
+    def on_export_finished(self, path, error):
+        if error:
+            QMessageBox.warning(self, "错误", f"保存失败：\n{error}")
+        else:
+            print(f"图片已保存到: {path}")
\ No newline at end of file
@@ -38,11 +38,14 @@ class DeepLabModel(PortraitSegmentationModel):
             raise e
 
     def predict(self, image: np.ndarray, max_size: int = None) -> np.ndarray:
+        return self.predict_tensor(image, max_size).cpu().numpy()
+
+    def predict_tensor(self, image: np.ndarray, max_size: int = None) -> torch.Tensor:
+        """后处理在模型设备上完成，蒙版不下载到 CPU (predict 在此基础上下载)"""
         if self.model is None:
             raise RuntimeError("模型未初始化")
 
         h, w = image.shape[:2]
-        scale_factor = 1.0
         input_image_data = image
 
         # --- 1. 动态缩放逻辑 ---
@@ -64,20 +67,19 @@ class DeepLabModel(PortraitSegmentationModel):
         input_tensor = preprocess(input_pil)
         input_batch = input_tensor.unsqueeze(0).to(self.device)
 
-        # --- 3. 推理 ---
+        # --- 3. 推理 + 后处理 ---
         with torch.no_grad():
             output = self.model(input_batch)['out'][0]
-        
-        # --- 4. 后处理 ---
-        output_predictions = output.argmax(0).byte().cpu().numpy()
-        
-        # --- 5. 还原尺寸 ---
-        if scale_factor != 1.0:
-            # 使用最近邻插值 (INTER_NEAREST) 还原掩码，保证只有 0, 1, 2... 整数类别
-            output_predictions = cv2.resize(output_predictions, (w, h), interpolation=cv2.INTER_NEAREST)
+            output_predictions = output.argmax(0).byte()
+
+            # --- 4. 还原尺寸 ---
+            if output_predictions.shape != (h, w):
+                # 最近邻插值还原掩码 (与 cv2.INTER_NEAREST 取样一致)，保证只有 0, 1, 2... 整数类别
+                output_predictions = torch.nn.functional.interpolate(
+                    output_predictions[None, None].float(), size=(h, w), mode='nearest')[0, 0].byte()
 
         # 提取人像 (Index 15)
-        person_idx = 15 
-        mask = (output_predictions == person_idx).astype(np.uint8) * 255
-        
-        return mask
\ No newline at end of file
+        person_idx = 15
+        mask = (output_predictions == person_idx).byte() * 255
+
+        return mask
@@ -23,4 +23,11 @@ class PortraitSegmentationModel(ABC):
         :param image: 输入图像 (H, W, 3) RGB格式, uint8
         :return: 分割掩码 (H, W), 0为背景, 255为人像
         """
-        pass
\ No newline at end of file
+        pass
+
+    def predict_tensor(self, image: np.ndarray, max_size: int = None) -> torch.Tensor:
+        """
+        执行推理，蒙版留在模型所在设备上 (供 TorchCompositor 直接合成，避免来回拷贝)
+        :return: 分割掩码 (H, W) uint8 tensor, 0为背景, 255为人像
+        """
+        return torch.from_numpy(self.predict(image, max_size)).to(self.device)
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import cv2
+import numpy as np
+from src.utils.composite_session import CompositeSession
+
+
+class BatchCompositor:
+    """
+    同一张人像 + 多张背景的批量合成
+    前景侧 (蒙版腐蚀/模糊、alpha、光效边缘、前景色彩统计) 只准备一次，
+    各背景在线程池中并行合成 (OpenCV 运算期间会释放 GIL)，完成一张输出一张
+    """
+    def __init__(self, fg_rgb, mask_raw, max_workers=None):
+        self.base = CompositeSession()
+        self.base.set_foreground(fg_rgb)
+        self.base.set_mask(mask_raw)
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    def _prepare(self, use_harmonize=False, use_light_wrap=False, harmonize_mode="global", **_):
+        """预先计算与背景无关的中间结果，之后所有分支会话共享"""
+        self.base.alpha()
+        if use_light_wrap:
+            self.base.edge_factor()
+        if use_harmonize and harmonize_mode != "mask":
+            self.base.fg_stats()
+
+    @staticmethod
+    def _load(bg):
+        """背景可以是 RGB 数组或图片路径 (支持中文路径)"""
+        if isinstance(bg, np.ndarray):
+            return bg
+        bgr = cv2.imdecode(np.fromfile(bg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError(f"无法读取背景图片: {bg}")
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    @staticmethod
+    def _save(img_rgb, path):
+        ext = os.path.splitext(path)[1] or ".png"
+        is_success, im_buf = cv2.imencode(ext, cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR))
+        if not is_success:
+            raise ValueError(f"编码失败: {path}")
+        im_buf.tofile(path)
+
+    def _composite_one(self, bg, out_path, params):
+        session = self.base.fork()
+        session.set_background(self._load(bg))
+        result = session.composite(**params)
+        if out_path:
+            self._save(result, out_path)
+        return result
+
+    def run(self, backgrounds, output_paths=None, **params):
+        """
+        并行合成所有背景，按完成顺序逐个产出
+        :param backgrounds: RGB 数组或图片路径列表
+        :param output_paths: 可选，与 backgrounds 一一对应的输出路径；给出时在工作线程中直接编码写盘
+        :param params: 传给 CompositeSession.composite 的合成参数
+        :return: 生成器，产出 (index, composite_rgb)
+        """
+        if output_paths is not None and len(output_paths) != len(backgrounds):
+            raise ValueError("output_paths 数量必须与 backgrounds 一致")
+        self._prepare(**params)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(self._composite_one, bg, output_paths[i] if output_paths else None, params): i
+                for i, bg in enumerate(backgrounds)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
@@ -0,0 +1,231 @@
+import cv2
+from src.utils.image_processor import ImageProcessor
+from src.utils.pyramid_blend import PyramidBlender
+from src.utils import harmonization
+from src.utils.portrait_blur import portrait_blur
+
+
+class CompositeSession:
+    """
+    合成会话：缓存与背景 / 蒙版 / 前景相关的中间结果
+    只修改蒙版 (例如手动修正后) 或只调节亮度时，不再重复缩放背景、计算 LAB 统计量和大核模糊
+    """
+    # 缓存项 -> 依赖的输入，任一输入变化时该缓存项失效
+    _DEPS = {
+        "bg_resized": ("fg", "bg"),
+        "bg_stats": ("fg", "bg"),
+        "bg_blur": ("fg", "bg"),
+        "fg_stats": ("fg",),
+        "fg_harmonized": ("fg", "bg"),
+        "masked_stats": ("fg", "bg", "mask"),
+        "fg_harmonized_mask": ("fg", "bg", "mask"),
+        "mask": ("mask",),
+        "alpha": ("mask",),
+        "edge_factor": ("mask",),
+        "portrait": ("fg", "mask"),
+    }
+    # 人像模式最远处的模糊强度，占长边的比例 (与分辨率无关，预览和全分辨率观感一致)
+    PORTRAIT_SIGMA_RATIO = 0.012
+
+    def __init__(self, scale=1.0, sample_size=harmonization.DEFAULT_SAMPLE_SIZE):
+        # scale: 相对全分辨率的缩放比例，用于按比例缩小模糊核 (预览子会话 < 1)
+        self.scale = scale
+        # global 色彩融合的统计量抽样长边上限 (None 为全图统计)
+        self.sample_size = sample_size
+        self.fg_rgb = None
+        self.mask_raw = None
+        self.bg_rgb = None
+        self._cache = {}
+        # 金字塔融合的缓冲区随会话复用
+        self._blender = PyramidBlender()
+
+        # 双层合成：显示分辨率的预览子会话 + 延迟计算的全分辨率结果
+        self._preview = None
+        self._preview_size = None
+        self._last_params = {}
+        self._full_result = None
+
+    # --- 输入 ---
+    def set_foreground(self, fg_rgb):
+        self.fg_rgb = fg_rgb
+        self._invalidate("fg")
+        # 前景尺寸决定预览尺寸，直接重建预览子会话
+        self._preview = None
+        self._preview_size = None
+
+    def set_mask(self, mask_raw):
+        self.mask_raw = mask_raw
+        self._invalidate("mask")
+        if self._preview is not None:
+            self._preview.set_mask(self._downscale(mask_raw, self._preview_size))
+
+    def set_background(self, bg_rgb):
+        self.bg_rgb = bg_rgb
+        self._invalidate("bg")
+        if self._preview is not None:
+            self._preview.set_background(self._downscale(bg_rgb, self._preview_size))
+
+    def fork(self):
+        """
+        复制一个共享前景/蒙版缓存的会话 (缓存数组只读共享，不复制像素)
+        用于同一人像配多个背景：在分支上 set_background 只会使分支自己的背景相关缓存失效
+        """
+        other = CompositeSession(self.scale, self.sample_size)
+        other.fg_rgb, other.mask_raw, other.bg_rgb = self.fg_rgb, self.mask_raw, self.bg_rgb
+        other._cache = dict(self._cache)
+        return other
+
+    def is_ready(self, need_background=True):
+        if self.fg_rgb is None or self.mask_raw is None: return False
+        return self.bg_rgb is not None or not need_background
+
+    def _invalidate(self, source):
+        self._full_result = None
+        for key in [k for k, deps in self._DEPS.items() if source in deps]:
+            self._cache.pop(key, None)
+
+    def _get(self, key, builder):
+        if key not in self._cache:
+            self._cache[key] = builder()
+        return self._cache[key]
+
+    # --- 中间结果 ---
+    def bg_resized(self):
+        h, w = self.fg_rgb.shape[:2]
+        return self._get("bg_resized", lambda: ImageProcessor.fit_background(self.bg_rgb, (w, h)))
+
+    def bg_stats(self):
+        # 只在抽样像素上计算统计量
+        return self._get("bg_stats", lambda: harmonization.lab_stats(self.bg_resized(), sample_size=self.sample_size))
+
+    def bg_blur(self):
+        return self._get("bg_blur", lambda: ImageProcessor.light_wrap_background(self.bg_resized(), self.scale))
+
+    def fg_stats(self):
+        return self._get("fg_stats", lambda: harmonization.lab_stats(self.fg_rgb, sample_size=self.sample_size))
+
+    def fg_harmonized(self):
+        def build():
+            lut = harmonization.build_transfer_lut(self.bg_stats(), self.fg_stats())
+            harmonized = harmonization.apply_transfer(self.fg_rgb, lut)
+            return ImageProcessor.mix_harmonized(harmonized, self.fg_rgb)
+        return self._get("fg_harmonized", build)
+
+    def masked_stats(self):
+        """(背景环带统计量, 人像统计量)"""
+        return self._get("masked_stats", lambda: harmonization.mask_aware_stats(
+            self.bg_resized(), self.fg_rgb, self.mask_raw))
+
+    def fg_harmonized_mask(self):
+        def build():
+            bg_stats, fg_stats = self.masked_stats()
+            harmonized = harmonization.apply_transfer(self.fg_rgb, harmonization.build_transfer_lut(bg_stats, fg_stats))
+            return ImageProcessor.mix_harmonized(harmonized, self.fg_rgb)
+        return self._get("fg_harmonized_mask", build)
+
+    def mask(self):
+        return self._get("mask", lambda: ImageProcessor.refine_mask_edge(self.mask_raw))
+
+    def alpha(self):
+        return self._get("alpha", lambda: ImageProcessor.mask_to_alpha(self.mask()))
+
+    def edge_factor(self):
+        return self._get("edge_factor", lambda: ImageProcessor.light_wrap_edge(self.mask(), self.scale))
+
+    def portrait(self):
+        """人像模式：虚化原图背景 (不需要背景图)"""
+        def build():
+            sigma = self.PORTRAIT_SIGMA_RATIO * max(self.fg_rgb.shape[:2])
+            return portrait_blur(self.fg_rgb, self.mask_raw, max_sigma=sigma)
+        return self._get("portrait", build)
+
+    # --- 合成 ---
+    def composite(self, use_harmonize=False, use_light_wrap=False, brightness=0,
+                  roi_rects=None, display_size=None, blend_mode="linear", harmonize_mode="global",
+                  use_roi=False, portrait_mode=False):
+        """
+        与 ImageProcessor.composite_images(..., sample_size=self.sample_size) 结果一致，但复用已缓存的中间结果
+        (composite_images 默认用全图统计量，与默认抽样的会话相比，global 色彩融合最多相差约 10 个色阶；
+         use_roi 且开启 Light Wrap 时，两者的 ROI 模糊边界处理不同，最多相差 1 个色阶)
+        portrait_mode=True 时不使用背景图，而是虚化原图背景 (其余合成参数不生效)
+        """
+        if not self.is_ready(not portrait_mode): return None
+
+        if portrait_mode:
+            composite = self.portrait().copy()
+            ImageProcessor.apply_roi_blur(composite, roi_rects, display_size, self.scale)
+            return composite
+
+        fg = self.fg_rgb
+        if use_harmonize:
+            fg = self.fg_harmonized_mask() if harmonize_mode == "mask" else self.fg_harmonized()
+
+        bg_blur, edge_factor = None, None
+        if use_light_wrap:
+            bg_blur = self.bg_blur()
+            edge_factor = self.edge_factor()
+
+        if use_roi:
+            # 只在蒙版包围盒内做亮度调整和混合，其余区域直接复制背景 (缓存的全图中间结果按切片使用)
+            bg = self.bg_resized()
+            composite = bg.copy()
+            margin = ImageProcessor.ROI_MARGIN_PYRAMID if blend_mode == "pyramid" else ImageProcessor.ROI_MARGIN
+            box = ImageProcessor.mask_bbox(self.mask_raw, margin)
+            if box is not None:
+                x0, y0, x1, y1 = box
+                roi = (slice(y0, y1), slice(x0, x1))
+                composite[roi] = ImageProcessor.blend(
+                    ImageProcessor.adjust_brightness(fg[roi], brightness), self.alpha()[roi], bg[roi],
+                    None if bg_blur is None else bg_blur[roi],
+                    None if edge_factor is None else edge_factor[roi],
+                    blend_mode, self._blender)
+        else:
+            fg = ImageProcessor.adjust_brightness(fg, brightness)
+            composite = ImageProcessor.blend(fg, self.alpha(), self.bg_resized(), bg_blur, edge_factor,
+                                             blend_mode, self._blender)
+        ImageProcessor.apply_roi_blur(composite, roi_rects, display_size, self.scale)
+        return composite
+
+    # --- 双层合成 (预览 / 全分辨率) ---
+    @staticmethod
+    def _downscale(img, size):
+        if img is None: return None
+        if img.shape[1] == size[0] and img.shape[0] == size[1]: return img
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+    def _preview_target(self, display_size):
+        """按 KeepAspectRatio 计算前景在 display_size 内的实际显示尺寸 (不放大)"""
+        h, w = self.fg_rgb.shape[:2]
+        disp_w, disp_h = display_size
+        scale = min(disp_w / w, disp_h / h, 1.0)
+        return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+    def composite_preview(self, display_size, **params):
+        """
+        在显示分辨率下合成预览，用于即时反馈
+        参数会被记录下来，保存时由 render_full 以相同参数计算全分辨率结果
+        """
+        if not self.is_ready(not params.get("portrait_mode")) or not display_size or min(display_size) <= 0:
+            return None
+
+        params = dict(params, display_size=display_size)
+        if params != self._last_params:
+            self._last_params = params
+            self._full_result = None
+
+        target = self._preview_target(display_size)
+        if self._preview is None or self._preview_size != target:
+            self._preview_size = target
+            self._preview = CompositeSession(scale=target[0] / self.fg_rgb.shape[1], sample_size=self.sample_size)
+            self._preview.set_foreground(self._downscale(self.fg_rgb, target))
+            self._preview.set_mask(self._downscale(self.mask_raw, target))
+            self._preview.set_background(self._downscale(self.bg_rgb, target))
+
+        return self._preview.composite(**params)
+
+    def render_full(self):
+        """以最近一次预览的参数计算全分辨率合成图 (结果缓存到输入或参数变化为止)"""
+        if not self.is_ready(not self._last_params.get("portrait_mode")): return None
+        if self._full_result is None:
+            self._full_result = self.composite(**self._last_params)
+        return self._full_result
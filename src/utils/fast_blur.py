@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+
+# 超过该核尺寸才启用近似算法，小核直接走 cv2.GaussianBlur
+# 金字塔近似与精确模糊的误差 (默认容忍度)：切换点附近 k=27~51 平均绝对误差 < 0.5 个色阶
+# (见 tests/test_fast_blur.py)，4000x3000 的照片约 0.2；小图上 k=101 约 0.75。
+# 硬边缘和高频细节附近单像素误差较大：k=51 最大约 14~17，k=101 最大约 22~30。
+# 只适合光效、背景虚化这类低频用途，需要逐像素精确时传 method="exact"
+# 耗时对比见 benchmarks/bench_fast_blur.py
+EXACT_KSIZE_THRESHOLD = 25
+# 近似误差容忍度：重采样引入的方差占目标方差的最大比例 (越小越精确、越慢)
+DEFAULT_TOLERANCE = 0.15
+
+
+def sigma_from_ksize(ksize):
+    """与 OpenCV 一致：sigma <= 0 时由核尺寸推导"""
+    return 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+
+
+def ksize_from_sigma(sigma, dtype=np.uint8):
+    """与 OpenCV 一致：ksize 为 0 时由 sigma 推导"""
+    return int(round(sigma * (3 if dtype == np.uint8 else 4) * 2 + 1)) | 1
+
+
+def _resolve(img, ksize, sigma):
+    if isinstance(ksize, (tuple, list)): ksize = ksize[0]
+    if ksize <= 0: ksize = ksize_from_sigma(sigma, img.dtype)
+    if sigma <= 0: sigma = sigma_from_ksize(ksize)
+    return ksize, sigma
+
+
+def _pyramid_factor(sigma, tolerance):
+    """
+    选择最大的下采样倍数 f (2 的幂)，使重采样引入的模糊方差不超过容忍度
+    INTER_AREA 下采样 + 线性上采样约引入 f^2/4 的方差
+    """
+    f = 1
+    while (2 * f) ** 2 / 4.0 <= tolerance * sigma * sigma:
+        f *= 2
+    return f
+
+
+def gaussian_blur(img, ksize, sigma=0, method="auto", tolerance=DEFAULT_TOLERANCE):
+    """
+    大核高斯模糊服务
+    :param ksize: 核尺寸 (int 或 (k, k))，0 表示由 sigma 推导
+    :param method: 'auto' (小核精确，大核金字塔), 'exact', 'pyramid', 'box'
+    :param tolerance: 金字塔近似允许的方差误差比例
+    :return: 与输入同尺寸、同类型的模糊图像
+    """
+    ksize, sigma = _resolve(img, ksize, sigma)
+
+    if method == "auto":
+        method = "exact" if ksize <= EXACT_KSIZE_THRESHOLD else "pyramid"
+
+    if method == "box":
+        return box_blur(img, sigma)
+    if method == "pyramid":
+        f = _pyramid_factor(sigma, tolerance)
+        if f > 1 and min(img.shape[:2]) >= 4 * f:
+            return pyramid_blur(img, sigma, f)
+    return cv2.GaussianBlur(img, (ksize, ksize), sigma)
+
+
+def pyramid_blur(img, sigma, factor):
+    """下采样 -> 小图模糊 -> 上采样，补偿重采样本身带来的模糊"""
+    h, w = img.shape[:2]
+    small = cv2.resize(img, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+    # 扣除重采样引入的方差 (约 f^2/4)，剩余部分在小图上完成
+    low_var = max(sigma * sigma - factor * factor / 4.0, 0.25 * factor * factor) / (factor * factor)
+    low_sigma = float(np.sqrt(low_var))
+    small = cv2.GaussianBlur(small, (0, 0), low_sigma)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def box_blur(img, sigma, passes=3):
+    """多次均值滤波逼近高斯 (中心极限定理)，耗时与核尺寸无关"""
+    # n 次宽度为 r 的均值滤波方差为 n * (r^2 - 1) / 12
+    r = int(np.sqrt(12.0 * sigma * sigma / passes + 1))
+    r = max(1, r | 1)
+    out = img
+    for _ in range(passes):
+        out = cv2.blur(out, (r, r))
+    return out
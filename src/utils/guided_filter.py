@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+# 全分辨率阶段每条带的行数
+STRIP_ROWS = 256
+
+
+def _box(img, r):
+    """O(N) 均值滤波，耗时与半径无关"""
+    return cv2.blur(img, (2 * r + 1, 2 * r + 1), borderType=cv2.BORDER_REFLECT)
+
+
+def guided_filter_coeffs(guide, src, r, eps):
+    """
+    彩色引导滤波的线性系数 (He et al.)
+    :param guide: (H, W, 3) float32, 0~1
+    :param src: (H, W) float32, 0~1
+    :return: (a, b)，a 为 (H, W, 3)，b 为 (H, W)
+    """
+    h, w = src.shape
+    mean_I = _box(guide, r)
+    mean_p = _box(src, r)
+    mean_Ip = _box(guide * src[:, :, None], r)
+    cov_Ip = mean_Ip - mean_I * mean_p[:, :, None]
+
+    # 引导图的 3x3 协方差矩阵 (对称，只算 6 个分量)
+    r_, g_, b_ = guide[:, :, 0], guide[:, :, 1], guide[:, :, 2]
+    var_1 = _box(np.dstack((r_ * r_, r_ * g_, r_ * b_)), r)
+    var_2 = _box(np.dstack((g_ * g_, g_ * b_, b_ * b_)), r)
+    m_r, m_g, m_b = mean_I[:, :, 0], mean_I[:, :, 1], mean_I[:, :, 2]
+
+    sigma = np.empty((h, w, 3, 3), np.float32)
+    sigma[:, :, 0, 0] = var_1[:, :, 0] - m_r * m_r + eps
+    sigma[:, :, 0, 1] = sigma[:, :, 1, 0] = var_1[:, :, 1] - m_r * m_g
+    sigma[:, :, 0, 2] = sigma[:, :, 2, 0] = var_1[:, :, 2] - m_r * m_b
+    sigma[:, :, 1, 1] = var_2[:, :, 0] - m_g * m_g + eps
+    sigma[:, :, 1, 2] = sigma[:, :, 2, 1] = var_2[:, :, 1] - m_g * m_b
+    sigma[:, :, 2, 2] = var_2[:, :, 2] - m_b * m_b + eps
+
+    a = np.linalg.solve(sigma, cov_Ip[:, :, :, None])[:, :, :, 0]
+    b = mean_p - np.einsum("hwc,hwc->hw", a, mean_I)
+    return a.astype(np.float32), b.astype(np.float32)
+
+
+def _resize_coords(dst_len, src_len):
+    """与 cv2.resize (INTER_LINEAR) 一致的目标像素 -> 源坐标映射"""
+    return ((np.arange(dst_len, dtype=np.float32) + 0.5) * (src_len / dst_len) - 0.5).astype(np.float32)
+
+
+def fast_guided_filter(guide_rgb, src, r, eps=1e-3, work_size=640):
+    """
+    快速引导滤波：在低分辨率下求线性系数，再按原图引导上采样
+    全分辨率阶段按 STRIP_ROWS 行一条处理，系数只在条带内上采样，
+    峰值内存与原图大小基本无关 (不生成全尺寸的 float 系数图和引导图)
+    :param guide_rgb: (H, W, 3) uint8 引导图 (原图)
+    :param src: (H, W) uint8 待滤波图 (粗蒙版)
+    :param r: 低分辨率下的窗口半径
+    :param work_size: 低分辨率长边上限
+    :return: (H, W) uint8 软蒙版
+    """
+    h, w = src.shape[:2]
+    scale = min(1.0, work_size / max(h, w))
+    sw, sh = max(1, int(w * scale)), max(1, int(h * scale))
+
+    guide_small = cv2.resize(guide_rgb, (sw, sh), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+    src_small = cv2.resize(src, (sw, sh), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+    a, b = guided_filter_coeffs(guide_small, src_small, r, eps)
+    # (sh, sw, 4)：前 3 个通道为 a，最后一个为 b，一次 remap 完成上采样
+    coeffs = np.dstack((_box(a, r), _box(b, r)))
+
+    out = np.empty((h, w), np.uint8)
+    map_x = np.tile(_resize_coords(w, sw), (min(STRIP_ROWS, h), 1))
+    ys = _resize_coords(h, sh)
+    for y0 in range(0, h, STRIP_ROWS):
+        y1 = min(h, y0 + STRIP_ROWS)
+        map_y = np.repeat(ys[y0:y1, None], w, axis=1)
+        # 系数上采样后用全分辨率原图作为引导，边缘细节来自原图
+        c = cv2.remap(coeffs, map_x[:y1 - y0], map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        guide = guide_rgb[y0:y1].astype(np.float32) * (1.0 / 255.0)
+        q = np.einsum("hwc,hwc->hw", c[:, :, :3], guide) + c[:, :, 3]
+        out[y0:y1] = np.clip(q * 255.0 + 0.5, 0, 255)
+    return out
+
+
+def refine_mask(image_rgb, mask, radius=8, eps=1e-3, work_size=640):
+    """
+    将模型输出的粗蒙版细化为贴合发丝的软 alpha
+    :param image_rgb: 原图 (H, W, 3) uint8
+    :param mask: predict 输出的蒙版 (H, W) uint8, 0/255
+    :return: 软蒙版 (H, W) uint8
+    """
+    if mask is None or image_rgb is None: return mask
+    if mask.shape[:2] != image_rgb.shape[:2]:
+        mask = cv2.resize(mask, (image_rgb.shape[1], image_rgb.shape[0]), interpolation=cv2.INTER_LINEAR)
+    return fast_guided_filter(image_rgb, mask, radius, eps, work_size)
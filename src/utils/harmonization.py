@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+# 统计量采样的长边上限：按步长抽取像素 (不做平均，保留方差)
+DEFAULT_SAMPLE_SIZE = 512
+
+
+def subsample(img, sample_size=DEFAULT_SAMPLE_SIZE):
+    """按固定步长抽取像素子集，长边不超过 sample_size；None 表示不抽样"""
+    if sample_size is None: return img
+    step = max(1, int(np.ceil(max(img.shape[:2]) / sample_size)))
+    return img[::step, ::step] if step > 1 else img
+
+
+def lab_stats(img_rgb, mask=None, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    只计算 LAB 均值/标准差，不生成全尺寸 float32 LAB 图
+    :param mask: 可选 (H, W) uint8，仅统计非零像素
+    :return: (mean, std)，各为长度 3 的 float64 数组
+    """
+    img = subsample(img_rgb, sample_size)
+    if mask is not None:
+        mask = subsample(mask, sample_size)
+        if cv2.countNonZero(mask) == 0: mask = None
+    lab = cv2.cvtColor(np.ascontiguousarray(img), cv2.COLOR_RGB2LAB)
+    mean, std = cv2.meanStdDev(lab, mask=None if mask is None else np.ascontiguousarray(mask))
+    return mean.flatten(), std.flatten()
+
+
+def build_transfer_lut(src_stats, tgt_stats):
+    """
+    Reinhard 迁移在 LAB 各通道上是仿射变换，uint8 输入只有 256 种取值，
+    因此可以预先算成 (256, 1, 3) 的查找表，结果与逐像素 float 计算完全一致
+    """
+    src_mean, src_std = src_stats
+    tgt_mean, tgt_std = tgt_stats
+    tgt_std = np.where(tgt_std == 0, 1e-5, tgt_std)
+
+    x = np.arange(256, dtype=np.float64)
+    lut = np.empty((256, 1, 3), np.uint8)
+    # L通道只迁移 50%
+    l_scale = src_std[0] / tgt_std[0]
+    l = (x - tgt_mean[0]) * l_scale * 0.5 + src_mean[0] * 0.5 + tgt_mean[0] * 0.5
+    lut[:, 0, 0] = np.clip(l.astype(np.float32), 0, 255).astype(np.uint8)
+    for i in range(1, 3):
+        scale = src_std[i] / tgt_std[i]
+        ch = (x - tgt_mean[i]) * scale + src_mean[i]
+        lut[:, 0, i] = np.clip(ch.astype(np.float32), 0, 255).astype(np.uint8)
+    return lut
+
+
+def apply_transfer(target_rgb, lut):
+    """RGB -> LAB(uint8) -> 查表 -> RGB，全程 uint8，不复制 float 中间图"""
+    lab = cv2.cvtColor(target_rgb, cv2.COLOR_RGB2LAB)
+    cv2.LUT(lab, lut, dst=lab)
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+
+
+def harmonize(source_rgb, target_rgb, sample_size=DEFAULT_SAMPLE_SIZE):
+    """用 source (背景) 的色调统计量校正 target (前景)"""
+    lut = build_transfer_lut(lab_stats(source_rgb, sample_size=sample_size),
+                             lab_stats(target_rgb, sample_size=sample_size))
+    return apply_transfer(target_rgb, lut)
+
+
+def region_masks(mask, band_ratio=0.1, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    在抽样后的蒙版上求人像区域和人像周边的背景环带
+    :param band_ratio: 环带宽度占长边的比例
+    :return: (person, band)，抽样尺寸下的 uint8 蒙版
+    """
+    small = subsample(mask, sample_size)
+    person = np.where(small > 127, 255, 0).astype(np.uint8)
+    k = max(3, int(max(small.shape[:2]) * band_ratio) | 1)
+    grown = cv2.dilate(person, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k)))
+    band = cv2.subtract(grown, person)
+    return person, band
+
+
+def mask_aware_stats(bg_rgb, fg_rgb, mask, band_ratio=0.1, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    前景只统计人像像素，背景只统计人像放置位置附近的环带像素
+    bg_rgb / fg_rgb / mask 需同尺寸 (背景已缩放到前景大小)
+    :return: (bg_stats, fg_stats)
+    """
+    person, band = region_masks(mask, band_ratio, sample_size)
+    bg_stats = lab_stats(subsample(bg_rgb, sample_size), band, sample_size=None)
+    fg_stats = lab_stats(subsample(fg_rgb, sample_size), person, sample_size=None)
+    return bg_stats, fg_stats
+
+
+def harmonize_masked(source_rgb, target_rgb, mask, band_ratio=0.1, sample_size=DEFAULT_SAMPLE_SIZE):
+    """蒙版感知的颜色迁移：只用人像和其周边背景的统计量"""
+    bg_stats, fg_stats = mask_aware_stats(source_rgb, target_rgb, mask, band_ratio, sample_size)
+    return apply_transfer(target_rgb, build_transfer_lut(bg_stats, fg_stats))
+
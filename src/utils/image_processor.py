@@ -1,115 +1,312 @@
 import cv2
 import numpy as np
+from src.utils.fast_blur import gaussian_blur, EXACT_KSIZE_THRESHOLD
+from src.utils.pyramid_blend import PyramidBlender
+from src.utils import harmonization
 
 class ImageProcessor:
+    # ROI 模式下包围盒的外扩边距：需覆盖 Light Wrap 大核模糊半径 (25px)；
+    # 金字塔融合的低频层影响范围更大 (约 4 * 2^levels)
+    ROI_MARGIN = 32
+    ROI_MARGIN_PYRAMID = 160
+    # 包围盒左上角对齐到该倍数，保证降采样模糊的网格与全图一致
+    ROI_ALIGN = 32
+    # 局部虚化的模糊核 (与旧版逐矩形 cv2.GaussianBlur(roi, (51, 51), 20) 相同：截断到半径 25，等效 sigma 约 13)
+    ROI_BLUR_KSIZE = 51
+    ROI_BLUR_SIGMA = 20
+    # 局部虚化矩形的边缘羽化强度 (sigma，全分辨率像素)
+    ROI_FEATHER = 4
+
     @staticmethod
-    def composite_images(fg_rgb, mask_raw, bg_rgb, 
-                         use_harmonize=False, 
-                         use_light_wrap=False, 
-                         brightness=0, 
-                         roi_rects=None, 
-                         display_size=None):
-        
+    def composite_images(fg_rgb, mask_raw, bg_rgb,
+                         use_harmonize=False,
+                         use_light_wrap=False,
+                         brightness=0,
+                         roi_rects=None,
+                         display_size=None,
+                         blend_mode="linear",
+                         harmonize_mode="global",
+                         use_roi=False,
+                         sample_size=None):
+        """
+        :param sample_size: global 色彩融合的统计量抽样长边上限，None 为全图统计；
+                            CompositeSession 默认抽样，传入相同的值时两者结果一致
+        """
+        if use_roi:
+            return ImageProcessor._composite_roi(fg_rgb, mask_raw, bg_rgb, use_harmonize, use_light_wrap,
+                                                 brightness, roi_rects, display_size, blend_mode, harmonize_mode,
+                                                 sample_size)
+
         h, w = fg_rgb.shape[:2]
-        
+
         # 1. 背景适配
-        if bg_rgb.shape[:2] != (h, w):
-            bg_resized = cv2.resize(bg_rgb, (w, h), interpolation=cv2.INTER_LINEAR)
-        else:
-            bg_resized = bg_rgb
+        bg_resized = ImageProcessor.fit_background(bg_rgb, (w, h))
 
         # 2. 优化 Mask (消除锯齿和白边)
-        mask = mask_raw.copy()
-        # 轻微腐蚀边缘 (1像素)，去掉白边
-        kernel = np.ones((3,3), np.uint8)
-        mask = cv2.erode(mask, kernel, iterations=1)
-        # 轻微模糊，让边缘平滑
-        mask = cv2.GaussianBlur(mask, (3, 3), 0)
-        
-        alpha = mask.astype(np.float32) / 255.0
-        alpha = np.expand_dims(alpha, axis=2)
+        mask = ImageProcessor.refine_mask_edge(mask_raw)
+        alpha = ImageProcessor.mask_to_alpha(mask)
 
         # 3. 准备前景
-        fg = fg_rgb.copy()
+        fg = fg_rgb
 
         # --- 改进 A: 温和的色彩一致 (Color Harmonization) ---
         if use_harmonize:
-            # 计算环境色
-            harmonized = ImageProcessor.color_transfer(bg_resized, fg)
-            # 关键修改：只应用 50% 的环境色，保留 50% 原本肤色，防止变色太夸张
-            fg = cv2.addWeighted(harmonized, 0.5, fg, 0.5, 0)
+            # 计算环境色 (global: 全图统计; mask: 只用人像和其周边背景)
+            if harmonize_mode == "mask":
+                harmonized = harmonization.harmonize_masked(bg_resized, fg, mask_raw)
+            else:
+                harmonized = ImageProcessor.color_transfer(bg_resized, fg, sample_size)
+            fg = ImageProcessor.mix_harmonized(harmonized, fg)
 
         # --- 亮度调整 ---
-        if brightness != 0:
-            beta = brightness * 2
-            lut = np.arange(256, dtype=np.int16) + beta
-            lut = np.clip(lut, 0, 255).astype(np.uint8)
-            fg = cv2.LUT(fg, lut)
-
-        # --- 基础合成 ---
-        fg_float = fg.astype(np.float32)
-        bg_float = bg_resized.astype(np.float32)
-        
-        # 前景 * alpha + 背景 * (1 - alpha)
-        composite = fg_float * alpha + bg_float * (1.0 - alpha)
+        fg = ImageProcessor.adjust_brightness(fg, brightness)
 
         # --- 改进 B: 自然的环境光溢出 (Light Wrap) ---
+        bg_blur, edge_factor = None, None
         if use_light_wrap:
-            # 1. 大范围模糊背景 (模拟漫反射光)
-            bg_blur = cv2.GaussianBlur(bg_resized, (51, 51), 0)
-            
-            # 2. 提取边缘区域 (反转Mask -> 模糊 -> 乘回原Mask)
-            mask_inv = 255 - mask
-            edge_mask = cv2.GaussianBlur(mask_inv, (21, 21), 0) # 边缘宽度
-            # 归一化并限制在前景边缘
-            edge_factor = (edge_mask.astype(np.float32) / 255.0) * (mask.astype(np.float32) / 255.0)
-            edge_factor = np.expand_dims(edge_factor, axis=2)
-            
-            # 3. 叠加光效 (使用 Add 模式，让边缘变亮变暖)
+            bg_blur = ImageProcessor.light_wrap_background(bg_resized)
+            edge_factor = ImageProcessor.light_wrap_edge(mask)
+
+        # --- 基础合成 + 光效叠加 ---
+        composite = ImageProcessor.blend(fg, alpha, bg_resized, bg_blur, edge_factor, blend_mode)
+
+        # --- 局部虚化 ---
+        ImageProcessor.apply_roi_blur(composite, roi_rects, display_size)
+
+        return composite
+
+    @staticmethod
+    def _composite_roi(fg_rgb, mask_raw, bg_rgb, use_harmonize, use_light_wrap,
+                       brightness, roi_rects, display_size, blend_mode, harmonize_mode, sample_size=None):
+        """
+        只在蒙版包围盒 (+ 模糊边距) 内做合成，其余区域直接复制背景
+        色彩统计量仍取自全图，保证与全图合成结果一致
+        """
+        h, w = fg_rgb.shape[:2]
+        bg_resized = ImageProcessor.fit_background(bg_rgb, (w, h))
+        composite = bg_resized.copy()
+
+        margin = ImageProcessor.ROI_MARGIN_PYRAMID if blend_mode == "pyramid" else ImageProcessor.ROI_MARGIN
+        box = ImageProcessor.mask_bbox(mask_raw, margin)
+        if box is not None:
+            x0, y0, x1, y1 = box
+            fg_roi = fg_rgb[y0:y1, x0:x1]
+            if use_harmonize:
+                if harmonize_mode == "mask":
+                    stats = harmonization.mask_aware_stats(bg_resized, fg_rgb, mask_raw)
+                else:
+                    stats = (harmonization.lab_stats(bg_resized, sample_size=sample_size),
+                             harmonization.lab_stats(fg_rgb, sample_size=sample_size))
+                lut = harmonization.build_transfer_lut(*stats)
+                fg_roi = ImageProcessor.mix_harmonized(harmonization.apply_transfer(fg_roi, lut), fg_roi)
+
+            composite[y0:y1, x0:x1] = ImageProcessor.composite_images(
+                fg_roi, mask_raw[y0:y1, x0:x1], bg_resized[y0:y1, x0:x1],
+                use_harmonize=False, use_light_wrap=use_light_wrap, brightness=brightness,
+                blend_mode=blend_mode)
+
+        ImageProcessor.apply_roi_blur(composite, roi_rects, display_size)
+        return composite
+
+    @staticmethod
+    def mask_bbox(mask, margin=0, align=None):
+        """
+        蒙版非零区域的包围盒，外扩 margin 并裁剪到图像内
+        :return: (x0, y0, x1, y1)，蒙版全空时返回 None
+        """
+        x, y, bw, bh = cv2.boundingRect(mask)
+        if bw == 0 or bh == 0: return None
+        h, w = mask.shape[:2]
+        align = align or ImageProcessor.ROI_ALIGN
+        x0 = max(0, x - margin) // align * align
+        y0 = max(0, y - margin) // align * align
+        x1 = min(w, x + bw + margin)
+        y1 = min(h, y + bh + margin)
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def fit_background(bg_rgb, size):
+        """将背景缩放到 size=(w, h)，尺寸一致时直接返回"""
+        w, h = size
+        if bg_rgb.shape[:2] != (h, w):
+            return cv2.resize(bg_rgb, (w, h), interpolation=cv2.INTER_LINEAR)
+        return bg_rgb
+
+    @staticmethod
+    def refine_mask_edge(mask_raw):
+        """轻微腐蚀 + 模糊，消除蒙版锯齿和白边"""
+        # 轻微腐蚀边缘 (1像素)，去掉白边
+        kernel = np.ones((3,3), np.uint8)
+        mask = cv2.erode(mask_raw, kernel, iterations=1)
+        # 轻微模糊，让边缘平滑
+        return cv2.GaussianBlur(mask, (3, 3), 0)
+
+    @staticmethod
+    def mask_to_alpha(mask):
+        """uint8 蒙版 -> (H, W, 1) float32 alpha"""
+        alpha = mask.astype(np.float32) / 255.0
+        return np.expand_dims(alpha, axis=2)
+
+    @staticmethod
+    def mix_harmonized(harmonized, fg):
+        # 关键修改：只应用 50% 的环境色，保留 50% 原本肤色，防止变色太夸张
+        return cv2.addWeighted(harmonized, 0.5, fg, 0.5, 0)
+
+    @staticmethod
+    def adjust_brightness(fg, brightness):
+        if brightness == 0:
+            return fg
+        beta = brightness * 2
+        lut = np.arange(256, dtype=np.int16) + beta
+        lut = np.clip(lut, 0, 255).astype(np.uint8)
+        return cv2.LUT(fg, lut)
+
+    @staticmethod
+    def scaled_ksize(ksize, scale=1.0):
+        """按分辨率缩放模糊核尺寸 (保持奇数)，scale=1 时原样返回"""
+        if scale == 1.0: return ksize
+        return max(1, int(ksize * scale)) | 1
+
+    @staticmethod
+    def light_wrap_background(bg_resized, scale=1.0):
+        # 大范围模糊背景 (模拟漫反射光)
+        k = ImageProcessor.scaled_ksize(51, scale)
+        return gaussian_blur(bg_resized, k)
+
+    @staticmethod
+    def light_wrap_edge(mask, scale=1.0):
+        """提取前景边缘区域 (反转Mask -> 模糊 -> 乘回原Mask)，返回 (H, W, 1) float32"""
+        mask_inv = 255 - mask
+        k = ImageProcessor.scaled_ksize(21, scale)
+        edge_mask = gaussian_blur(mask_inv, k) # 边缘宽度
+        # 归一化并限制在前景边缘
+        edge_factor = (edge_mask.astype(np.float32) / 255.0) * (mask.astype(np.float32) / 255.0)
+        return np.expand_dims(edge_factor, axis=2)
+
+    @staticmethod
+    def blend(fg, alpha, bg_resized, bg_blur=None, edge_factor=None, blend_mode="linear", blender=None):
+        """
+        前景 * alpha + 背景 * (1 - alpha)，可选叠加 Light Wrap 光效
+        :param blend_mode: 'linear' 单层线性混合 / 'pyramid' 拉普拉斯金字塔多尺度融合
+        :param blender: 金字塔模式使用的 PyramidBlender (会话自己持有，复用缓冲区)；
+                        默认每次新建，缓冲区随调用释放，可以在多个线程中同时调用
+        """
+        if blend_mode == "pyramid":
+            composite = (blender or PyramidBlender()).blend(fg, bg_resized, alpha)
+        else:
+            fg_float = fg.astype(np.float32)
+            bg_float = bg_resized.astype(np.float32)
+
+            composite = fg_float * alpha + bg_float * (1.0 - alpha)
+
+        if bg_blur is not None and edge_factor is not None:
+            # 叠加光效 (使用 Add 模式，让边缘变亮变暖)
             # 强度设为 0.7
             light_layer = bg_blur.astype(np.float32) * edge_factor * 0.7
             composite = cv2.add(composite, light_layer)
 
-        composite = np.clip(composite, 0, 255).astype(np.uint8)
+        return np.clip(composite, 0, 255).astype(np.uint8)
 
-        # --- 局部虚化 ---
-        if roi_rects and display_size:
-            disp_w, disp_h = display_size
-            scale_x = w / disp_w
-            scale_y = h / disp_h
-            for rect in roi_rects:
-                x = int(rect.x() * scale_x); y = int(rect.y() * scale_y)
-                rw = int(rect.width() * scale_x); rh = int(rect.height() * scale_y)
-                if rw < 1 or rh < 1: continue
-                x = max(0, x); y = max(0, y)
-                x2 = min(w, x + rw); y2 = min(h, y + rh)
-                roi = composite[y:y2, x:x2]
-                if roi.size > 0:
-                    composite[y:y2, x:x2] = cv2.GaussianBlur(roi, (51, 51), 20)
+    @staticmethod
+    def apply_roi_blur(composite, roi_rects, display_size, scale=1.0):
+        """
+        对显示坐标系下的矩形区域做局部虚化 (原地修改)
+        外扩模糊半径后相互重叠的矩形合并成一组，每组画一张羽化边缘的蒙版，只在该组包围盒内模糊一次再混合；
+        重叠的矩形不会重复模糊，相距很远的矩形也不会把中间的大片空白一起模糊
+        """
+        if not roi_rects or not display_size:
+            return composite
+        h, w = composite.shape[:2]
+        disp_w, disp_h = display_size
+        scale_x = w / disp_w
+        scale_y = h / disp_h
+
+        boxes = []
+        for rect in roi_rects:
+            x = int(rect.x() * scale_x); y = int(rect.y() * scale_y)
+            rw = int(rect.width() * scale_x); rh = int(rect.height() * scale_y)
+            if rw < 1 or rh < 1: continue
+            x = max(0, x); y = max(0, y)
+            x2 = min(w, x + rw); y2 = min(h, y + rh)
+            if x2 > x and y2 > y: boxes.append((x, y, x2, y2))
+        if not boxes: return composite
+
+        # 包围盒外扩模糊半径，边缘处的模糊能取到矩形外的真实像素
+        ksize = ImageProcessor.scaled_ksize(ImageProcessor.ROI_BLUR_KSIZE, scale)
+        sigma = ImageProcessor.ROI_BLUR_SIGMA * scale
+        feather = ImageProcessor.ROI_FEATHER * scale
+        pad = ksize // 2 + int(2 * feather) + 1
+        for x0, y0, x1, y1, group in ImageProcessor._roi_groups(boxes, pad, w, h):
+            region = composite[y0:y1, x0:x1]
+
+            # 羽化蒙版很平滑，在 1/4 分辨率下绘制和模糊后再线性放大
+            rh, rw = region.shape[:2]
+            f = 4 if min(rh, rw) >= 16 else 1
+            mask = np.zeros((rh // f, rw // f), np.float32)
+            for x, y, x2, y2 in group:
+                mask[(y - y0) // f:-(-(y2 - y0) // f), (x - x0) // f:-(-(x2 - x0) // f)] = 1.0
+            if feather / f >= 0.5:
+                mask = cv2.GaussianBlur(mask, (0, 0), feather / f)
+            if f > 1:
+                mask = cv2.resize(mask, (rw, rh), interpolation=cv2.INTER_LINEAR)
 
+            blurred = ImageProcessor._roi_blur_region(region, ksize, sigma)
+            region[:] = cv2.blendLinear(blurred, region, mask, 1.0 - mask)
         return composite
 
     @staticmethod
-    def color_transfer(source, target):
-        """Reinhard 颜色迁移 (保持不变)"""
-        source_lab = cv2.cvtColor(source, cv2.COLOR_RGB2LAB).astype(np.float32)
-        target_lab = cv2.cvtColor(target, cv2.COLOR_RGB2LAB).astype(np.float32)
+    def _roi_blur_region(region, ksize, sigma):
+        """
+        与旧版相同的截断核 (ksize, sigma) 模糊
+        大核时缩小一半，把截断核按采样位置线性分摊到半分辨率的等效核上模糊，再线性放大；
+        51 核在硬边缘附近的平均误差约 0.25 个色阶
+        """
+        rh, rw = region.shape[:2]
+        if ksize <= EXACT_KSIZE_THRESHOLD or min(rh, rw) < 8:
+            return cv2.GaussianBlur(region, (ksize, ksize), sigma)
+        r = ksize // 2
+        pos = np.arange(-r, r + 1) / 2.0
+        weight = np.exp(-(np.arange(-r, r + 1) ** 2) / (2.0 * sigma * sigma))
+        i0 = np.floor(pos).astype(int) + r // 2 + 1
+        frac = pos - np.floor(pos)
+        kernel = np.zeros(r + 3)
+        np.add.at(kernel, i0, weight * (1.0 - frac))
+        np.add.at(kernel, i0 + 1, weight * frac)
+        kernel = np.trim_zeros(kernel).astype(np.float32)
+        kernel /= kernel.sum()
 
-        src_mean, src_std = cv2.meanStdDev(source_lab)
-        tgt_mean, tgt_std = cv2.meanStdDev(target_lab)
+        small = cv2.resize(region, (-(-rw // 2), -(-rh // 2)), interpolation=cv2.INTER_AREA)
+        small = cv2.sepFilter2D(small, -1, kernel, kernel)
+        return cv2.resize(small, (rw, rh), interpolation=cv2.INTER_LINEAR)
 
-        src_mean = src_mean.flatten(); src_std = src_std.flatten()
-        tgt_mean = tgt_mean.flatten(); tgt_std = tgt_std.flatten()
-        tgt_std[tgt_std == 0] = 1e-5
-
-        res_lab = target_lab.copy()
-        # L通道只迁移 50%
-        l_scale = src_std[0] / tgt_std[0]
-        res_lab[:,:,0] = (target_lab[:,:,0] - tgt_mean[0]) * l_scale * 0.5 + src_mean[0] * 0.5 + tgt_mean[0] * 0.5
-        
-        for i in range(1, 3):
-            scale = src_std[i] / tgt_std[i]
-            res_lab[:,:,i] = (target_lab[:,:,i] - tgt_mean[i]) * scale + src_mean[i]
+    @staticmethod
+    def _roi_groups(boxes, pad, w, h):
+        """
+        把外扩 pad 后有重叠的矩形合并成组，返回 [(x0, y0, x1, y1, 组内矩形)]
+        合并到各组外扩后的包围盒两两不相交为止，各组的模糊和混合互不影响
+        """
+        groups = [[max(0, x - pad), max(0, y - pad), min(w, x2 + pad), min(h, y2 + pad), [(x, y, x2, y2)]]
+                  for x, y, x2, y2 in boxes]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(groups)):
+                for j in range(len(groups) - 1, i, -1):
+                    a, b = groups[i], groups[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        a[:4] = min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+                        a[4].extend(b[4])
+                        del groups[j]
+                        merged = True
+        return [tuple(g[:4]) + (g[4],) for g in groups]
 
-        res_lab = np.clip(res_lab, 0, 255).astype(np.uint8)
-        return cv2.cvtColor(res_lab, cv2.COLOR_LAB2RGB)
\ No newline at end of file
+    @staticmethod
+    def color_transfer(source, target, sample_size=None):
+        """
+        Reinhard 颜色迁移 (保持不变)
+        :param sample_size: 统计量抽样的长边上限，None 为全图统计 (与旧版逐像素计算结果一致)
+        """
+        lut = harmonization.build_transfer_lut(
+            harmonization.lab_stats(source, sample_size=sample_size),
+            harmonization.lab_stats(target, sample_size=sample_size))
+        return harmonization.apply_transfer(target, lut)
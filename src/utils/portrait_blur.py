@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+from src.utils.image_processor import ImageProcessor
+from src.utils.fast_blur import ksize_from_sigma
+
+
+def level_sigmas(max_sigma, levels=5):
+    """各档模糊强度：0, max_sigma / 2^(levels-2), ..., max_sigma/2, max_sigma"""
+    return [0.0] + [max_sigma / 2.0 ** (levels - 1 - i) for i in range(1, levels)]
+
+
+def blur_levels(img_rgb, weight, sigmas):
+    """
+    预先模糊出几档背景 (不含第 0 档原图)
+    用 weight (背景权重) 做归一化模糊，人像像素不会被抹进背景形成光晕
+    :param weight: (H, W) float32, 1 为背景、0 为人像
+    :return: [(H, W, 3) float32, ...]，与 sigmas[1:] 一一对应
+    """
+    img = img_rgb.astype(np.float32)
+    premul = img * weight[:, :, None]
+    out = []
+    for sigma in sigmas[1:]:
+        num = cv2.GaussianBlur(premul, (0, 0), sigma)
+        den = cv2.GaussianBlur(weight, (0, 0), sigma)
+        valid = den > 1e-3
+        level = np.zeros_like(img)
+        np.divide(num, den[:, :, None], out=level, where=valid[:, :, None])
+        # 整个邻域都是人像时 den 为 0，退回未归一化的模糊结果 (只在这些像素附近计算)
+        if not valid.all():
+            _fill_unnormalized(level, img, ~valid, sigma)
+        out.append(level)
+    return out
+
+
+def _fill_unnormalized(level, img, holes, sigma):
+    """在 holes 像素上填入 img 的普通高斯模糊：只模糊 holes 外接矩形外扩核半径的区域，结果与整图模糊一致"""
+    ys, xs = np.nonzero(holes)
+    h, w = holes.shape
+    r = ksize_from_sigma(sigma, np.float32) // 2
+    y0, y1 = max(0, ys.min() - r), min(h, ys.max() + 1 + r)
+    x0, x1 = max(0, xs.min() - r), min(w, xs.max() + 1 + r)
+    blurred = cv2.GaussianBlur(img[y0:y1, x0:x1], (0, 0), sigma)
+    region, sel = level[y0:y1, x0:x1], holes[y0:y1, x0:x1]
+    region[sel] = blurred[sel]
+
+
+def blur_index(mask, size, levels=5, falloff=0.3, work_size=512):
+    """
+    按到人像的距离计算每个像素的模糊档位 (0 ~ levels-1 的小数)
+    距离变换在低分辨率下计算后再线性缩放到 size=(w, h)
+    :param falloff: 达到最大模糊所需的距离，占长边的比例
+    """
+    h, w = mask.shape[:2]
+    scale = min(1.0, work_size / max(h, w))
+    sw, sh = max(1, int(w * scale)), max(1, int(h * scale))
+    small = cv2.resize(mask, (sw, sh), interpolation=cv2.INTER_AREA)
+    background = np.where(small > 127, 0, 255).astype(np.uint8)
+    dist = cv2.distanceTransform(background, cv2.DIST_L2, 3)
+
+    # 距离 -> sigma 比例 (0~1)；档位按几何级数排列，取 log2 映射到档位
+    ratio = np.clip(dist / max(1.0, falloff * max(sw, sh)), 0.0, 1.0)
+    index = np.zeros_like(ratio)
+    nz = ratio > 0
+    index[nz] = levels - 1 + np.log2(ratio[nz])
+    # 靠近人像处改用线性斜坡，避免人像外沿出现一圈清晰背景
+    index[nz] = np.maximum(index[nz], ratio[nz] * (levels - 1))
+    if (sw, sh) != tuple(size):
+        index = cv2.resize(index, tuple(size), interpolation=cv2.INTER_LINEAR)
+    return index
+
+
+def portrait_blur(image_rgb, mask, max_sigma=20.0, falloff=0.3, levels=5, work_size=512):
+    """
+    人像模式：只虚化人像以外的原背景，离人像越远越模糊
+    各档模糊都在降采样后的小图上完成 (模糊越强降得越多)，耗时基本与模糊半径无关
+    :param image_rgb: 原图 (H, W, 3) uint8
+    :param mask: 人像蒙版 (H, W) uint8
+    :param max_sigma: 最远处的模糊强度 (原图像素)
+    :return: (H, W, 3) uint8
+    """
+    h, w = image_rgb.shape[:2]
+    alpha = ImageProcessor.refine_mask_edge(mask).astype(np.float32) / 255.0
+    sigmas = level_sigmas(max_sigma, levels)
+
+    # 最强一档的 sigma 决定降采样倍数 (小图上不低于 4)，弱档的细节本来就会被抹掉
+    f = 1
+    while max_sigma / (2 * f) >= 4:
+        f *= 2
+    sw, sh = max(1, w // f), max(1, h // f)
+    small = cv2.resize(image_rgb, (sw, sh), interpolation=cv2.INTER_AREA)
+    weight = cv2.resize(1.0 - alpha, (sw, sh), interpolation=cv2.INTER_AREA)
+    stack = blur_levels(small, weight, [s / f for s in sigmas])
+
+    # 小图上：在第 1 ~ levels-1 档之间按小数档位线性插值 (三角权重)
+    index = blur_index(mask, (sw, sh), levels, falloff, work_size)
+    t = np.clip(index, 1.0, levels - 1.0)
+    blurred = np.zeros((sh, sw, 3), np.float32)
+    for i, level in enumerate(stack, start=1):
+        wt = np.clip(1.0 - np.abs(t - i), 0.0, 1.0)
+        if wt.any():
+            blurred += level * wt[:, :, None]
+    if (sw, sh) != (w, h):
+        blurred = cv2.resize(blurred, (w, h), interpolation=cv2.INTER_LINEAR)
+        index = cv2.resize(index, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    # 全分辨率只做一次混合：人像 (alpha) 和第 0 档 (档位 < 1 的部分) 保留原图
+    keep = alpha + (1.0 - alpha) * np.clip(1.0 - index, 0.0, 1.0)
+    return ImageProcessor.blend(image_rgb, keep[:, :, None], blurred)
@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+
+
+class PyramidBlender:
+    """
+    拉普拉斯金字塔融合：低频用宽 (模糊后) 的 alpha 融合，高频用窄的 alpha 融合
+    可以去掉线性 alpha 混合在发丝/边缘处留下的光晕
+
+    利用线性关系只构建一个金字塔：
+        out = bg + collapse( L(fg - bg)_i * G(alpha)_i )
+    各层缓冲区按图像尺寸复用，连续调参时不会反复申请大块内存
+    缓冲区属于实例：只在拥有它的会话 (单线程) 内复用，不要在多个线程之间共享同一个实例
+    """
+    def __init__(self, levels=5):
+        self.levels = levels
+        self._shape = None
+        self._diff = []   # fg - bg 的高斯金字塔，原地改写为拉普拉斯金字塔
+        self._alpha = []  # alpha 的高斯金字塔
+        self._up = []     # 每层上采样的临时缓冲
+
+    def _ensure_buffers(self, shape):
+        """按图像尺寸分配 (或复用) 各层缓冲区"""
+        if self._shape == shape: return
+        h, w, c = shape
+        self._diff, self._alpha, self._up = [], [], []
+        for _ in range(self.levels + 1):
+            self._diff.append(np.empty((h, w, c), np.float32))
+            self._alpha.append(np.empty((h, w), np.float32))
+            self._up.append(np.empty((h, w, c), np.float32))
+            if min(h, w) < 2: break
+            h, w = (h + 1) // 2, (w + 1) // 2
+        self._shape = shape
+
+    def blend(self, fg, bg, alpha):
+        """
+        :param fg, bg: (H, W, 3) uint8 或 float32
+        :param alpha: (H, W) 或 (H, W, 1) float32, 0~1
+        :return: (H, W, 3) float32 (未裁剪，供后续叠加光效)
+        """
+        self._ensure_buffers(fg.shape)
+        n = len(self._diff) - 1
+        diff, alp, up = self._diff, self._alpha, self._up
+
+        # 0 层
+        cv2.subtract(fg, bg, dst=diff[0], dtype=cv2.CV_32F)
+        np.copyto(alp[0], alpha.reshape(alpha.shape[:2]))
+
+        # 高斯金字塔
+        for i in range(n):
+            cv2.pyrDown(diff[i], dst=diff[i + 1])
+            cv2.pyrDown(alp[i], dst=alp[i + 1])
+
+        # 原地转为拉普拉斯金字塔: L_i = G_i - up(G_{i+1})
+        for i in range(n):
+            h, w = diff[i].shape[:2]
+            cv2.pyrUp(diff[i + 1], dst=up[i], dstsize=(w, h))
+            cv2.subtract(diff[i], up[i], dst=diff[i])
+
+        # 各层乘以对应尺度的 alpha
+        for i in range(n + 1):
+            np.multiply(diff[i], alp[i][:, :, None], out=diff[i])
+
+        # 自顶向下重建
+        for i in range(n - 1, -1, -1):
+            h, w = diff[i].shape[:2]
+            cv2.pyrUp(diff[i + 1], dst=up[i], dstsize=(w, h))
+            cv2.add(diff[i], up[i], dst=diff[i])
+
+        return cv2.add(diff[0], bg, dtype=cv2.CV_32F)
@@ -0,0 +1,159 @@
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# 默认编码参数：PNG 取最快的压缩级别 (体积略大，速度快数倍)，WebP 默认无损
+DEFAULT_PNG_LEVEL = 1
+DEFAULT_QUALITY = 95
+
+# 单线程后台编码：多次保存按提交顺序执行，界面线程不等待
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+
+def compose_rgba(rgb, alpha, order="rgba", premultiply=False, out=None):
+    """
+    RGB + alpha 直接交织写入 4 通道数组 (cv2.mixChannels 一次完成，无中间拷贝)
+    :param order: 'rgba' (显示用) 或 'bgra' (OpenCV 编码用)
+    :param premultiply: 颜色预乘 alpha (合成软件常用的 premultiplied 格式)
+    :param out: 可复用的 (H, W, 4) uint8 缓冲区，尺寸不符时重新分配
+    :return: (H, W, 4) uint8
+    """
+    h, w = alpha.shape[:2]
+    if out is None or out.shape != (h, w, 4):
+        out = np.empty((h, w, 4), np.uint8)
+    if premultiply:
+        rgb = cv2.multiply(rgb, cv2.merge([alpha, alpha, alpha]), scale=1.0 / 255.0)
+    r, b = (0, 2) if order == "rgba" else (2, 0)
+    cv2.mixChannels([np.ascontiguousarray(rgb), np.ascontiguousarray(alpha)], [out],
+                    [r, 0, 1, 1, b, 2, 3, 3])
+    return out
+
+
+def encode_params(ext, png_level=DEFAULT_PNG_LEVEL, lossless=True, quality=DEFAULT_QUALITY):
+    """
+    按扩展名生成 cv2.imencode 参数
+    :param png_level: PNG zlib 压缩级别 0~9 (越小越快)
+    :param lossless: WebP 是否无损
+    :param quality: JPEG / 有损 WebP / AVIF 的质量
+    """
+    ext = ext.lower()
+    if ext == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_level)]
+    if ext in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if ext == ".webp":
+        # 质量大于 100 时 libwebp 走无损编码
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101 if lossless else int(quality)]
+        if lossless and hasattr(cv2, "IMWRITE_WEBP_LOSSLESS_MODE"):
+            # 保留 alpha 为 0 处的颜色，抠图结果可以无损还原
+            params += [cv2.IMWRITE_WEBP_LOSSLESS_MODE, cv2.IMWRITE_WEBP_LOSSLESS_PRESERVE_COLOR]
+        return params
+    if ext == ".avif" and hasattr(cv2, "IMWRITE_AVIF_QUALITY"):
+        params = [cv2.IMWRITE_AVIF_QUALITY, int(quality)]
+        if hasattr(cv2, "IMWRITE_AVIF_SPEED"):
+            params += [cv2.IMWRITE_AVIF_SPEED, 8]
+        return params
+    return []
+
+
+def supports_alpha(ext):
+    return ext.lower() in (".png", ".webp", ".avif", ".tif", ".tiff")
+
+
+def save_image(path, rgb, alpha=None, premultiply=False, **options):
+    """
+    编码并写盘 (支持中文路径)
+    :param rgb: (H, W, 3) uint8 RGB
+    :param alpha: 可选 (H, W) uint8；目标格式不支持透明通道时忽略
+    :param options: 见 encode_params
+    """
+    ext = os.path.splitext(path)[1] or ".png"
+    if alpha is not None and supports_alpha(ext):
+        img = compose_rgba(rgb, alpha, order="bgra", premultiply=premultiply)
+    else:
+        img = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    is_success, im_buf = cv2.imencode(ext, img, encode_params(ext, **options))
+    if not is_success:
+        raise ValueError(f"编码失败: {path}")
+    im_buf.tofile(path)
+    return path
+
+
+class PngStripWriter:
+    """
+    逐条写入 8 位 RGB PNG：每个条带滤波 (Up) 后送入 zlib 流，压缩结果随即写盘，
+    内存占用只与条带大小有关 (OpenCV / Pillow 只能整图编码)
+    用法: with PngStripWriter(path, w, h) as writer: writer.write(rows) ...
+    """
+    _SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, path, width, height, png_level=DEFAULT_PNG_LEVEL):
+        self.width, self.height = width, height
+        self.rows_written = 0
+        self._prev = np.zeros((1, width, 3), np.uint8)
+        self._zip = zlib.compressobj(int(png_level))
+        self._file = open(path, "wb")
+        self._file.write(self._SIGNATURE)
+        # 宽, 高, 位深 8, 颜色类型 2 (RGB), 压缩/滤波/隔行方式 0
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self._file.write(struct.pack(">I", len(data)) + kind + data)
+        self._file.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write(self, rows):
+        """:param rows: (n, W, 3) uint8 RGB，按从上到下的顺序依次写入"""
+        n = rows.shape[0]
+        if rows.shape[1:] != (self.width, 3) or self.rows_written + n > self.height:
+            raise ValueError(f"条带尺寸不符: {rows.shape}")
+        # Up 滤波：与上一行逐字节相减 (uint8 按 256 取模)，每行前加滤波类型字节 2
+        filtered = np.empty((n, 1 + self.width * 3), np.uint8)
+        filtered[:, 0] = 2
+        filtered[:, 1:] = (rows - np.concatenate([self._prev, rows[:-1]])).reshape(n, -1)
+        self._prev = rows[-1:].copy()
+        data = self._zip.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += n
+
+    def close(self):
+        if self._file.closed: return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"只写入了 {self.rows_written} / {self.height} 行")
+            self._chunk(b"IDAT", self._zip.flush())
+            self._chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+
+def submit_export(path, fn, *args, callback=None, **kwargs):
+    """
+    在后台导出线程执行 fn(*args, **kwargs)，立即返回 Future (与 save_image_async 共用同一线程，按提交顺序执行)
+    :param callback: 可选 callback(path, error)，在工作线程中调用 (界面代码应通过信号转发)
+    """
+    future = _executor.submit(fn, *args, **kwargs)
+    if callback is not None:
+        future.add_done_callback(lambda f: callback(path, f.exception()))
+    return future
+
+
+def save_image_async(path, rgb, alpha=None, premultiply=False, callback=None, **options):
+    """
+    在后台线程编码写盘，立即返回 Future
+    调用方需保证编码完成前不原地修改 rgb / alpha
+    :param callback: 可选 callback(path, error)，在工作线程中调用 (界面代码应通过信号转发)
+    """
+    return submit_export(path, save_image, path, rgb, alpha, premultiply, callback=callback, **options)
@@ -0,0 +1,211 @@
+import os
+import tempfile
+import cv2
+import numpy as np
+from PIL import Image
+from src.utils.image_processor import ImageProcessor
+from src.utils import harmonization
+from src.utils.rgba_export import PngStripWriter, encode_params
+
+# JPEG 可在解码时按 1/2、1/4、1/8 缩小 (DCT 缩放)；PNG / WebP 等格式的 REDUCED 标志并不少解码，
+# 只能整图解码后再缩小
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _header_size(path):
+    """
+    只读文件头获取 (格式, 宽, 高)，不解码像素
+    宽高按 EXIF 方向换算为 OpenCV 解码后的方向
+    """
+    with Image.open(path) as im:
+        w, h = im.size
+        if im.format == "JPEG" and im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            w, h = h, w
+        return im.format, w, h
+
+
+def _reduce_factor(full_w, full_h, target_size):
+    """不小于 target_size=(w, h) 的前提下最大的缩小倍数 (1 / 2 / 4 / 8)"""
+    tw, th = target_size
+    for f in (8, 4, 2):
+        if full_w // f >= tw and full_h // f >= th:
+            return f
+    return 1
+
+
+def load_background(source, target_size):
+    """
+    按目标尺寸读取背景：只保留刚好不小于 target_size=(w, h) 的分辨率
+    JPEG 按文件头尺寸选择倍数直接缩小解码 (峰值内存也随之减小)；其它格式整图解码一次后立即缩小，
+    解码峰值与原图大小有关，但返回 (常驻) 的背景同样不超过需要的分辨率
+    :param source: RGB 数组、.npy 路径 (内存映射，按行读取) 或图片路径 (支持中文路径)
+    :return: (H', W', 3) uint8 RGB，H' >= h 且 W' >= w (原图更小时为原图)
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if os.path.splitext(source)[1].lower() == ".npy":
+        return np.load(source, mmap_mode="r")
+
+    try:
+        fmt, full_w, full_h = _header_size(source)
+    except Exception:
+        # Pillow 不认识的格式交给 OpenCV 整图解码
+        fmt = None
+
+    data = np.fromfile(source, dtype=np.uint8)
+    if fmt == "JPEG":
+        bgr = cv2.imdecode(data, _REDUCED_FLAGS[_reduce_factor(full_w, full_h, target_size)])
+    else:
+        bgr = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    del data
+    if bgr is None:
+        raise ValueError(f"无法读取背景图片: {source}")
+    if fmt != "JPEG":
+        factor = _reduce_factor(bgr.shape[1], bgr.shape[0], target_size)
+        if factor > 1:
+            bgr = cv2.resize(bgr, (bgr.shape[1] // factor, bgr.shape[0] // factor), interpolation=cv2.INTER_AREA)
+    # 原地转换通道顺序，避免再占一份解码后大小的内存
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr)
+
+
+class StripCompositor:
+    """
+    按水平条带流式合成：背景逐条缩放到前景尺寸、逐条合成、逐条输出
+    背景不会整张缩放成前景尺寸的副本；背景本身按 load_background 读取
+    (JPEG 按缩小倍数解码，.npy 内存映射按行读取，其它格式需整图解码一次)
+    strips() 的中间内存只与条带高度有关；render() 输出 .npy / .png 时逐条写盘，
+    JPEG 等其它格式经临时内存映射文件整图编码
+    每个条带上下多取 halo 行参与计算，条带之间没有接缝；
+    与 ImageProcessor.composite_images 相比：背景逐行缩放的舍入带来 1~2 个色阶的差异，
+    色彩融合的背景统计量取自最近邻抽样的原始背景，开启时最多相差约 11 个色阶
+    """
+    def __init__(self, fg_rgb, mask_raw, strip_height=256):
+        self.fg_rgb = fg_rgb
+        self.mask_raw = mask_raw
+        self.strip_height = strip_height
+
+    # --- 背景按行缩放 ---
+    @staticmethod
+    def _source_rows(y0, y1, src_h, dst_h):
+        """
+        与 cv2.resize (INTER_LINEAR) 相同的纵向映射：src_y = (y + 0.5) * s - 0.5
+        :return: (源起始行, 源结束行, 各输出行在源中的浮点坐标)
+        """
+        s = src_h / dst_h
+        pos = np.clip((np.arange(y0, y1) + 0.5) * s - 0.5, 0, src_h - 1)
+        top = int(np.floor(pos[0]))
+        bottom = min(src_h, int(np.floor(pos[-1])) + 2)
+        return top, bottom, pos - top
+
+    def _resize_rows(self, bg, y0, y1, size):
+        """只读取并缩放输出第 y0 ~ y1 行需要的背景行"""
+        w, h = size
+        top, bottom, pos = self._source_rows(y0, y1, bg.shape[0], h)
+        rows = np.ascontiguousarray(bg[top:bottom])
+        # 横向与整图缩放系数相同，纵向按浮点坐标线性插值
+        rows = cv2.resize(rows, (w, rows.shape[0]), interpolation=cv2.INTER_LINEAR).astype(np.float32)
+        i0 = np.floor(pos).astype(np.int32)
+        i1 = np.minimum(i0 + 1, rows.shape[0] - 1)
+        t = (pos - i0).astype(np.float32)[:, None, None]
+        out = rows[i0] * (1.0 - t) + rows[i1] * t
+        return (out + 0.5).astype(np.uint8)
+
+    # --- 色彩融合 ---
+    def _transfer_lut(self, bg, harmonize_mode):
+        """
+        色彩统计量取自抽样后的前景/蒙版和同样抽样的背景，不需要全尺寸背景
+        背景用最近邻取点 (与 harmonization.subsample 一样不做平均，保留方差)
+        """
+        fg_small = harmonization.subsample(self.fg_rgb)
+        sh, sw = fg_small.shape[:2]
+        h, w = self.fg_rgb.shape[:2]
+        step = int(np.ceil(h / sh)) if sh < h else 1
+        rows = np.minimum(((np.arange(sh) * step + 0.5) * bg.shape[0] / h).astype(np.int64), bg.shape[0] - 1)
+        cols = np.minimum(((np.arange(sw) * step + 0.5) * bg.shape[1] / w).astype(np.int64), bg.shape[1] - 1)
+        bg_small = np.ascontiguousarray(bg[rows][:, cols])
+        if harmonize_mode == "mask":
+            mask_small = harmonization.subsample(self.mask_raw)
+            stats = harmonization.mask_aware_stats(bg_small, fg_small, mask_small)
+        else:
+            stats = (harmonization.lab_stats(bg_small, sample_size=None),
+                     harmonization.lab_stats(fg_small, sample_size=None))
+        return harmonization.build_transfer_lut(*stats)
+
+    # --- 合成 ---
+    def strips(self, background, use_harmonize=False, use_light_wrap=False, brightness=0,
+               blend_mode="linear", harmonize_mode="global"):
+        """
+        逐条合成 (不支持 roi_rects 局部虚化)
+        :param background: 见 load_background
+        :return: 生成器，产出 (y0, (strip_h, W, 3) uint8)
+        """
+        h, w = self.fg_rgb.shape[:2]
+        bg = load_background(background, (w, h))
+        lut = self._transfer_lut(bg, harmonize_mode) if use_harmonize else None
+        halo = ImageProcessor.ROI_MARGIN_PYRAMID if blend_mode == "pyramid" else ImageProcessor.ROI_MARGIN
+
+        for y0 in range(0, h, self.strip_height):
+            y1 = min(h, y0 + self.strip_height)
+            top, bottom = max(0, y0 - halo), min(h, y1 + halo)
+
+            fg = self.fg_rgb[top:bottom]
+            if lut is not None:
+                fg = ImageProcessor.mix_harmonized(harmonization.apply_transfer(fg, lut), fg)
+            bg_rows = self._resize_rows(bg, top, bottom, (w, h))
+
+            out = ImageProcessor.composite_images(
+                fg, self.mask_raw[top:bottom], bg_rows,
+                use_light_wrap=use_light_wrap, brightness=brightness, blend_mode=blend_mode)
+            yield y0, out[y0 - top:y1 - top]
+
+    def render(self, background, output_path=None, **params):
+        """
+        合成整图
+        :param output_path: .npy 以内存映射逐条写盘；.png 逐条压缩写盘 (PngStripWriter)，两者结果都不驻留内存；
+                            其它格式 (JPEG / WebP 等编码器只能整图编码) 先逐条写入临时的内存映射文件再编码，
+                            未压缩的整图由文件页承载，可被系统换出
+        :return: 不写盘时返回合成结果数组，.npy 输出时为内存映射数组，其它格式返回 output_path
+        """
+        h, w = self.fg_rgb.shape[:2]
+        ext = (os.path.splitext(output_path)[1].lower() or ".png") if output_path else None
+        if ext == ".png":
+            with PngStripWriter(output_path, w, h) as writer:
+                for _, strip in self.strips(background, **params):
+                    writer.write(strip)
+            return output_path
+
+        if ext == ".npy":
+            result = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=(h, w, 3))
+            for y0, strip in self.strips(background, **params):
+                result[y0:y0 + strip.shape[0]] = strip
+            result.flush()
+            return result
+
+        if output_path is None:
+            result = np.empty((h, w, 3), np.uint8)
+            for y0, strip in self.strips(background, **params):
+                result[y0:y0 + strip.shape[0]] = strip
+            return result
+
+        # 编码器需要整张 BGR 图：条带直接以 BGR 写入临时文件，编码时不再整图转换通道
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(fd)
+        bgr = None
+        try:
+            bgr = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(h, w, 3))
+            for y0, strip in self.strips(background, **params):
+                cv2.cvtColor(strip, cv2.COLOR_RGB2BGR, dst=bgr[y0:y0 + strip.shape[0]])
+            is_success, im_buf = cv2.imencode(ext, bgr, encode_params(ext))
+            if not is_success:
+                raise ValueError(f"编码失败: {output_path}")
+            im_buf.tofile(output_path)
+        finally:
+            # 先释放映射再删除 (Windows 下仍被映射的文件无法删除)
+            del bgr
+            os.remove(tmp_path)
+        return output_path
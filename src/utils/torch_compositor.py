@@ -0,0 +1,357 @@
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from src.utils.image_processor import ImageProcessor
+from src.utils.harmonization import DEFAULT_SAMPLE_SIZE
+
+# sRGB (D65) <-> XYZ，与 OpenCV 的 Lab 转换使用相同的系数
+_RGB2XYZ = torch.tensor([[0.412453, 0.357580, 0.180423],
+                         [0.212671, 0.715160, 0.072169],
+                         [0.019334, 0.119193, 0.950227]])
+_XYZ2RGB = torch.tensor([[3.240479, -1.53715, -0.498535],
+                         [-0.969256, 1.875991, 0.041556],
+                         [0.055648, -0.204043, 1.057311]])
+_WHITE = torch.tensor([0.950456, 1.0, 1.088754])
+# pyrDown / pyrUp 使用的 5 阶二项式核
+_PYR_KERNEL = np.array([1, 4, 6, 4, 1], np.float64) / 16.0
+
+
+class TorchCompositor:
+    """
+    与 ImageProcessor.composite_images 语义一致的 torch 合成器
+    (腐蚀 + 模糊蒙版、色彩融合、亮度、Light Wrap、线性/金字塔融合、局部虚化)
+
+    模型在 CUDA 上推理时，蒙版和图像可以一直留在显存里完成合成，只在显示时下载结果
+    输入输出沿用 numpy 的布局：图像 (H, W, 3) uint8，蒙版 (H, W) uint8，可以是 ndarray 或 tensor
+    与 OpenCV 版本基本一致：浮点舍入、金字塔边界处理不同带来 ±2 个灰度级的差异，
+    Light Wrap 使用精确高斯核 (OpenCV 路径为 fast_blur 的近似)，色彩融合在极暗像素上偶有更大偏差
+    """
+    def __init__(self, device=None):
+        self.device = torch.device(device) if device is not None else \
+            torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self._kernels = {}
+
+    # --- 张量工具 ---
+    def to_tensor(self, img):
+        """(H, W) / (H, W, C) uint8 -> (1, C, H, W) float32 (0~255)，放到 self.device 上"""
+        t = img if isinstance(img, torch.Tensor) else torch.from_numpy(np.ascontiguousarray(img))
+        t = t.to(self.device, non_blocking=True)
+        if t.dim() == 2: t = t[:, :, None]
+        return t.permute(2, 0, 1)[None].float()
+
+    @staticmethod
+    def to_image(t):
+        """(1, C, H, W) float -> (H, W, C) uint8 tensor (与 numpy astype 一样截断)"""
+        return t.clamp(0, 255).to(torch.uint8)[0].permute(1, 2, 0).contiguous()
+
+    def _kernel(self, ksize, sigma, channels):
+        """与 cv2.getGaussianKernel 相同的一维核，按 (ksize, sigma, 通道数) 缓存"""
+        key = (ksize, sigma, channels)
+        if key not in self._kernels:
+            k = torch.from_numpy(cv2.getGaussianKernel(ksize, sigma).astype(np.float32).ravel())
+            self._kernels[key] = k.to(self.device).view(1, 1, 1, -1).repeat(channels, 1, 1, 1)
+        return self._kernels[key]
+
+    @staticmethod
+    def _pad(x, r):
+        # torch 的 reflect 即 OpenCV 默认的 BORDER_REFLECT_101；图像过小时退化为复制边缘
+        mode = "reflect" if min(x.shape[-2:]) > r else "replicate"
+        return F.pad(x, (r, r, r, r), mode=mode)
+
+    def gaussian_blur(self, x, ksize, sigma=0):
+        """可分离高斯模糊 (边界与 cv2.GaussianBlur 一致)"""
+        c = x.shape[1]
+        k = self._kernel(ksize, sigma, c)
+        r = ksize // 2
+        x = self._pad(x, r)
+        x = F.conv2d(x, k, groups=c)
+        return F.conv2d(x, k.transpose(2, 3), groups=c)
+
+    @staticmethod
+    def erode(x, ksize=3):
+        """方形结构元素腐蚀 (越界像素不参与，同 OpenCV 默认边界)"""
+        return -F.max_pool2d(-x, ksize, stride=1, padding=ksize // 2)
+
+    # --- 颜色空间 ---
+    def rgb_to_lab(self, rgb):
+        """(1, 3, H, W) 0~255 -> OpenCV 8 位 Lab 取值范围 (L*255/100, a+128, b+128)，已四舍五入"""
+        v = rgb / 255.0
+        v = torch.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+        xyz = torch.einsum("ij,bjhw->bihw", _RGB2XYZ.to(v.device), v) / _WHITE.to(v.device).view(1, 3, 1, 1)
+        f = torch.where(xyz > 0.008856, xyz.clamp(min=0) ** (1.0 / 3.0), 7.787 * xyz + 16.0 / 116.0)
+        y = xyz[:, 1:2]
+        L = torch.where(y > 0.008856, 116.0 * f[:, 1:2] - 16.0, 903.3 * y)
+        a = 500.0 * (f[:, 0:1] - f[:, 1:2]) + 128.0
+        b = 200.0 * (f[:, 1:2] - f[:, 2:3]) + 128.0
+        return torch.cat((L * 255.0 / 100.0, a, b), dim=1).round().clamp(0, 255)
+
+    def lab_to_rgb(self, lab):
+        """rgb_to_lab 的逆变换，返回 0~255 (已四舍五入)"""
+        L = lab[:, 0:1] * 100.0 / 255.0
+        fy = (L + 16.0) / 116.0
+        fx = fy + (lab[:, 1:2] - 128.0) / 500.0
+        fz = fy - (lab[:, 2:3] - 128.0) / 200.0
+        f = torch.cat((fx, fy, fz), dim=1)
+        xyz = torch.where(f > 0.206893, f ** 3, (f - 16.0 / 116.0) / 7.787)
+        xyz[:, 1:2] = torch.where(L > 7.9996, fy ** 3, L / 903.3)
+        xyz = xyz * _WHITE.to(lab.device).view(1, 3, 1, 1)
+        v = torch.einsum("ij,bjhw->bihw", _XYZ2RGB.to(lab.device), xyz).clamp(0, 1)
+        v = torch.where(v <= 0.0031308, 12.92 * v, 1.055 * v ** (1.0 / 2.4) - 0.055)
+        return (v * 255.0).round().clamp(0, 255)
+
+    # --- 色彩融合 ---
+    @staticmethod
+    def _subsample(x, sample_size=DEFAULT_SAMPLE_SIZE):
+        step = max(1, int(np.ceil(max(x.shape[-2:]) / sample_size)))
+        return x[..., ::step, ::step]
+
+    def lab_stats(self, rgb, weight=None):
+        """抽样后的 LAB 均值/标准差 (同 harmonization.lab_stats)；weight 为 0/1 蒙版时只统计非零像素"""
+        lab = self.rgb_to_lab(rgb)
+        if weight is None or weight.sum() == 0:
+            return lab.mean(dim=(2, 3)), lab.std(dim=(2, 3), unbiased=False)
+        n = weight.sum()
+        mean = (lab * weight).sum(dim=(2, 3)) / n
+        var = (((lab - mean[:, :, None, None]) ** 2) * weight).sum(dim=(2, 3)) / n
+        return mean, var.sqrt()
+
+    def region_masks(self, mask, band_ratio=0.1):
+        """抽样蒙版上的人像区域和周边背景环带 (同 harmonization.region_masks)"""
+        person = (mask > 127).float()
+        k = max(3, int(max(mask.shape[-2:]) * band_ratio) | 1)
+        ellipse = torch.from_numpy(cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k)).astype(np.float32))
+        grown = F.conv2d(person, ellipse.to(self.device)[None, None], padding=k // 2) > 0
+        return person, grown.float() - person
+
+    def harmonize(self, bg, fg, mask=None, mode="global"):
+        """Reinhard LAB 迁移 + 50% 混合 (同 composite_images 的色彩融合步骤)"""
+        bg_s, fg_s = self._subsample(bg), self._subsample(fg)
+        if mode == "mask":
+            person, band = self.region_masks(self._subsample(mask))
+            src_mean, src_std = self.lab_stats(bg_s, band)
+            tgt_mean, tgt_std = self.lab_stats(fg_s, person)
+        else:
+            src_mean, src_std = self.lab_stats(bg_s)
+            tgt_mean, tgt_std = self.lab_stats(fg_s)
+        tgt_std = torch.where(tgt_std == 0, torch.full_like(tgt_std, 1e-5), tgt_std)
+
+        scale = src_std / tgt_std
+        # L 通道只迁移 50%
+        scale[:, 0] *= 0.5
+        offset = src_mean - tgt_mean * scale
+        offset[:, 0] = src_mean[:, 0] * 0.5 + tgt_mean[:, 0] * 0.5 - tgt_mean[:, 0] * scale[:, 0]
+
+        lab = self.rgb_to_lab(fg) * scale[:, :, None, None] + offset[:, :, None, None]
+        harmonized = self.lab_to_rgb(lab.clamp(0, 255).floor())
+        return (harmonized * 0.5 + fg * 0.5).round()
+
+    # --- 拉普拉斯金字塔融合 ---
+    def _pyr_down(self, x):
+        c = x.shape[1]
+        k = torch.from_numpy(_PYR_KERNEL.astype(np.float32)).to(self.device).view(1, 1, 1, -1).repeat(c, 1, 1, 1)
+        x = F.conv2d(self._pad(x, 2), k, groups=c)
+        x = F.conv2d(x, k.transpose(2, 3), groups=c)
+        return x[..., ::2, ::2]
+
+    def _pyr_up(self, x, size):
+        c, (h, w) = x.shape[1], x.shape[-2:]
+        up = x.new_zeros((x.shape[0], c, h * 2, w * 2))
+        up[..., ::2, ::2] = x
+        k = torch.from_numpy((_PYR_KERNEL * 2).astype(np.float32)).to(self.device).view(1, 1, 1, -1).repeat(c, 1, 1, 1)
+        up = F.conv2d(self._pad(up, 2), k, groups=c)
+        up = F.conv2d(up, k.transpose(2, 3), groups=c)
+        return up[..., :size[0], :size[1]]
+
+    def pyramid_blend(self, fg, bg, alpha, levels=5):
+        """out = bg + collapse( L(fg - bg)_i * G(alpha)_i )，同 PyramidBlender"""
+        diff, alp = [fg - bg], [alpha]
+        for _ in range(levels):
+            if min(diff[-1].shape[-2:]) < 2: break
+            diff.append(self._pyr_down(diff[-1]))
+            alp.append(self._pyr_down(alp[-1]))
+        n = len(diff) - 1
+        out = diff[n] * alp[n]
+        for i in range(n - 1, -1, -1):
+            size = diff[i].shape[-2:]
+            lap = diff[i] - self._pyr_up(diff[i + 1], size)
+            out = lap * alp[i] + self._pyr_up(out, size)
+        return out + bg
+
+    # --- 合成 ---
+    def composite(self, fg_rgb, mask_raw, bg_rgb,
+                  use_harmonize=False,
+                  use_light_wrap=False,
+                  brightness=0,
+                  roi_rects=None,
+                  display_size=None,
+                  blend_mode="linear",
+                  harmonize_mode="global",
+                  scale=1.0):
+        """
+        参数同 ImageProcessor.composite_images
+        :param scale: 相对全分辨率的比例，模糊核按它缩小 (同 CompositeSession 的预览子会话)
+        :return: (H, W, 3) uint8 tensor (位于 self.device)
+        """
+        fg = self.to_tensor(fg_rgb)
+        mask_raw = self.to_tensor(mask_raw)
+        bg = self.to_tensor(bg_rgb)
+        h, w = fg.shape[-2:]
+
+        # 1. 背景适配 (同 cv2.INTER_LINEAR)
+        if bg.shape[-2:] != (h, w):
+            bg = F.interpolate(bg, size=(h, w), mode="bilinear", align_corners=False).round()
+
+        # 2. 腐蚀 + 轻微模糊
+        mask = self.gaussian_blur(self.erode(mask_raw), 3).round()
+        alpha = mask / 255.0
+
+        # 3. 色彩融合 + 亮度
+        if use_harmonize:
+            fg = self.harmonize(bg, fg, mask_raw, harmonize_mode)
+        if brightness != 0:
+            fg = (fg + brightness * 2).clamp(0, 255)
+
+        # 4. 融合
+        if blend_mode == "pyramid":
+            composite = self.pyramid_blend(fg, bg, alpha)
+        else:
+            composite = fg * alpha + bg * (1.0 - alpha)
+
+        # 5. Light Wrap
+        if use_light_wrap:
+            bg_blur = self.gaussian_blur(bg, ImageProcessor.scaled_ksize(51, scale)).round()
+            edge = self.gaussian_blur(255.0 - mask, ImageProcessor.scaled_ksize(21, scale)).round()
+            edge_factor = (edge / 255.0) * alpha
+            composite = composite + bg_blur * edge_factor * 0.7
+
+        composite = composite.clamp(0, 255).floor()
+
+        # 6. 局部虚化
+        if roi_rects and display_size:
+            # 蒙版做法同 ImageProcessor.apply_roi_blur；设备上直接整图模糊一次，不再按矩形分组
+            scale_x, scale_y = w / display_size[0], h / display_size[1]
+            union = composite.new_zeros((1, 1, h, w))
+            for rect in roi_rects:
+                x = max(0, int(rect.x() * scale_x)); y = max(0, int(rect.y() * scale_y))
+                rw = int(rect.width() * scale_x); rh = int(rect.height() * scale_y)
+                if rw < 1 or rh < 1: continue
+                union[..., y:min(h, y + rh), x:min(w, x + rw)] = 1.0
+            if union.any():
+                feather = ImageProcessor.ROI_FEATHER * scale
+                if feather >= 0.5:
+                    union = self.gaussian_blur(union, 2 * int(3 * feather) + 1, feather)
+                ksize = ImageProcessor.scaled_ksize(ImageProcessor.ROI_BLUR_KSIZE, scale)
+                blurred = self.gaussian_blur(composite, ksize, ImageProcessor.ROI_BLUR_SIGMA * scale).round()
+                composite = (blurred * union + composite * (1.0 - union)).round()
+
+        return self.to_image(composite)
+
+
+class DeviceCompositeSession:
+    """
+    CompositeSession 的显存版本：原图、蒙版、背景上传一次后常驻在模型所在设备上
+    与 CompositeSession 一样分两层：预览时输入在设备上缩小到显示尺寸 (缓存)，在该尺寸下合成，
+    模糊核按比例缩小；全分辨率结果延迟到 render_full (保存) 时才计算
+    不支持人像模式 (portrait_mode)，调用方此时使用 CompositeSession
+    """
+    def __init__(self, device):
+        self.compositor = TorchCompositor(device)
+        self.device = self.compositor.device
+        self.fg = None
+        self.mask = None
+        self.bg = None
+        self._last_params = {}
+        self._full_result = None
+        self._preview = None   # (显示尺寸 (w, h), 前景, 蒙版, 背景)，均已缩小
+
+    def _upload(self, img):
+        if img is None: return None
+        t = img if isinstance(img, torch.Tensor) else torch.from_numpy(np.ascontiguousarray(img))
+        return t.to(self.device)
+
+    # --- 输入 (ndarray 或 tensor) ---
+    def set_foreground(self, fg_rgb):
+        self.fg = self._upload(fg_rgb)
+        self._full_result = None
+        self._preview = None
+
+    def set_mask(self, mask_raw):
+        self.mask = self._upload(mask_raw)
+        self._full_result = None
+        self._preview = None
+
+    def set_background(self, bg_rgb):
+        self.bg = self._upload(bg_rgb)
+        self._full_result = None
+        self._preview = None
+
+    def is_ready(self):
+        return self.fg is not None and self.mask is not None and self.bg is not None
+
+    # --- 合成 ---
+    def _preview_target(self, display_size):
+        """按 KeepAspectRatio 计算前景在 display_size 内的实际显示尺寸 (不放大)，同 CompositeSession"""
+        h, w = self.fg.shape[:2]
+        scale = min(display_size[0] / w, display_size[1] / h, 1.0)
+        return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+    def _downscale(self, img, size):
+        """(H, W[, C]) uint8 tensor 在设备上按面积插值缩小 (同 cv2.INTER_AREA，非整数倍也一致)"""
+        if img.shape[1] == size[0] and img.shape[0] == size[1]: return img
+        x = self.compositor.to_tensor(img)
+        wy = _area_weights(img.shape[0], size[1]).to(self.device)
+        wx = _area_weights(img.shape[1], size[0]).to(self.device)
+        x = torch.matmul(torch.matmul(wy, x), wx.T).round()
+        out = self.compositor.to_image(x)
+        return out[:, :, 0] if img.dim() == 2 else out
+
+    def _preview_inputs(self, target):
+        if self._preview is None or self._preview[0] != target:
+            with torch.no_grad():
+                # 背景直接缩到预览尺寸 (同 CompositeSession 的预览子会话)
+                self._preview = (target, self._downscale(self.fg, target), self._downscale(self.mask, target),
+                                 self._downscale(self.bg, target))
+        return self._preview[1:]
+
+    def composite_preview(self, display_size, **params):
+        """
+        参数同 CompositeSession.composite_preview (use_roi 忽略：设备上整图合成)
+        :return: 不超过 display_size 的 (h, w, 3) uint8 numpy
+        """
+        params.pop("use_roi", None)
+        if params.pop("portrait_mode", False):
+            raise ValueError("DeviceCompositeSession 不支持人像模式")
+        if not self.is_ready() or not display_size or min(display_size) <= 0:
+            return None
+
+        params = dict(params, display_size=display_size)
+        if params != self._last_params:
+            self._last_params = params
+            self._full_result = None
+
+        target = self._preview_target(display_size)
+        fg, mask, bg = self._preview_inputs(target)
+        with torch.no_grad():
+            out = self.compositor.composite(fg, mask, bg, scale=target[0] / self.fg.shape[1], **params)
+        return out.cpu().numpy()
+
+    def render_full(self):
+        """以最近一次预览的参数在设备上计算全分辨率结果并下载 (结果缓存到输入或参数变化为止)"""
+        if not self.is_ready(): return None
+        if self._full_result is None:
+            with torch.no_grad():
+                self._full_result = self.compositor.composite(self.fg, self.mask, self.bg, **self._last_params)
+        return self._full_result.cpu().numpy()
+
+
+def _area_weights(n_in, n_out):
+    """
+    一维面积插值 (缩小) 的权重矩阵 (n_out, n_in)：输出像素 i 覆盖输入区间 [i*s, (i+1)*s)，
+    权重为与各输入像素的重叠长度 / s，两个方向各乘一次即为 cv2.INTER_AREA
+    """
+    s = n_in / n_out
+    lo = np.arange(n_out)[:, None] * s
+    edges = np.arange(n_in + 1)[None, :]
+    overlap = np.clip(np.minimum(edges[:, 1:], lo + s) - np.maximum(edges[:, :-1], lo), 0, None)
+    return torch.from_numpy((overlap / s).astype(np.float32))
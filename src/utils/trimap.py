@@ -0,0 +1,70 @@
+import os
+import cv2
+import numpy as np
+from src.utils.rgba_export import save_image
+
+# trimap 取值：背景 / 未知带 / 前景
+TRIMAP_BG, TRIMAP_UNKNOWN, TRIMAP_FG = 0, 128, 255
+
+
+def signed_distance(mask, work_size=512):
+    """
+    蒙版边界的有符号距离 (前景内为正、背景为负，单位为原图像素)
+    距离变换在低分辨率下计算，再线性放大 (距离场很平滑，放大误差小)
+    :return: (H, W) float32
+    """
+    h, w = mask.shape[:2]
+    scale = min(1.0, work_size / max(h, w))
+    sw, sh = max(1, int(w * scale)), max(1, int(h * scale))
+    small = cv2.resize(mask, (sw, sh), interpolation=cv2.INTER_AREA) if scale < 1.0 else mask
+    fg = np.where(small > 127, 255, 0).astype(np.uint8)
+
+    # 各自到边界的距离，减 0.5 使边界两侧对称
+    inside = cv2.distanceTransform(fg, cv2.DIST_L2, 3)
+    outside = cv2.distanceTransform(255 - fg, cv2.DIST_L2, 3)
+    dist = np.where(fg > 0, inside - 0.5, 0.5 - outside).astype(np.float32) / scale
+
+    if (sw, sh) != (w, h):
+        dist = cv2.resize(dist, (w, h), interpolation=cv2.INTER_LINEAR)
+    return dist
+
+
+def make_trimap(mask, band_ratio=0.01, band=None, work_size=512):
+    """
+    由 predict 输出的蒙版生成 trimap：边界两侧各 band 像素内为未知区域
+    :param band_ratio: 未知带单侧宽度占长边的比例
+    :param band: 直接指定单侧宽度 (像素)，优先于 band_ratio
+    :return: (H, W) uint8，取值 TRIMAP_BG / TRIMAP_UNKNOWN / TRIMAP_FG
+    """
+    if band is None:
+        band = max(1.0, band_ratio * max(mask.shape[:2]))
+    dist = signed_distance(mask, work_size)
+    trimap = np.full(mask.shape[:2], TRIMAP_UNKNOWN, np.uint8)
+    trimap[dist > band] = TRIMAP_FG
+    trimap[dist < -band] = TRIMAP_BG
+    return trimap
+
+
+def pack_matting(mask, trimap=None, alpha=None, **trimap_options):
+    """
+    蒙版 / trimap / alpha 打包成一张 3 通道图 (通道顺序即 R, G, B)
+    :param alpha: 软 alpha (例如 guided_filter.refine_mask 的结果)，缺省时使用蒙版本身
+    :return: (H, W, 3) uint8
+    """
+    if trimap is None:
+        trimap = make_trimap(mask, **trimap_options)
+    if alpha is None:
+        alpha = mask
+    return cv2.merge([mask, trimap, alpha])
+
+
+def save_matting(path, mask, trimap=None, alpha=None, **trimap_options):
+    """
+    导出抠图所需的全部通道到单个文件
+    .npy 保存为 (H, W, 3) 数组；图片格式 (建议 PNG) 按 R=蒙版, G=trimap, B=alpha 写入
+    """
+    packed = pack_matting(mask, trimap, alpha, **trimap_options)
+    if os.path.splitext(path)[1].lower() == ".npy":
+        np.save(path, packed)
+        return path
+    return save_image(path, packed)
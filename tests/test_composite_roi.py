@@ -0,0 +1,92 @@
+import itertools
+
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.image_processor import ImageProcessor
+
+# ROI 路径只在蒙版包围盒内合成；Light Wrap 的大核模糊在包围盒边界处的取样与全图不同，
+# 允许 1 个色阶的误差，其余组合应逐像素一致
+TOLERANCE_LIGHT_WRAP = 1
+
+
+def _smooth_image(rng, h, w):
+    small = rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def _ellipse_mask(h, w, center, axes):
+    mask = np.zeros((h, w), np.uint8)
+    cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+    return cv2.GaussianBlur(mask, (0, 0), 3)
+
+
+@pytest.fixture(scope="module")
+def images():
+    rng = np.random.default_rng(0)
+    fg = _smooth_image(rng, 480, 640)
+    bg = _smooth_image(rng, 600, 800)  # 尺寸不同，需要先缩放到前景大小
+    return fg, bg
+
+
+MASKS = {
+    "center": lambda: _ellipse_mask(480, 640, (330, 250), (90, 140)),
+    "edge": lambda: _ellipse_mask(480, 640, (20, 460), (120, 160)),
+    "empty": lambda: np.zeros((480, 640), np.uint8),
+}
+
+CASES = list(itertools.product(("linear", "pyramid"), (None, "global", "mask"), (False, True)))
+
+
+@pytest.mark.parametrize("mask_name", sorted(MASKS))
+@pytest.mark.parametrize("blend_mode,harmonize_mode,light_wrap", CASES)
+def test_roi_matches_full_frame(images, mask_name, blend_mode, harmonize_mode, light_wrap):
+    fg, bg = images
+    mask = MASKS[mask_name]()
+    params = dict(use_harmonize=harmonize_mode is not None, harmonize_mode=harmonize_mode or "global",
+                  use_light_wrap=light_wrap, blend_mode=blend_mode, brightness=10)
+
+    full = ImageProcessor.composite_images(fg, mask, bg, use_roi=False, **params)
+    roi = ImageProcessor.composite_images(fg, mask, bg, use_roi=True, **params)
+
+    assert roi.shape == full.shape and roi.dtype == full.dtype
+    diff = int(np.abs(roi.astype(np.int16) - full).max())
+    assert diff <= (TOLERANCE_LIGHT_WRAP if light_wrap else 0)
+
+
+def test_roi_matches_full_frame_with_local_blur(images):
+    QRectF = pytest.importorskip("PyQt6.QtCore").QRectF
+    fg, bg = images
+    mask = MASKS["center"]()
+    params = dict(roi_rects=[QRectF(10, 10, 80, 60), QRectF(50, 40, 100, 90)], display_size=(320, 240))
+
+    full = ImageProcessor.composite_images(fg, mask, bg, use_roi=False, **params)
+    roi = ImageProcessor.composite_images(fg, mask, bg, use_roi=True, **params)
+    assert np.array_equal(roi, full)
+
+
+# 局部虚化：相距较远的矩形分组各自模糊，结果应与逐个调用一致；缩小后模糊与全分辨率截断核的误差
+def test_roi_blur_groups_are_independent(images):
+    QRectF = pytest.importorskip("PyQt6.QtCore").QRectF
+    fg, _ = images
+    rects = [QRectF(5, 5, 40, 30), QRectF(250, 190, 60, 40), QRectF(270, 200, 40, 30)]
+
+    together = ImageProcessor.apply_roi_blur(fg.copy(), rects, (320, 240))
+    separate = ImageProcessor.apply_roi_blur(fg.copy(), rects[:1], (320, 240))
+    separate = ImageProcessor.apply_roi_blur(separate, rects[1:], (320, 240))
+    assert len(ImageProcessor._roi_groups([(10, 10, 90, 70), (500, 380, 620, 460), (540, 400, 620, 460)],
+                                          34, 640, 480)) == 2
+    assert np.array_equal(together, separate)
+
+
+@pytest.mark.parametrize("ksize,sigma", [(25, 10), (27, 10), (51, 20), (101, 40)])
+def test_roi_blur_region_close_to_full_resolution(ksize, sigma):
+    rng = np.random.default_rng(ksize)
+    region = _smooth_image(rng, 401, 593)  # 奇数尺寸，缩小一半时不能整除
+    cv2.rectangle(region, (150, 100), (400, 300), (255, 255, 255), -1)
+
+    exact = cv2.GaussianBlur(region, (ksize, ksize), sigma)
+    fast = ImageProcessor._roi_blur_region(region, ksize, sigma)
+    diff = np.abs(fast.astype(np.int16) - exact)
+    assert diff.mean() < 0.5 and diff.max() <= 6
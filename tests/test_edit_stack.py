@@ -0,0 +1,193 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PyQt6.QtWidgets")
+
+from PyQt6.QtGui import QColor
+
+from src.gui.editor.doodle_overlay import DoodleStroke
+from src.gui.editor.edit_stack import DoodleOp, EditStack, FrameOp, MaskRLE, MosaicOp
+from src.gui.editor.processor import ImageEditorEngine
+
+
+@pytest.fixture(scope="module", autouse=True)
+def qapp():
+    # QPainter 绘制图层需要 QApplication
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def _smooth_image(rng, h, w):
+    small = rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def _engine(img, geo=None):
+    engine = ImageEditorEngine()
+    engine.set_image(img)
+    engine.set_preview_size(max(img.shape[:2]))  # 代理图即原图
+    engine.geo_params.update(geo or {})
+    return engine
+
+
+def _overlay_size(engine):
+    """覆盖层取当前渲染结果的尺寸 (与编辑器里覆盖层贴合图片显示区域一致)"""
+    h, w = engine.render(use_preview=True).shape[:2]
+    return w, h
+
+
+def _mosaic(engine, rng, style):
+    w, h = _overlay_size(engine)
+    mask = np.zeros((h, w), np.uint8)
+    x, y = int(rng.integers(0, w - 40)), int(rng.integers(0, h - 30))
+    cv2.ellipse(mask, (x + 20, y + 15), (20, 15), 0, 0, 360, 255, -1)
+    return MosaicOp(mask, style, engine.overlay_transform((w, h)))
+
+
+def _doodle(engine, rng):
+    w, h = _overlay_size(engine)
+    points = rng.uniform((0, 0), (w, h), (5, 2))
+    stroke = DoodleStroke("curve", points, 4, QColor(int(rng.integers(0, 256)), 200, 40))
+    return DoodleOp([stroke], engine.overlay_transform((w, h)))
+
+
+# 几何变换 (旋转 / 翻转 / 裁剪) 与图层操作交替进行，每次提交的操作都按当时的几何变换记录坐标
+SCRIPT = [
+    ("mosaic", "pixel"),
+    ("geo", {"rotate_90": 1}),
+    ("doodle", None),
+    ("mosaic", "blur"),
+    ("geo", {"crop_rect": (0.1, 0.15, 0.7, 0.6)}),
+    ("doodle", None),
+    ("mosaic", "pixel"),
+    ("geo", {"flip_h": True, "rotate_angle": 12}),
+    ("mosaic", "blur"),
+    ("frame", "polaroid"),
+    ("doodle", None),
+    ("geo", {"rotate_90": 2, "crop_rect": None}),
+    ("mosaic", "pixel"),
+    ("doodle", None),
+]
+
+
+@pytest.fixture(scope="module")
+def session():
+    rng = np.random.default_rng(0)
+    img = _smooth_image(rng, 240, 320)
+    engine = _engine(img)
+    for kind, arg in SCRIPT:
+        if kind == "geo":
+            engine.geo_params.update(arg)
+        elif kind == "mosaic":
+            engine.edits.push(_mosaic(engine, rng, arg))
+        elif kind == "doodle":
+            engine.edits.push(_doodle(engine, rng))
+        else:
+            engine.edits.push(FrameOp(arg))
+    return img, engine
+
+
+def _fresh_render(img, engine):
+    """新引擎 (没有阶段缓存和快照) 按相同参数和操作从头重放"""
+    fresh = _engine(img, engine.geo_params)
+    for op in engine.edits.ops:
+        fresh.edits.push(op)
+    return fresh.render(use_preview=True)
+
+
+# 撤销 / 重做与新操作任意交替：每一步的代理图渲染 (走快照和上次结果) 都应与从头重放逐像素一致
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_undo_redo_matches_fresh_replay(session, seed):
+    img, engine = session
+    rng = np.random.default_rng(seed)
+    e = engine.snapshot()
+    e.edits = engine.edits.copy()
+    assert len(e.edits.ops) == sum(kind in ("mosaic", "doodle", "frame") for kind, _ in SCRIPT)
+
+    for _ in range(25):
+        action = rng.choice(["undo", "undo", "redo", "redo", "push"])
+        if action == "undo":
+            e.edits.undo()
+        elif action == "redo":
+            e.edits.redo()
+        else:
+            e.edits.push(_mosaic(e, rng, "pixel") if rng.random() < 0.5 else _doodle(e, rng))
+        assert np.array_equal(e.render(use_preview=True), _fresh_render(img, e))
+
+
+def test_undo_all_and_redo_all_round_trip(session):
+    img, engine = session
+    e = engine.snapshot()
+    e.edits = engine.edits.copy()
+    full = e.render(use_preview=True)
+    states = [full]
+    while e.edits.undo():
+        states.append(e.render(use_preview=True))
+    # 全部撤销后只剩调节和几何变换
+    assert np.array_equal(states[-1], _fresh_render(img, e))
+    for expected in reversed(states[:-1]):
+        assert e.edits.redo()
+        assert np.array_equal(e.render(use_preview=True), expected)
+    assert not e.edits.can_redo
+
+
+# 游程编码只解码部分行：与整张解码后切片一致 (游程跨行、整行同值、全 0 / 全 255、单行 / 单列)
+def _random_mask(rng, h, w, kind):
+    if kind == "blobs":
+        mask = np.zeros((h, w), np.uint8)
+        for _ in range(4):
+            cv2.circle(mask, tuple(int(v) for v in rng.integers(0, (w, h))), int(rng.integers(1, 12)), 255, -1)
+        return mask
+    if kind == "noise":
+        return rng.integers(0, 3, (h, w), dtype=np.uint8) * 127
+    return np.full((h, w), 0 if kind == "zeros" else 255, np.uint8)
+
+
+@pytest.mark.parametrize("kind", ["blobs", "noise", "zeros", "ones"])
+@pytest.mark.parametrize("shape", [(37, 53), (1, 40), (40, 1), (64, 64)])
+def test_mask_rle_partial_decode(kind, shape):
+    rng = np.random.default_rng(shape[0] * 100 + shape[1])
+    mask = _random_mask(rng, *shape, kind)
+    rle = MaskRLE.encode(mask)
+    assert np.array_equal(rle.decode(), mask)
+    h = shape[0]
+    ranges = [(0, h), (0, 1), (h - 1, h)] + [tuple(sorted(rng.integers(0, h + 1, 2))) for _ in range(20)]
+    for row0, row1 in ranges:
+        if row1 <= row0: continue
+        assert np.array_equal(rle.decode(row0, row1), mask[row0:row1])
+
+
+# 原地重放：只复制一次起点图像后各操作原地写入，结果与每个操作都作用在新副本上的逐个重放一致，且不修改底图
+def test_in_place_replay_matches_copy_replay(session):
+    img, engine = session
+    e = engine.snapshot()
+    e.edits = engine.edits.copy()
+    extra = _doodle(e, np.random.default_rng(7))  # 之后提交的新操作 (先生成，生成时会渲染)
+    e.edits._snapshots = EditStack()._snapshots   # 独立的快照缓存，从底图开始完整重放
+    assert e.geo_params["crop_rect"] is None
+    base = e.render(use_preview=True, include_crop=False)
+    view, size = e.source_view((img.shape[1], img.shape[0]))
+    before = base.copy()
+
+    expected, v = base, view
+    for op in e.edits.ops:
+        expected = op.apply(expected.copy(), e, v)
+        if isinstance(op, FrameOp):
+            v, size = op.extend(v, size, e)
+
+    for keep_snapshots in (False, True, True):
+        out = e.edits.apply(base, e, view, keep_snapshots=keep_snapshots)
+        assert np.array_equal(out, expected)
+        assert np.array_equal(base, before)
+
+    # 提交一个新操作后只在上次的完整结果上重放这一个，同样不修改上次的结果
+    tip = e.edits.apply(base, e, view, keep_snapshots=True)
+    tip_before = tip.copy()
+    e.edits.push(extra)
+    assert e.edits._snapshots.lookup(base, e.edits.ops)[0] == len(e.edits.ops) - 1
+    out = e.edits.apply(base, e, view, keep_snapshots=True)
+    assert np.array_equal(tip, tip_before)
+    assert np.array_equal(out, extra.apply(expected.copy(), e, v))
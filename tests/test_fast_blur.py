@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.fast_blur import EXACT_KSIZE_THRESHOLD, gaussian_blur
+
+# fast_blur 文档中的误差上限：切换点附近 (k=27~51) 平均绝对误差 < 0.5 个色阶
+MAE_TOLERANCE = 0.5
+
+
+@pytest.fixture(scope="module")
+def image():
+    """平滑的随机色块 + 硬边缘矩形 (近似照片内容)"""
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (600 // 16, 800 // 16, 3), dtype=np.uint8)
+    img = cv2.resize(small, (800, 600), interpolation=cv2.INTER_CUBIC)
+    cv2.rectangle(img, (200, 150), (400, 300), (255, 255, 255), -1)
+    return img
+
+
+@pytest.mark.parametrize("ksize", [EXACT_KSIZE_THRESHOLD])
+def test_small_kernels_are_exact(image, ksize):
+    assert np.array_equal(gaussian_blur(image, ksize), cv2.GaussianBlur(image, (ksize, ksize), 0))
+
+
+@pytest.mark.parametrize("ksize", [EXACT_KSIZE_THRESHOLD + 2, 31, 51])
+def test_pyramid_mae_within_tolerance(image, ksize):
+    approx = gaussian_blur(image, ksize)
+    exact = cv2.GaussianBlur(image, (ksize, ksize), 0)
+    assert approx.shape == exact.shape and approx.dtype == exact.dtype
+    assert np.abs(approx.astype(np.int16) - exact).mean() < MAE_TOLERANCE
+
+
+def test_exact_method_forces_opencv(image):
+    assert np.array_equal(gaussian_blur(image, 0, 5, method="exact"), cv2.GaussianBlur(image, (0, 0), 5))
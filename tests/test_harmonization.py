@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.harmonization import apply_transfer, build_transfer_lut, lab_stats
+
+
+def _float_transfer(target_rgb, src_stats, tgt_stats):
+    """查找表之前的逐像素 float32 LAB 迁移 (统计量由调用方给出)"""
+    src_mean, src_std = src_stats
+    tgt_mean, tgt_std = tgt_stats
+    tgt_std = np.where(tgt_std == 0, 1e-5, tgt_std)
+    lab = cv2.cvtColor(target_rgb, cv2.COLOR_RGB2LAB).astype(np.float32)
+    res = lab.copy()
+    res[:, :, 0] = (lab[:, :, 0] - tgt_mean[0]) * (src_std[0] / tgt_std[0]) * 0.5 + src_mean[0] * 0.5 + tgt_mean[0] * 0.5
+    for i in range(1, 3):
+        res[:, :, i] = (lab[:, :, i] - tgt_mean[i]) * (src_std[i] / tgt_std[i]) + src_mean[i]
+    return cv2.cvtColor(np.clip(res, 0, 255).astype(np.uint8), cv2.COLOR_LAB2RGB)
+
+
+def _image(rng, h, w, lo=0, hi=256):
+    small = rng.integers(lo, hi, (h // 8, w // 8, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_lut_matches_float_transfer(seed):
+    rng = np.random.default_rng(seed)
+    fg = _image(rng, 240, 320)
+    # 背景色调差异较大 (偏暗 / 偏亮)，迁移后会触及 0 和 255 的裁剪
+    bg = _image(rng, 200, 300, *((0, 90) if seed % 2 else (150, 256)))
+    # 前两行包含所有 256 个取值，覆盖整张查找表
+    fg[0, :256] = np.arange(256, dtype=np.uint8)[:, None]
+    src_stats, tgt_stats = lab_stats(bg, sample_size=None), lab_stats(fg, sample_size=None)
+
+    out = apply_transfer(fg, build_transfer_lut(src_stats, tgt_stats))
+    assert np.array_equal(out, _float_transfer(fg, src_stats, tgt_stats))
+
+
+def test_lut_handles_flat_target():
+    rng = np.random.default_rng(0)
+    fg = np.full((64, 64, 3), 128, np.uint8)   # 标准差为 0
+    bg = _image(rng, 64, 64)
+    src_stats, tgt_stats = lab_stats(bg, sample_size=None), lab_stats(fg, sample_size=None)
+    out = apply_transfer(fg, build_transfer_lut(src_stats, tgt_stats))
+    assert np.array_equal(out, _float_transfer(fg, src_stats, tgt_stats))
@@ -0,0 +1,49 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src.gui.editor.filters import POINT_FILTERS, _apply_filter_ops
+from src.gui.editor.processor import ImageEditorEngine
+
+TONE_SETTINGS = [(0, 0), (35, 0), (0, -40), (-60, 25), (80, 100), (-100, -100)]
+
+
+def _reference_tone(img, brightness, contrast):
+    """合并查找表之前的 float32 亮度 / 对比度实现"""
+    if brightness == 0 and contrast == 0:
+        return img
+    img = img.astype(np.float32)
+    if brightness != 0:
+        img += brightness
+    if contrast != 0:
+        f = 1.0 + contrast / 100.0
+        img = (img - 127.5) * f + 127.5
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (96, 128, 3), dtype=np.uint8)
+    # 前两行包含每个通道的全部 256 个取值
+    img[0, :, :] = np.arange(128, dtype=np.uint8)[:, None]
+    img[1, :, :] = np.arange(128, 256, dtype=np.uint8)[:, None]
+    return img
+
+
+@pytest.mark.parametrize("filter_name,tone", list(itertools.product(sorted(POINT_FILTERS) + ["original"], TONE_SETTINGS)))
+def test_fused_lut_matches_float_pipeline(image, filter_name, tone):
+    brightness, contrast = tone
+    expected = _reference_tone(image, brightness, contrast)
+    if filter_name != "original":
+        expected = _apply_filter_ops(expected, filter_name)
+
+    engine = ImageEditorEngine()
+    engine.set_image(image)
+    engine.update_param("brightness", brightness)
+    engine.update_param("contrast", contrast)
+    engine.update_filter(filter_name)
+    result = engine.render(use_preview=False)
+
+    assert np.array_equal(result, expected)
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.rgba_export import PngStripWriter
+from src.utils.strip_composite import StripCompositor
+
+
+def _smooth_image(rng, h, w):
+    small = rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def _read(path):
+    return cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)[:, :, ::-1]
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    rng = np.random.default_rng(0)
+    fg = _smooth_image(rng, 300, 401)
+    bg = _smooth_image(rng, 480, 640)
+    mask = np.zeros((300, 401), np.uint8)
+    cv2.ellipse(mask, (200, 160), (80, 120), 0, 0, 360, 255, -1)
+    return fg, mask, bg
+
+
+# PNG 逐条写入：条带高度不整除图像高度、含噪声 (Up 滤波按 256 取模)，解码后逐像素一致
+@pytest.mark.parametrize("strip", [1, 7, 64])
+def test_png_strip_writer_round_trip(tmp_path, strip):
+    img = np.random.default_rng(strip).integers(0, 256, (53, 37, 3), dtype=np.uint8)
+    path = str(tmp_path / "条带.png")
+    with PngStripWriter(path, 37, 53) as writer:
+        for y in range(0, 53, strip):
+            writer.write(img[y:y + strip])
+    assert np.array_equal(_read(path), img)
+
+
+def test_png_strip_writer_rejects_missing_rows(tmp_path):
+    with pytest.raises(ValueError):
+        with PngStripWriter(str(tmp_path / "short.png"), 8, 8) as writer:
+            writer.write(np.zeros((4, 8, 3), np.uint8))
+
+
+# 写盘结果与内存中的条带合成一致 (PNG / WebP 无损逐像素一致，JPEG 只检查平均误差)，且不留临时文件
+@pytest.mark.parametrize("ext,tolerance", [(".png", 0), (".webp", 0), (".npy", 0), (".jpg", 2.0)])
+def test_render_to_file_matches_memory(tmp_path, inputs, ext, tolerance):
+    fg, mask, bg = inputs
+    params = dict(use_harmonize=True, use_light_wrap=True, blend_mode="pyramid")
+    compositor = StripCompositor(fg, mask, strip_height=64)
+    ref = compositor.render(bg, **params)
+
+    path = str(tmp_path / f"合成{ext}")
+    compositor.render(bg, path, **params)
+    out = np.load(path) if ext == ".npy" else _read(path)
+    assert out.shape == ref.shape
+    assert np.abs(out.astype(np.int16) - ref).mean() <= tolerance
+    assert [p.name for p in tmp_path.iterdir()] == [f"合成{ext}"]
@@ -0,0 +1,99 @@
+import itertools
+
+import cv2
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.utils.composite_session import CompositeSession
+from src.utils.harmonization import DEFAULT_SAMPLE_SIZE
+from src.utils.image_processor import ImageProcessor
+from src.utils.torch_compositor import DeviceCompositeSession, TorchCompositor
+
+# torch 与 OpenCV 路径的容差 (色阶)：浮点舍入、金字塔边界处理带来的差异整体很小，
+# 但色彩融合的 LAB 转换 (OpenCV 8 位定点实现) 在少数像素上偏差较大
+MEAN_TOLERANCE = 0.25
+MAX_TOLERANCE = 2                 # 不做色彩融合时的逐像素上限
+HARMONIZE_MAX_TOLERANCE = 16      # 色彩融合时的逐像素上限
+HARMONIZE_OUTLIER_RATIO = 0.001   # 色彩融合时误差超过 MAX_TOLERANCE 的像素比例上限
+ROI_BLUR_MEAN_TOLERANCE = 0.5     # 局部虚化：OpenCV 路径的羽化蒙版和大核模糊都是低分辨率近似
+
+
+def _smooth_image(rng, h, w):
+    small = rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+@pytest.fixture(scope="module")
+def images():
+    rng = np.random.default_rng(0)
+    fg = _smooth_image(rng, 480, 640)
+    bg = _smooth_image(rng, 600, 800)
+    mask = np.zeros((480, 640), np.uint8)
+    cv2.ellipse(mask, (330, 250), (90, 140), 0, 0, 360, 255, -1)
+    return fg, cv2.GaussianBlur(mask, (0, 0), 3), bg
+
+
+@pytest.fixture(scope="module")
+def compositor():
+    return TorchCompositor("cpu")
+
+
+def _assert_close(out, ref, harmonize):
+    assert out.shape == ref.shape and out.dtype == ref.dtype
+    diff = np.abs(out.astype(np.int16) - ref)
+    assert diff.mean() < MEAN_TOLERANCE
+    if harmonize:
+        assert diff.max() <= HARMONIZE_MAX_TOLERANCE
+        assert (diff > MAX_TOLERANCE).mean() < HARMONIZE_OUTLIER_RATIO
+    else:
+        assert diff.max() <= MAX_TOLERANCE
+
+
+CASES = list(itertools.product(("linear", "pyramid"), (None, "global", "mask"), (False, True), (0, 15)))
+
+
+@pytest.mark.parametrize("blend_mode,harmonize_mode,light_wrap,brightness", CASES)
+def test_matches_composite_images(images, compositor, blend_mode, harmonize_mode, light_wrap, brightness):
+    fg, mask, bg = images
+    params = dict(use_harmonize=harmonize_mode is not None, harmonize_mode=harmonize_mode or "global",
+                  use_light_wrap=light_wrap, blend_mode=blend_mode, brightness=brightness)
+
+    # torch 版本的 global 色彩融合按默认抽样统计
+    ref = ImageProcessor.composite_images(fg, mask, bg, sample_size=DEFAULT_SAMPLE_SIZE, **params)
+    out = compositor.composite(fg, mask, bg, **params)
+    assert out.device.type == "cpu"
+    _assert_close(out.numpy(), ref, harmonize_mode is not None)
+
+
+def test_matches_composite_images_with_local_blur(images, compositor):
+    QRectF = pytest.importorskip("PyQt6.QtCore").QRectF
+    fg, mask, bg = images
+    params = dict(roi_rects=[QRectF(10, 10, 80, 60), QRectF(200, 150, 60, 50)], display_size=(320, 240))
+
+    ref = ImageProcessor.composite_images(fg, mask, bg, **params)
+    out = compositor.composite(fg, mask, bg, **params).numpy()
+    # 羽化蒙版 (1/4 分辨率) 和 51 核模糊 (1/2 分辨率) 在 OpenCV 路径上是近似，只比较平均误差
+    assert np.abs(out.astype(np.int16) - ref).mean() < ROI_BLUR_MEAN_TOLERANCE
+
+
+@pytest.mark.parametrize("light_wrap", [False, True])
+def test_device_session_preview_and_full(images, light_wrap):
+    fg, mask, bg = images
+    params = dict(use_light_wrap=light_wrap, brightness=10)
+
+    session = CompositeSession()
+    device = DeviceCompositeSession("cpu")
+    for s in (session, device):
+        s.set_foreground(fg)
+        s.set_mask(mask)
+        s.set_background(bg)
+
+    # 预览在显示尺寸下合成 (模糊核按比例缩小)，与 CPU 会话的预览子会话对应
+    ref = session.composite_preview((320, 320), **params)
+    out = device.composite_preview((320, 320), **params)
+    assert out.shape == ref.shape == (240, 320, 3)
+    _assert_close(out, ref, False)
+
+    _assert_close(device.render_full(), session.render_full(), False)